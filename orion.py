@@ -0,0 +1,67 @@
+import numpy as np
+import argparse
+import json
+import os
+import sys
+
+# Permitir importar el paquete 'chimera' (src/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from chimera.pipeline import run_pipeline, ENGINES
+from chimera.analysis.merger_counter import MERGER_RADIUS_PC
+
+# --- PIPELINE COMPLETO EN UN SOLO PROCESO ---
+# Condiciones iniciales -> motor -> análisis de fusiones, con los arreglos en
+# memoria. Sin --out no toca el disco. Varias semillas se corren en serie en
+# el mismo proceso (Taichi se inicializa una sola vez):
+#   python3 orion.py --n 500 --seed 1 2 3 --arch cpu
+#   python3 orion.py --n 2000 --engine barnes_hut --steps 500 --out data/processed/orion_run
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline Orión en un solo proceso - Proyecto Chimera")
+    parser.add_argument("--n", type=int, default=100, help="Número de galaxias")
+    parser.add_argument("--box", type=float, default=5.0, help="Tamaño de la caja en Mpc")
+    parser.add_argument("--seed", type=int, nargs="+", default=[42], help="Semilla(s) aleatoria(s)")
+    parser.add_argument("--engine", choices=list(ENGINES), default="taichi", help="Motor de física")
+    parser.add_argument("--arch", choices=["gpu", "cpu", "cuda", "vulkan"], default=None,
+                        help="Backend de Taichi (por defecto, el del motor)")
+    parser.add_argument("--steps", type=int, default=None, help="Número de pasos (por defecto, el del motor)")
+    parser.add_argument("--dt", type=float, default=None, help="Paso de tiempo en millones de años")
+    parser.add_argument("--softening", type=float, default=None, help="Suavizado en parsecs")
+    parser.add_argument("--radius", type=float, default=MERGER_RADIUS_PC, help="Radio de fusión del análisis (pc)")
+    parser.add_argument("--periodic", action="store_true", help="Análisis con caja periódica")
+    parser.add_argument("--integrator", choices=["euler", "kdk"], default=None, help="Integrador (Taichi)")
+    parser.add_argument("--precision", choices=["f32", "f64", "mixed"], default=None, help="Precisión (Taichi)")
+    parser.add_argument("--merge-radius", type=float, default=None, help="Fusiones en el motor (Taichi, Barnes-Hut)")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Directorio para guardar los resultados (una subcarpeta por semilla); sin él, nada va a disco")
+    parser.add_argument("--traj-encoding", choices=["raw", "quantized"], default=None,
+                        help="Codificación de la trayectoria guardada con --out (quantized = comprimida)")
+    parser.add_argument("--quiet", action="store_true", help="Sin el progreso de cada etapa")
+    args = parser.parse_args()
+
+    options = {name: value for name, value in [("integrator", args.integrator), ("precision", args.precision),
+                                               ("merge_radius", args.merge_radius)] if value is not None}
+    print(f"--- 🚀 PIPELINE ORIÓN: {args.engine}, {args.n} galaxias, {len(args.seed)} semilla(s) ---")
+    summary = []
+    for seed in args.seed:
+        out_dir = os.path.join(args.out, f"seed_{seed}") if args.out else None
+        result = run_pipeline(args.n, args.box, seed, engine=args.engine, arch=args.arch, steps=args.steps,
+                              dt=args.dt, softening=args.softening, radius=args.radius, periodic=args.periodic,
+                              out_dir=out_dir, engine_options=options, quiet=args.quiet,
+                              traj_encoding=args.traj_encoding)
+        monster = result["monster"]
+        seconds = result["seconds"]
+        row = {"seed": seed, "n_objects": int(len(result["catalog"])), "n_mergers": int(len(result["mergers"])),
+               "monster_members": int(monster["n_members"]) if monster is not None else 0,
+               "monster_mass": float(monster["mass"]) if monster is not None else 0.0, "seconds": seconds}
+        summary.append(row)
+        print(f"\n📊 Semilla {seed}: {row['n_objects']} objetos, {row['n_mergers']} fusiones, "
+              f"monstruo de {row['monster_members']} miembros ({row['monster_mass']:.2e} Msun) | "
+              f"IC {seconds['ic']:.2f}s, motor {seconds['engine']:.2f}s, análisis {seconds['analysis']:.2f}s")
+
+    if args.out:
+        with open(os.path.join(args.out, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"--> Resultados guardados en {args.out}")
+    total = np.sum([sum(row["seconds"].values()) for row in summary])
+    print(f"✅ Pipeline completo en {total:.2f} segundos.")
@@ -0,0 +1,72 @@
+import torch
+
+# --- FUERZAS PAR A PAR (N-CUERPOS) ---
+# Camino único para calcular aceleraciones gravitatorias en PyTorch.
+# La versión densa arma matrices N x N completas (rápida pero O(N^2) en memoria).
+# La versión por bloques recorre tiles de (TILE_I x TILE_J) y acumula en un
+# arreglo (N, 3), así la memoria pico es O(TILE_I * TILE_J) y no O(N^2).
+
+TILE_I = 1024   # Filas (cuerpos que reciben fuerza) por bloque
+TILE_J = 4096   # Columnas (cuerpos que ejercen fuerza) por bloque
+
+def get_acc_dense(pos, mass, G, softening):
+    # Truco de álgebra lineal para calcular todas las distancias a la vez (Matriz N x N)
+    x = pos[:, 0:1]
+    y = pos[:, 1:2]
+    z = pos[:, 2:3]
+
+    # r_ij = pos_j - pos_i
+    dx = x.T - x
+    dy = y.T - y
+    dz = z.T - z
+
+    # Distancia inversa al cubo (1/r^3) con softening
+    inv_r3 = (dx**2 + dy**2 + dz**2 + softening**2)
+    inv_r3.sqrt_()
+    inv_r3.pow_(-3)
+
+    # F = G * m * r / r^3
+    ax = G * (dx * inv_r3) @ mass
+    ay = G * (dy * inv_r3) @ mass
+    az = G * (dz * inv_r3) @ mass
+
+    return torch.cat((ax, ay, az), dim=1)
+
+def get_acc_tiled(pos, mass, G, softening, tile_i=TILE_I, tile_j=TILE_J):
+    # Misma física que get_acc_dense, pero bloque por bloque.
+    # pos: (N, 3), mass: (N, 1). Funciona igual en CPU y en CUDA.
+    n = pos.shape[0]
+    acc = torch.zeros_like(pos)
+    soft2 = softening**2
+
+    for i0 in range(0, n, tile_i):
+        i1 = min(i0 + tile_i, n)
+        xi = pos[i0:i1, 0:1]
+        yi = pos[i0:i1, 1:2]
+        zi = pos[i0:i1, 2:3]
+
+        for j0 in range(0, n, tile_j):
+            j1 = min(j0 + tile_j, n)
+            pj = pos[j0:j1]
+
+            # Bloque (ti, tj) de diferencias r_ij = pos_j - pos_i
+            dx = pj[:, 0:1].T - xi
+            dy = pj[:, 1:2].T - yi
+            dz = pj[:, 2:3].T - zi
+
+            inv_r3 = dx**2 + dy**2 + dz**2 + soft2
+            inv_r3.sqrt_()
+            inv_r3.pow_(-3)
+
+            m_j = mass[j0:j1]
+            acc[i0:i1, 0:1] += G * (dx * inv_r3) @ m_j
+            acc[i0:i1, 1:2] += G * (dy * inv_r3) @ m_j
+            acc[i0:i1, 2:3] += G * (dz * inv_r3) @ m_j
+
+    return acc
+
+def get_acc(pos, mass, G, softening, tile_i=TILE_I, tile_j=TILE_J):
+    # Si todo cabe en un solo bloque, la versión densa es equivalente y más directa
+    if pos.shape[0] <= tile_i and pos.shape[0] <= tile_j:
+        return get_acc_dense(pos, mass, G, softening)
+    return get_acc_tiled(pos, mass, G, softening, tile_i, tile_j)
@@ -1,7 +1,13 @@
 import torch
 import matplotlib.pyplot as plt
+import os
+import sys
 import time
 
+# Permitir importar el paquete 'chimera' (src/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from chimera.render.density_image import render_density, axes_shape
+
 # --- PARÁMETROS DEL MOTOR DE FÍSICA (Ajustados para estabilidad) ---
 N_BODIES = 10000 
 G = 1.0           
@@ -54,19 +60,21 @@ print(f"✅ Simulación completada en {end - start:.4f}s")
 # --- RENDERIZADO ---
 positions_cpu = positions.cpu().numpy()
 
-plt.figure(figsize=(10, 10), facecolor='black')
+plt.figure(figsize=(10, 10), dpi=150, facecolor='black') # dpi de salida: la imagen se arma a esa resolución
 ax = plt.gca()
 ax.set_facecolor('black')
 
-# Puntos más pequeños y transparentes para ver la densidad del gas/polvo
-plt.scatter(positions_cpu[:, 0], positions_cpu[:, 1], s=0.2, c='cyan', alpha=0.5)
-plt.scatter([0], [0], s=50, c='white', marker='*') # La estrella central
-
 plt.title(f"Nebulosa de Orión: {N_BODIES} Enanas Marrones (Estable)", color='white')
 plt.xlim(-12, 12) # Zoom out para ver todo el disco
 plt.ylim(-12, 12)
 plt.axis('off')
 
+# Densidad proyectada del gas/polvo: una imagen a la resolución de salida (no un marcador por cuerpo)
+extent = (-12, 12, -12, 12)
+image = render_density(positions_cpu, extent, axes_shape(ax), tone="asinh", cmap=['black', 'darkcyan', 'cyan', 'white'])
+plt.imshow(image, extent=extent, interpolation='nearest')
+plt.scatter([0], [0], s=50, c='white', marker='*') # La estrella central
+
 output_file = "orion_v2.png"
 plt.savefig(output_file, dpi=150, bbox_inches='tight')
 print(f"📸 Imagen generada: {output_file}")
\ No newline at end of file
@@ -1,10 +1,16 @@
 import torch
-import matplotlib
-matplotlib.use('Agg') # Backend sin cabeza (vital para servidores sin monitor)
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+import numpy as np
+import argparse
+import os
+import sys
 import time
 
+# Permitir importar el paquete 'chimera' (src/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from chimera.storage.trajectory_store import TrajectoryWriter, open_trajectory
+from chimera.render.video_renderer import render_video, N_WORKERS
+from chimera.render.density_image import render_density, density_vmax, axes_shape
+
 # --- CONFIGURACIÓN DE TIEMPO Y FÍSICA ---
 FPS = 30
 DURATION_SEC = 30
@@ -13,72 +19,88 @@ DT = 0.005        # Paso de tiempo de física
 STEPS_PER_FRAME = 3 # Cuantos pasos de física calculamos por cada cuadro de video (para acelerar el movimiento)
 
 # --- CONFIGURACIÓN DEL CÚMULO ---
-N_BODIES = 10000 
-G = 1.0           
-CENTER_MASS = 100.0 
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🌌 Renderizando Animación: {TOTAL_FRAMES} cuadros ({DURATION_SEC}s) en {device}")
-
-# --- INICIALIZACIÓN (Disco de Acreción) ---
-r = torch.rand(N_BODIES, device=device) * 6.0 + 2.0
-theta = torch.rand(N_BODIES, device=device) * 2 * 3.14159
-positions = torch.stack((r * torch.cos(theta), r * torch.sin(theta)), dim=1)
-
-# Velocidad Orbital
-v_mag = (G * CENTER_MASS / r).sqrt()
-velocities = torch.stack((-v_mag * torch.sin(theta), v_mag * torch.cos(theta)), dim=1)
-velocities += torch.randn(N_BODIES, 2, device=device) * 0.1 # Caos
-
-# --- PREPARAR LA CÁMARA ---
-fig, ax = plt.subplots(figsize=(10, 10), facecolor='black')
-ax.set_facecolor('black')
-ax.set_xlim(-12, 12)
-ax.set_ylim(-12, 12)
-ax.axis('off')
-
-# Objetos gráficos iniciales
-scatter_dots = ax.scatter([], [], s=0.2, c='cyan', alpha=0.5)
-star = ax.scatter([0], [0], s=50, c='white', marker='*')
-title_text = ax.text(0, 11, "Inicializando...", color='white', ha='center')
-
-# --- FUNCIÓN DE ACTUALIZACIÓN (Lo que pasa en cada frame) ---
-def update(frame):
-    global positions, velocities
-    
-    # Avanzamos la física varios pasos para que el video no sea en cámara lenta
-    for _ in range(STEPS_PER_FRAME):
-        dist_sq = positions.pow(2).sum(1, keepdim=True) 
-        dist = dist_sq.sqrt()
-        force_mag = (G * CENTER_MASS) / (dist_sq + 0.5) 
-        acceleration = -positions * (force_mag / dist)
-        velocities += acceleration * DT
-        positions += velocities * DT
-    
-    # Actualizar gráfico
-    positions_cpu = positions.cpu().numpy()
-    scatter_dots.set_offsets(positions_cpu)
-    
-    # Telemetría en el video
-    progress = (frame / TOTAL_FRAMES) * 100
-    title_text.set_text(f"Orión-Alaska | Frame: {frame}/{TOTAL_FRAMES} | Progreso: {progress:.1f}%")
-    
-    # Log en terminal cada 50 frames
-    if frame % 50 == 0:
-        print(f"🎥 Renderizando frame {frame}/{TOTAL_FRAMES}...")
-        
-    return scatter_dots, title_text
-
-# --- RENDERIZADO FINAL ---
-print("🚀 Iniciando compilación de video MP4...")
-start_time = time.time()
-
-ani = animation.FuncAnimation(fig, update, frames=TOTAL_FRAMES, blit=True)
-
-# Configuración del encoder (usamos h264 para máxima compatibilidad)
-writer = animation.FFMpegWriter(fps=FPS, metadata=dict(artist='Rubin1'), bitrate=5000)
-ani.save("orion_simulacion_30s.mp4", writer=writer)
-
-end_time = time.time()
-print(f"✅ ¡Video completado! Guardado como 'orion_simulacion_30s.mp4'")
-print(f"⏱️ Tiempo de renderizado: {end_time - start_time:.2f} segundos")
\ No newline at end of file
+N_BODIES = 10000
+G = 1.0
+CENTER_MASS = 100.0
+SEED = 42         # Misma semilla -> mismo video, cuadro por cuadro
+
+# --- SALIDA ---
+TRAJ_FILE = "data/processed/trajectory_orion_video.traj" # Posiciones de cada cuadro (la física va primero)
+OUTPUT_FILE = "orion_simulacion_30s.mp4"
+VIDEO_SIZE = 1000  # Pixeles por lado (10 x 10 pulgadas a 100 dpi)
+EXTENT = (-12, 12, -12, 12)
+DISK_CMAP = ['black', 'darkcyan', 'cyan', 'white'] # El cian de siempre, saturando a blanco en lo más denso
+
+def simulate(traj_path=TRAJ_FILE):
+    """Integra el disco y guarda un cuadro por frame de video (z = 0)."""
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"🌌 Simulando {TOTAL_FRAMES} cuadros ({DURATION_SEC}s) en {device}")
+    torch.manual_seed(SEED)
+
+    # --- INICIALIZACIÓN (Disco de Acreción) ---
+    r = torch.rand(N_BODIES, device=device) * 6.0 + 2.0
+    theta = torch.rand(N_BODIES, device=device) * 2 * 3.14159
+    positions = torch.stack((r * torch.cos(theta), r * torch.sin(theta)), dim=1)
+
+    # Velocidad Orbital
+    v_mag = (G * CENTER_MASS / r).sqrt()
+    velocities = torch.stack((-v_mag * torch.sin(theta), v_mag * torch.cos(theta)), dim=1)
+    velocities += torch.randn(N_BODIES, 2, device=device) * 0.1 # Caos
+
+    frame = np.zeros((N_BODIES, 3), dtype=np.float32)
+    with TrajectoryWriter(traj_path, N_BODIES, np.float32, engine="orion_video", metadata={"dt": DT}) as writer:
+        for i in range(TOTAL_FRAMES):
+            # Avanzamos la física varios pasos para que el video no sea en cámara lenta
+            for _ in range(STEPS_PER_FRAME):
+                dist_sq = positions.pow(2).sum(1, keepdim=True)
+                dist = dist_sq.sqrt()
+                force_mag = (G * CENTER_MASS) / (dist_sq + 0.5)
+                acceleration = -positions * (force_mag / dist)
+                velocities += acceleration * DT
+                positions += velocities * DT
+
+            frame[:, :2] = positions.cpu().numpy()
+            writer.append(frame, t=(i + 1) * STEPS_PER_FRAME * DT)
+
+# --- PREPARAR LA CÁMARA (corre en cada proceso de render) ---
+def disk_scene(fig, traj_path):
+    traj = open_trajectory(traj_path)
+    fig.patch.set_facecolor('black')
+    ax = fig.add_subplot(111)
+    ax.set_facecolor('black')
+    ax.set_xlim(-12, 12)
+    ax.set_ylim(-12, 12)
+    ax.axis('off')
+
+    # Imagen de densidad (un píxel de imagen por píxel de pantalla) en vez de 10^4 marcadores
+    shape = axes_shape(ax)
+    vmax = density_vmax(traj[0], EXTENT, shape) # Escala fija para todo el video: sin parpadeo
+    disk = ax.imshow(np.zeros(shape + (3,), dtype=np.uint8), extent=EXTENT, interpolation='nearest')
+    star = ax.scatter([0], [0], s=50, c='white', marker='*')
+    title_text = ax.text(0, 11, "Inicializando...", color='white', ha='center')
+
+    # --- FUNCIÓN DE ACTUALIZACIÓN (Lo que pasa en cada frame) ---
+    def draw(frame):
+        disk.set_data(render_density(traj[frame], EXTENT, shape, tone="asinh", vmax=vmax, cmap=DISK_CMAP))
+
+        # Telemetría en el video
+        progress = (frame / TOTAL_FRAMES) * 100
+        title_text.set_text(f"Orión-Alaska | Frame: {frame}/{TOTAL_FRAMES} | Progreso: {progress:.1f}%")
+
+    return draw
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=N_WORKERS, help="Procesos de render")
+    parser.add_argument("--render-only", action="store_true", help="Reusar la trayectoria ya simulada (p. ej. para reanudar)")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if not args.render_only:
+        simulate()
+        print(f"✅ Física lista en {time.time() - start_time:.2f} segundos")
+
+    # --- RENDERIZADO FINAL (en paralelo, RGB crudo directo a ffmpeg) ---
+    print("🚀 Iniciando compilación de video MP4...")
+    render_video(disk_scene, {"traj_path": TRAJ_FILE}, TOTAL_FRAMES, OUTPUT_FILE, fps=FPS,
+                 width=VIDEO_SIZE, height=VIDEO_SIZE, n_workers=args.workers)
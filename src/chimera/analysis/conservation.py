@@ -0,0 +1,82 @@
+"""
+Proyecto Orión - Cantidades Conservadas
+Energía total (cinética + potencial de Plummer, el mismo suavizado que usan
+los motores), momento lineal y momento angular de un estado, en float64.
+La potencial es O(N^2) recorrida por bloques de filas para acotar la RAM.
+
+Unidades de los motores: pc, km/s y G en pc (km/s)^2 / Msun -> energía en
+Msun (km/s)^2.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+
+G_REAL = 4.30091e-3  # pc (km/s)^2 / Msun
+SOFTENING = 10.0     # Parsecs
+BLOCK = 1024         # Cuerpos por lado de cada bloque de pares (~25 MB de diferencias)
+
+def kinetic_energy(vel, masses):
+    vel = np.asarray(vel, dtype=np.float64)
+    return 0.5 * float(np.sum(np.asarray(masses, dtype=np.float64) * np.einsum("ij,ij->i", vel, vel)))
+
+def potential_energy(pos, masses, g=G_REAL, softening=SOFTENING, block=BLOCK):
+    """-G sum_{i<j} m_i m_j / sqrt(r_ij^2 + eps^2), por bloques (nunca la matriz N x N completa)."""
+    pos = np.asarray(pos, dtype=np.float64)
+    masses = np.asarray(masses, dtype=np.float64)
+    n = len(pos)
+    total = 0.0
+    for i0 in range(0, n, block):
+        i1 = min(i0 + block, n)
+        # Solo pares j > i: el bloque diagonal (triángulo superior) y los que vienen después
+        for j0 in range(i0, n, block):
+            j1 = min(j0 + block, n)
+            diff = pos[i0:i1, None, :] - pos[None, j0:j1, :]
+            inv_r = 1.0 / np.sqrt(np.einsum("ijk,ijk->ij", diff, diff) + softening**2)
+            if j0 == i0:
+                inv_r = np.triu(inv_r, k=1)
+            total -= float(masses[i0:i1] @ inv_r @ masses[j0:j1])
+    return g * total
+
+def linear_momentum(vel, masses):
+    return np.asarray(masses, dtype=np.float64) @ np.asarray(vel, dtype=np.float64)
+
+def angular_momentum(pos, vel, masses, origin=None):
+    """L = sum m (r - origen) x v. El origen por defecto es el centro de masa."""
+    pos = np.asarray(pos, dtype=np.float64)
+    masses = np.asarray(masses, dtype=np.float64)
+    origin = masses @ pos / masses.sum() if origin is None else np.asarray(origin, dtype=np.float64)
+    return masses @ np.cross(pos - origin, np.asarray(vel, dtype=np.float64))
+
+def conserved_quantities(pos, vel, masses, g=G_REAL, softening=SOFTENING, origin=None):
+    kinetic = kinetic_energy(vel, masses)
+    potential = potential_energy(pos, masses, g, softening)
+    return {
+        "kinetic": kinetic,
+        "potential": potential,
+        "energy": kinetic + potential,
+        "momentum": linear_momentum(vel, masses),
+        "angular_momentum": angular_momentum(pos, vel, masses, origin),
+    }
+
+def drift(initial, final, masses, vel0):
+    """
+    Derivas relativas entre dos estados de conserved_quantities():
+    energía |E - E0| / |E0|; momentos |P - P0| y |L - L0| normalizados por
+    sum m|v| y |L0| (P0 suele ser ~0, no sirve de escala).
+    """
+    p_scale = float(np.asarray(masses, dtype=np.float64) @ np.linalg.norm(np.asarray(vel0, dtype=np.float64), axis=1))
+    l_scale = float(np.linalg.norm(initial["angular_momentum"]))
+    return {
+        "energy": abs(final["energy"] - initial["energy"]) / abs(initial["energy"]),
+        "momentum": float(np.linalg.norm(final["momentum"] - initial["momentum"])) / p_scale,
+        "angular_momentum": float(np.linalg.norm(final["angular_momentum"] - initial["angular_momentum"])) / l_scale,
+    }
+
+def state_diagnostics(pos, vel, masses, phi):
+    """
+    (cinética, potencial, P, L) de un estado cuyo potencial por cuerpo phi ya
+    calculó el motor en su pasada de fuerzas (sin el O(N^2) de potential_energy).
+    """
+    masses = np.asarray(masses, dtype=np.float64)
+    return (kinetic_energy(vel, masses), 0.5 * float(masses @ np.asarray(phi, dtype=np.float64)),
+            linear_momentum(vel, masses), angular_momentum(pos, vel, masses))
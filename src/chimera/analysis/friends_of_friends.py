@@ -0,0 +1,147 @@
+"""
+Proyecto Orión - Friends-of-Friends (FoF)
+Buscador de grupos escalable: pares en arreglos NumPy (sin listas de listas),
+componentes conexas con union-find vectorizado y tablas por grupo con
+reducciones tipo bincount. Soporta la caja periódica de initial_conditions.py.
+
+Cada grupo se etiqueta con el índice más chico de sus miembros.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from chimera.profiling.tracer import span, traced, count
+
+PAIR_CHUNK = 65536  # Cuerpos por bloque al buscar pares (acota la memoria de la lista de pares)
+
+CATALOG_DTYPE = np.dtype([
+    ("group", np.int64),
+    ("n_members", np.int64),
+    ("mass", np.float64),
+    ("com", np.float64, (3,)),
+    ("vel", np.float64, (3,)),
+    ("sigma_v", np.float64),
+])
+
+def _wrap(pos, box_size):
+    if box_size is None:
+        return np.asarray(pos, dtype=np.float64)
+    # cKDTree periódico exige coordenadas en [0, box)
+    return np.mod(np.asarray(pos, dtype=np.float64), box_size)
+
+def minimum_image(diff, box_size):
+    """Diferencias de posición con la convención de imagen mínima (in-place si se puede)."""
+    if box_size is not None:
+        diff -= box_size * np.round(diff / box_size)
+    return diff
+
+def iter_pairs(pos, linking_length, box_size=None, chunk=PAIR_CHUNK):
+    """
+    Genera los pares (i, j) con i < j y distancia < linking_length, por bloques
+    de cuerpos vecinos en el espacio. Cada bloque es un arreglo (P, 2).
+    """
+    pos = _wrap(pos, box_size)
+    n = len(pos)
+    with span("fof.tree_build", n=n):
+        tree = cKDTree(pos, boxsize=box_size)
+
+    # Ordenar por x para que cada bloque sea una rebanada compacta de la caja
+    order = np.argsort(pos[:, 0], kind='stable')
+    for c0 in range(0, n, chunk):
+        with span("fof.pairs", chunk=c0):
+            idx = order[c0:c0 + chunk]
+            sub = cKDTree(pos[idx], boxsize=box_size)
+            found = sub.sparse_distance_matrix(tree, linking_length, output_type='ndarray')
+            i = idx[found['i']]
+            j = found['j']
+            keep = i < j
+            pairs = np.stack((i[keep], j[keep]), axis=1)
+        count("fof_pairs", len(pairs))
+        yield pairs
+
+def _compress(parent):
+    # Pointer jumping: cada nodo apunta directo a su raíz
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return parent
+        parent = grand
+
+def union_pairs(parent, pairs):
+    """
+    Union-find vectorizado: une los pares dados sobre el arreglo 'parent'.
+    La raíz de cada grupo siempre es su índice más chico.
+    """
+    u = pairs[:, 0]
+    v = pairs[:, 1]
+    while len(u):
+        parent = _compress(parent)
+        ru = parent[u]
+        rv = parent[v]
+        pending = ru != rv
+        if not pending.any():
+            break
+        u, v, ru, rv = u[pending], v[pending], ru[pending], rv[pending]
+        # Colgar la raíz mayor de la menor
+        np.minimum.at(parent, np.maximum(ru, rv), np.minimum(ru, rv))
+    return _compress(parent)
+
+def labels_from_pairs(n, pairs):
+    """Etiquetas de grupo a partir de un arreglo de pares (P, 2)."""
+    return union_pairs(np.arange(n, dtype=np.int64), np.asarray(pairs, dtype=np.int64).reshape(-1, 2))
+
+def find_groups(pos, linking_length, box_size=None, chunk=PAIR_CHUNK):
+    """Etiqueta de grupo FoF de cada cuerpo (N,). Memoria: O(N + pares por bloque)."""
+    parent = np.arange(len(pos), dtype=np.int64)
+    for pairs in iter_pairs(pos, linking_length, box_size, chunk):
+        with span("fof.union", pairs=len(pairs)):
+            parent = union_pairs(parent, pairs)
+    return parent
+
+@traced("fof.catalog")
+def group_catalog(labels, masses, pos, vel=None, box_size=None, min_members=1):
+    """
+    Tabla por grupo: miembros, masa, centro de masa, velocidad del centro de
+    masa y dispersión de velocidades (ponderada por masa), todo con bincount.
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    masses = np.asarray(masses, dtype=np.float64)
+
+    n_members = np.bincount(labels, minlength=n)
+    groups = np.flatnonzero(n_members >= max(min_members, 1))
+    mass = np.bincount(labels, weights=masses, minlength=n)
+
+    # Centro de masa relativo al miembro ancla (el índice de la etiqueta) -> válido en caja periódica
+    pos = np.asarray(pos, dtype=np.float64)
+    rel = minimum_image(pos - pos[labels], box_size)
+    com = np.empty((n, 3))
+    for k in range(3):
+        com[:, k] = np.bincount(labels, weights=masses * rel[:, k], minlength=n)
+    com /= np.maximum(mass, 1e-300)[:, None]
+    com += pos
+    if box_size is not None:
+        com = np.mod(com, box_size)
+
+    table = np.zeros(len(groups), dtype=CATALOG_DTYPE)
+    table["group"] = groups
+    table["n_members"] = n_members[groups]
+    table["mass"] = mass[groups]
+    table["com"] = com[groups]
+
+    if vel is not None:
+        vel = np.asarray(vel, dtype=np.float64)
+        vcom = np.empty((n, 3))
+        for k in range(3):
+            vcom[:, k] = np.bincount(labels, weights=masses * vel[:, k], minlength=n)
+        vcom /= np.maximum(mass, 1e-300)[:, None]
+
+        # Dos pasadas (residuo respecto al centro de masa) para no perder precisión
+        resid = vel - vcom[labels]
+        sigma2 = np.bincount(labels, weights=masses * np.einsum('ij,ij->i', resid, resid), minlength=n)
+        sigma2 /= np.maximum(mass, 1e-300)
+        table["vel"] = vcom[groups]
+        table["sigma_v"] = np.sqrt(sigma2[groups])
+
+    return table
@@ -1,112 +1,193 @@
 """
 Proyecto Orión - Detector de Fusiones (Merger Counter)
 Analiza las trayectorias para detectar cuándo las galaxias colapsan.
-Usa KDTree para optimización espacial.
+Usa Friends-of-Friends (KDTree + union-find) para encontrar los grupos.
+Con --ensemble analiza cada realización de un ensamble (gpu_taichi_ensemble.py)
+por separado y reporta la estadística de todas juntas. Lee igual trayectorias
+crudas o comprimidas (--traj-encoding quantized): solo se decodifica el
+bloque del cuadro final.
 Autor: Chris (Rubin1)
 """
 
 import numpy as np
-from scipy.spatial import cKDTree
 import matplotlib.pyplot as plt
+import argparse
+import os
+import sys
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import open_trajectory
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.storage.merger_log import open_merger_log
+from chimera.analysis.friends_of_friends import find_groups, group_catalog
+from chimera.profiling.tracer import span, traced
 
 # Archivos
-TRAJ_FILE = "data/processed/trajectory_taichi.npy"
-META_FILE = "data/processed/simulation_input.npy"
+TRAJ_FILE = "data/processed/trajectory_taichi.traj"
+META_FILE = "data/processed/simulation_input"
+ENSEMBLE_TRAJ_FILE = "data/processed/trajectory_ensemble.traj"
+ENSEMBLE_META_FILE = "data/processed/ensemble_input"
+ENSEMBLE_OUTPUT_FILE = "data/processed/ensemble_mergers.npz"
 
 # Radio crítico de fusión (Si pasan a menos de X parsecs, contamos fusión)
 # En el universo real, esto sería el Radio Virial (~10-20 kpc)
 MERGER_RADIUS_PC = 15000.0 
+SEED_MASS = 1e12  # Umbral arbitrario para "Semilla Supermasiva"
+
+MEMBER_DTYPE = np.dtype([("seed", np.int64), ("n_objects", np.int64), ("n_mergers", np.int64),
+                         ("monster_members", np.int64), ("monster_mass", np.float64)])
 
-def analyze_mergers():
+@traced("analysis.merger_summary")
+def merger_summary(final_pos, masses, box_size=None, radius=MERGER_RADIUS_PC):
+    """Catálogo FoF del cuadro final, solo los grupos con fusión y el más masivo (o None)."""
+    labels = find_groups(final_pos, radius, box_size)
+    catalog = group_catalog(labels, masses, final_pos, box_size=box_size)
+    mergers = catalog[catalog['n_members'] > 1]
+    monster = mergers[np.argmax(mergers['mass'])] if len(mergers) else None
+    return catalog, mergers, monster
+
+@traced("analysis.mergers")
+def analyze_mergers(periodic=False, traj_path=TRAJ_FILE, meta_path=META_FILE):
     print("--- 🕵️‍♂️ INICIANDO ANÁLISIS FORENSE DE LA SIMULACIÓN ---")
     
     # Cargar datos
     try:
-        traj = np.load(TRAJ_FILE) # (Steps, N, 3)
-        meta = np.load(META_FILE, allow_pickle=True).item()
+        traj = open_trajectory(traj_path) # (Steps, N, 3) en disco (memmap o bloques comprimidos)
+        meta = open_simulation_input(meta_path)
         masses = meta['masses']
     except FileNotFoundError:
         print("❌ Faltan archivos. Corre la simulación GPU primero.")
         return
 
-    n_steps = traj.shape[0]
-    n_galaxies = traj.shape[1]
+    n_steps = traj.n_frames
+    n_galaxies = traj.n_bodies
     
     print(f"📊 Analizando {n_galaxies} galaxias a lo largo de {n_steps} pasos de tiempo.")
     print(f"   Criterio de fusión: Distancia < {MERGER_RADIUS_PC/1000:.1f} kpc")
+    quantum = traj.header.get("encoding", {}).get("quantum")
+    if quantum:
+        print(f"   Trayectoria comprimida: posiciones con error ≤ {quantum / 2:.3g} pc")
 
     # Vamos a analizar solo el ÚLTIMO cuadro para ver cómo terminó todo
-    # (Hacerlo paso a paso es posible pero tardado, empecemos por el final)
-    final_pos = traj[-1] # (N, 3) en Parsecs
-    
-    # Construir un árbol espacial (KDTree) para búsquedas rápidas
-    tree = cKDTree(final_pos)
+    # (La historia completa, snapshot por snapshot, está en merger_history.py)
+    with span("analysis.load_frame"):
+        final_pos = np.asarray(traj[-1]) # (N, 3) en Parsecs (solo se lee este cuadro)
     
-    # Buscar grupos: "Dame todos los vecinos a menos de X distancia"
-    # query_ball_tree encuentra clusters automáticamente
-    merger_groups = tree.query_ball_tree(tree, r=MERGER_RADIUS_PC)
+    # Caja periódica: las distancias cruzan los bordes (igual que en initial_conditions.py)
+    box_size = None
+    if periodic:
+        box_size = meta.header.get('box_size_pc')
+        if box_size is None:
+            print("❌ El input no guarda box_size_pc. Regenera las condiciones iniciales.")
+            return
+        print(f"   Caja periódica: {box_size/1e6:.2f} Mpc")
     
-    # merger_groups es una lista de listas. Ej: [[0, 1], [1, 0], [2], [3, 4, 5]...]
-    # Necesitamos limpiar duplicados y encontrar los grupos únicos.
-    
-    visited = set()
-    clusters = []
-    
-    for i, neighbors in enumerate(merger_groups):
-        if i not in visited:
-            # Encontramos un nuevo grupo (o galaxia solitaria)
-            # Usamos un algoritmo de "Inundación" (BFS) para encontrar todo el cluster conectado
-            current_cluster = set()
-            stack = [i]
-            
-            while stack:
-                node = stack.pop()
-                if node not in visited:
-                    visited.add(node)
-                    current_cluster.add(node)
-                    # Añadir vecinos de este nodo a la pila
-                    stack.extend(merger_groups[node])
-            
-            clusters.append(list(current_cluster))
+    # Friends-of-Friends (pares en arreglos + union-find vectorizado) y tabla por
+    # grupo (masa, centro de masa, dispersión de velocidades) con bincount
+    catalog, mergers, monster = merger_summary(final_pos, masses, box_size)
 
     # --- RESULTADOS ---
-    n_mergers = 0
+    n_mergers = len(mergers)
     max_mass = 0
-    monster_cluster = []
-
+    monster_size = 0
+    
     print("\n--- RESULTADOS DEL COLAPSO ---")
     
-    for cluster in clusters:
-        cluster_size = len(cluster)
-        
-        if cluster_size > 1:
-            n_mergers += 1
-            
-            # Calcular masa total del monstruo resultante
-            cluster_mass = np.sum(masses[cluster])
-            
-            if cluster_mass > max_mass:
-                max_mass = cluster_mass
-                monster_cluster = cluster
-            
-            # Solo imprimir fusiones grandes
-            if cluster_size > 5:
-                print(f"⚠️ FUSIÓN MASIVA DETECTADA: {cluster_size} galaxias colapsaron en un solo objeto.")
-                print(f"   Masa combinada: {cluster_mass:.2e} M_sol")
+    if monster is not None:
+        max_mass = monster['mass']
+        monster_size = monster['n_members']
+    
+    # Solo imprimir fusiones grandes
+    for group in mergers[mergers['n_members'] > 5]:
+        print(f"⚠️ FUSIÓN MASIVA DETECTADA: {group['n_members']} galaxias colapsaron en un solo objeto.")
+        print(f"   Masa combinada: {group['mass']:.2e} M_sol")
 
     print("\n" + "="*30)
-    print(f"✅ Total de objetos finales: {len(clusters)} (de {n_galaxies} iniciales)")
+    print(f"✅ Total de objetos finales: {len(catalog)} (de {n_galaxies} iniciales)")
     print(f"🔥 Eventos de fusión detectados: {n_mergers}")
     print(f"👑 EL MONSTRUO (Agujero Negro Semilla más grande):")
-    print(f"   Compuesto por: {len(monster_cluster)} galaxias")
+    print(f"   Compuesto por: {monster_size} galaxias")
     print(f"   Masa Final: {max_mass:.4e} Masas Solares")
+    # Con fusiones en el motor los absorbidos comparten fila con su sobreviviente: FoF los cuenta igual
+    engine_mergers = open_merger_log(traj_path)
+    if len(engine_mergers):
+        print(f"🧪 Fusiones en el motor: {len(engine_mergers)} galaxias absorbidas durante la simulación")
     print("="*30)
     
     # Validación de Hipótesis
-    if max_mass > 1e12: # Umbral arbitrario para "Semilla Supermasiva"
+    if max_mass > SEED_MASS:
         print("\n🚀 CONCLUSIÓN: ¡La densidad fue suficiente! Hipótesis viable.")
     else:
         print("\n📉 CONCLUSIÓN: Crecimiento insuficiente. Necesitamos más densidad o más tiempo.")
 
+def _spread(values):
+    q16, q50, q84 = np.percentile(values, [16, 50, 84])
+    return f"media {np.mean(values):.3g} ± {np.std(values):.2g} | mediana {q50:.3g} [{q16:.3g}, {q84:.3g}]"
+
+def analyze_ensemble(traj_path=ENSEMBLE_TRAJ_FILE, meta_path=ENSEMBLE_META_FILE, periodic=False,
+                     output=ENSEMBLE_OUTPUT_FILE):
+    print("--- 🕵️‍♂️ ANÁLISIS FORENSE DEL ENSAMBLE ---")
+
+    try:
+        traj = open_trajectory(traj_path)
+        meta = open_simulation_input(meta_path)
+    except FileNotFoundError:
+        print("❌ Faltan archivos. Corre gpu_taichi_ensemble.py primero.")
+        return
+    E = traj.header["metadata"].get("ensemble_size")
+    if E is None:
+        print(f"❌ {traj_path} no es un ensamble (falta ensemble_size en el header).")
+        return
+    N = traj.n_bodies // E
+    seeds = traj.header["metadata"].get("seeds") or list(range(E))
+
+    box_size = None
+    if periodic:
+        box_size = meta.header.get('box_size_pc')
+        if box_size is None:
+            print("❌ El input no guarda box_size_pc. Regenera las condiciones iniciales.")
+            return
+
+    print(f"📊 {E} realizaciones x {N} galaxias, cuadro final de {traj.n_frames}")
+    print(f"   Criterio de fusión: Distancia < {MERGER_RADIUS_PC/1000:.1f} kpc")
+
+    # Cada realización por separado: un FoF sobre las filas planas mezclaría miembros
+    final_pos = np.asarray(traj[-1]).reshape(E, N, 3)
+    masses = np.asarray(meta['masses']).reshape(E, N)
+    members = np.zeros(E, dtype=MEMBER_DTYPE)
+    members["seed"] = seeds
+    for e in range(E):
+        catalog, mergers, monster = merger_summary(final_pos[e], masses[e], box_size)
+        members[e]["n_objects"] = len(catalog)
+        members[e]["n_mergers"] = len(mergers)
+        if monster is not None:
+            members[e]["monster_members"] = monster["n_members"]
+            members[e]["monster_mass"] = monster["mass"]
+
+    seeded = members["monster_mass"] > SEED_MASS
+    print("\n" + "="*30)
+    print(f"✅ Objetos finales:        {_spread(members['n_objects'])}")
+    print(f"🔥 Fusiones por realización: {_spread(members['n_mergers'])}")
+    print(f"👑 Galaxias en el monstruo:  {_spread(members['monster_members'])}")
+    print(f"   Masa del monstruo:        {_spread(members['monster_mass'])} M_sol")
+    print(f"🚀 Realizaciones con semilla supermasiva (> {SEED_MASS:.0e}): {seeded.sum()}/{E} "
+          f"({100 * seeded.mean():.1f}% ± {100 * np.sqrt(seeded.mean() * (1 - seeded.mean()) / E):.1f}%)")
+    print("="*30)
+
+    np.savez_compressed(output, members=members, radius_pc=MERGER_RADIUS_PC, seed_mass=SEED_MASS)
+    print(f"--> Estadística por realización guardada en {output}")
+
 if __name__ == "__main__":
-    analyze_mergers()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Detector de Fusiones - Proyecto Chimera")
+    parser.add_argument("--periodic", action="store_true", help="Usar la caja periódica del input")
+    parser.add_argument("--ensemble", action="store_true", help="Analizar el ensamble de gpu_taichi_ensemble.py")
+    parser.add_argument("--traj", type=str, default=None, help="Trayectoria a analizar (cruda o comprimida)")
+    parser.add_argument("--meta", type=str, default=None, help="Condiciones iniciales de esa trayectoria")
+    args = parser.parse_args()
+    
+    if args.ensemble:
+        analyze_ensemble(traj_path=args.traj or ENSEMBLE_TRAJ_FILE, meta_path=args.meta or ENSEMBLE_META_FILE,
+                         periodic=args.periodic)
+    else:
+        analyze_mergers(periodic=args.periodic, traj_path=args.traj or TRAJ_FILE, meta_path=args.meta or META_FILE)
\ No newline at end of file
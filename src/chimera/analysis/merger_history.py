@@ -0,0 +1,314 @@
+"""
+Proyecto Orión - Historia de Fusiones (Merger Tree)
+Encuentra los grupos en TODOS los snapshots (en paralelo) y los enlaza entre
+cuadros consecutivos para saber cuándo ocurrió cada fusión, quiénes fueron
+los progenitores y cómo creció "el monstruo" a lo largo del tiempo.
+
+El resultado es un catálogo de arreglos (.npz), no texto impreso:
+    times, monster_mass, monster_id, monster_members  -> (Snapshots,)
+    groups       -> grupos con más de un miembro por snapshot
+    events       -> una fila por fusión (snapshot, descendiente, progenitores...)
+    progenitors  -> enlaces progenitor -> descendiente de cada fusión
+
+Cada grupo se identifica por el índice más chico de sus galaxias, así el
+mismo objeto conserva su id entre cuadros mientras no absorba a alguien menor.
+
+Los pares cercanos salen de una lista de vecinos con margen (skin) que se
+reutiliza entre cuadros; por defecto el skin sale del desplazamiento entre
+cuadros medido al armar cada lista.
+
+Las etiquetas de grupo (N por snapshot) no se juntan en RAM: los bloques de
+los procesos se consumen en orden y solo queda el snapshot anterior para
+enlazar. Con --save-labels se escriben completas en LABELS_FILE (memmap).
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import os
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import open_trajectory
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.analysis.merger_counter import MERGER_RADIUS_PC, TRAJ_FILE, META_FILE
+from chimera.analysis.friends_of_friends import iter_pairs, labels_from_pairs, minimum_image
+
+OUTPUT_FILE = "data/processed/merger_tree.npz"
+LABELS_FILE = "data/processed/merger_labels.npy"  # Solo con --save-labels: (Snapshots, N), escrito como memmap
+SKIN_PC = None     # Margen extra de la lista de vecinos en pc (None = medido al armar cada lista)
+SKIN_MOVES = 4.0   # Skin medido = SKIN_MOVES x p99 del desplazamiento entre cuadros consecutivos
+SKIN_MAX_RADIUS = 0.5     # Si el skin medido pasa de esto x radio, la lista no se paga: se arma exacta (skin 0)
+REBUILD_FRACTION = 0.01   # Se reconstruye cuando más de esta fracción se movió > skin/2 (los demás se buscan aparte)
+N_WORKERS = os.cpu_count() or 1
+BLOCKS_PER_WORKER = 4  # Bloques contiguos de snapshots por proceso (balance de carga)
+BLOCK_FRAMES = 64      # Tope de snapshots por bloque: en RAM hay a lo sumo 2 bloques por proceso
+
+GROUP_DTYPE = np.dtype([("snapshot", np.int32), ("group", np.int64), ("n_members", np.int64), ("mass", np.float64)])
+EVENT_DTYPE = np.dtype([("snapshot", np.int32), ("time", np.float64), ("descendant", np.int64),
+                        ("n_progenitors", np.int32), ("mass", np.float64),
+                        ("main_progenitor", np.int64), ("main_progenitor_mass", np.float64)])
+PROGENITOR_DTYPE = np.dtype([("snapshot", np.int32), ("progenitor", np.int64), ("descendant", np.int64),
+                             ("mass", np.float64)])
+
+def _p99_move(pos, other, box_size):
+    """p99 de la distancia de cada cuerpo entre dos cuadros."""
+    moved = minimum_image(pos - other, box_size)
+    return float(np.percentile(np.sqrt(np.einsum('ij,ij->i', moved, moved)), 99))
+
+def _wrapped_tree(pos, box_size):
+    # cKDTree periódico exige coordenadas en [0, box)
+    return cKDTree(pos if box_size is None else np.mod(pos, box_size), boxsize=box_size)
+
+def _escaped_pairs(pos, ref_tree, fast, slow_reach, radius, box_size):
+    """
+    Pares candidatos de los cuerpos que se movieron más de skin/2 desde la lista:
+    contra los demás por el árbol de referencia (ninguno se corrió más de skin/2,
+    así que alcanza con radio + skin/2) y entre ellos por un árbol chico.
+    """
+    sub = _wrapped_tree(pos[fast], box_size)
+    found = sub.sparse_distance_matrix(ref_tree, slow_reach, output_type='ndarray')
+    across = np.stack((fast[found['i']], found['j']), axis=1)
+    among = fast[sub.query_pairs(radius, output_type='ndarray')]
+    return np.concatenate((across, among))
+
+def _label_block(args):
+    """
+    Trabajo de un proceso: etiquetar los snapshots [a, b).
+    Incremental: la lista de pares se arma con radio + skin y se reutiliza en los
+    cuadros siguientes. Los cuerpos que se desplazaron más de skin/2 desde la
+    última construcción se buscan aparte; el KDTree completo se reconstruye
+    recién cuando son más de REBUILD_FRACTION. skin=None: SKIN_MOVES x p99 del
+    desplazamiento entre cuadros, medido en cada reconstrucción (el colapso
+    acelera: un valor fijo queda chico al final o infla la lista al principio),
+    y 0 cuando pasa de SKIN_MAX_RADIUS x radio (cuerpos tan rápidos que la
+    lista agrandada cuesta más que reconstruir cada cuadro).
+    """
+    traj_path, a, b, radius, skin, box_size = args
+    traj = open_trajectory(traj_path)
+    n = traj.n_bodies
+    labels = np.empty((b - a, n), dtype=np.int64)
+
+    ref_pos = None
+    ref_tree = None
+    candidates = None
+    list_skin = skin
+    rebuilds = 0
+    prev = None
+    for k in range(a, b):
+        pos = np.asarray(traj[k], dtype=np.float64)
+
+        fast = None
+        if ref_pos is not None:
+            moved = minimum_image(pos - ref_pos, box_size)
+            fast = np.flatnonzero(np.einsum('ij,ij->i', moved, moved) > (list_skin / 2)**2)
+        if fast is None or len(fast) > REBUILD_FRACTION * n:
+            if skin is None:
+                # Primer cuadro del bloque: se mide contra el anterior (o el siguiente, en el cuadro 0)
+                other = prev if prev is not None else np.asarray(traj[k - 1 if k > 0 else min(1, traj.n_frames - 1)],
+                                                                 dtype=np.float64)
+                list_skin = SKIN_MOVES * _p99_move(pos, other, box_size)
+                if list_skin > SKIN_MAX_RADIUS * radius:
+                    list_skin = 0.0 # Pares más lejanos de lo que cubre un cuadro: más caro que reconstruir
+            candidates = np.concatenate(list(iter_pairs(pos, radius + list_skin, box_size)))
+            ref_pos = pos
+            ref_tree = None
+            fast = None
+            rebuilds += 1
+
+        pairs = candidates
+        if fast is not None and len(fast):
+            # Los pares de la lista con un cuerpo rápido ya no son confiables: se cambian por los recalculados
+            is_fast = np.zeros(n, dtype=bool)
+            is_fast[fast] = True
+            pairs = candidates[~(is_fast[candidates[:, 0]] | is_fast[candidates[:, 1]])]
+            if ref_tree is None:
+                ref_tree = _wrapped_tree(ref_pos, box_size)
+            escaped = _escaped_pairs(pos, ref_tree, fast, radius + list_skin / 2, radius, box_size)
+            pairs = np.concatenate((pairs, escaped)) # Un par repetido no cambia nada (union-find y el filtro lo absorben)
+
+        diff = minimum_image(pos[pairs[:, 0]] - pos[pairs[:, 1]], box_size)
+        close = pairs[np.einsum('ij,ij->i', diff, diff) < radius**2]
+        labels[k - a] = labels_from_pairs(n, close)
+        prev = pos
+
+    return a, labels, rebuilds
+
+def link_snapshots(labels_prev, labels_cur, masses):
+    """
+    Enlaza los grupos de dos cuadros consecutivos. Devuelve los enlaces únicos
+    (progenitor, descendiente, masa compartida).
+    """
+    n = len(masses)
+    key = labels_prev * n + labels_cur
+    uniq, inverse = np.unique(key, return_inverse=True)
+    shared_mass = np.bincount(inverse, weights=masses)
+    return uniq // n, uniq % n, shared_mass
+
+def _labeled_blocks(jobs, n_workers):
+    """Bloques (a, etiquetas, reconstrucciones) en orden, con a lo sumo 2 por proceso en vuelo (back-pressure)."""
+    if n_workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _label_block(job)
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        in_flight = deque()
+        for job in jobs:
+            in_flight.append(pool.submit(_label_block, job))
+            if len(in_flight) >= 2 * n_workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def _merger_links(s, time, labels_prev, labels_cur, masses, group_mass):
+    """Enlaces progenitor -> descendiente y eventos de las fusiones del snapshot s (None si no hubo)."""
+    n = len(masses)
+    # Una fusión: un grupo actual que recibe galaxias de 2+ grupos anteriores
+    prog, desc, shared = link_snapshots(labels_prev, labels_cur, masses)
+    n_prog = np.bincount(desc, minlength=n)
+    merged = n_prog[desc] >= 2
+    if not merged.any():
+        return None
+
+    prog, desc, shared = prog[merged], desc[merged], shared[merged]
+    links = np.empty(len(prog), dtype=PROGENITOR_DTYPE)
+    links["snapshot"] = s
+    links["progenitor"] = prog
+    links["descendant"] = desc
+    links["mass"] = shared
+
+    # Progenitor principal: el que aporta más masa (orden por descendiente y masa)
+    order = np.lexsort((-shared, desc))
+    first = order[np.concatenate(([True], np.diff(desc[order]) != 0))]
+    ev = np.empty(len(first), dtype=EVENT_DTYPE)
+    ev["snapshot"] = s
+    ev["time"] = time
+    ev["descendant"] = desc[first]
+    ev["n_progenitors"] = n_prog[desc[first]]
+    ev["mass"] = group_mass[desc[first]]
+    ev["main_progenitor"] = prog[first]
+    ev["main_progenitor_mass"] = shared[first]
+    return links, ev
+
+def build_merger_history(traj_path=TRAJ_FILE, masses=None, radius=MERGER_RADIUS_PC, skin=SKIN_PC, n_workers=N_WORKERS,
+                         box_size=None, labels_file=None):
+    """
+    Catálogo de la historia de fusiones y número de reconstrucciones de vecinos.
+    Los bloques de etiquetas se consumen en orden y solo se guarda el snapshot
+    anterior; con labels_file las etiquetas de todos van a un .npy en disco (memmap).
+    skin=None: medido al armar cada lista (_label_block).
+    """
+    traj = open_trajectory(traj_path)
+    n_snap, n = traj.n_frames, traj.n_bodies
+    masses = np.asarray(masses, dtype=np.float64)
+    times = np.asarray(traj.times)
+
+    # 1. Grupos de cada snapshot, por bloques contiguos repartidos entre procesos
+    n_blocks = max(min(n_snap, n_workers * BLOCKS_PER_WORKER), -(-n_snap // BLOCK_FRAMES))
+    edges = np.linspace(0, n_snap, n_blocks + 1).astype(int)
+    jobs = [(traj_path, a, b, radius, skin, box_size) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+    labels_out = None
+    if labels_file is not None:
+        labels_out = np.lib.format.open_memmap(labels_file, mode="w+", shape=(n_snap, n),
+                                               dtype=np.int32 if n < 2**31 else np.int64)
+
+    # 2. Tablas por snapshot + enlaces con el snapshot anterior, a medida que llegan los bloques
+    monster_mass = np.zeros(n_snap)
+    monster_id = np.zeros(n_snap, dtype=np.int64)
+    monster_members = np.zeros(n_snap, dtype=np.int64)
+    groups, events, progenitors = [], [], []
+    labels_prev = None
+    rebuilds = 0
+
+    for a, block, r in _labeled_blocks(jobs, n_workers):
+        rebuilds += r
+        if labels_out is not None:
+            labels_out[a:a + len(block)] = block
+        for s, labels_cur in enumerate(block, start=a):
+            group_mass = np.bincount(labels_cur, weights=masses, minlength=n)
+            group_size = np.bincount(labels_cur, minlength=n)
+
+            monster_id[s] = np.argmax(group_mass)
+            monster_mass[s] = group_mass[monster_id[s]]
+            monster_members[s] = group_size[monster_id[s]]
+
+            multi = np.flatnonzero(group_size > 1)
+            table = np.empty(len(multi), dtype=GROUP_DTYPE)
+            table["snapshot"] = s
+            table["group"] = multi
+            table["n_members"] = group_size[multi]
+            table["mass"] = group_mass[multi]
+            groups.append(table)
+
+            if labels_prev is not None:
+                merger = _merger_links(s, times[s], labels_prev, labels_cur, masses, group_mass)
+                if merger is not None:
+                    progenitors.append(merger[0])
+                    events.append(merger[1])
+            labels_prev = labels_cur
+
+    if labels_out is not None:
+        labels_out.flush()
+        del labels_out
+
+    catalog = {
+        "times": times,
+        "monster_mass": monster_mass,
+        "monster_id": monster_id,
+        "monster_members": monster_members,
+        "groups": np.concatenate(groups) if groups else np.empty(0, dtype=GROUP_DTYPE),
+        "events": np.concatenate(events) if events else np.empty(0, dtype=EVENT_DTYPE),
+        "progenitors": np.concatenate(progenitors) if progenitors else np.empty(0, dtype=PROGENITOR_DTYPE),
+    }
+    return catalog, rebuilds
+
+def run_merger_history(n_workers=N_WORKERS, radius=MERGER_RADIUS_PC, skin=SKIN_PC, save_labels=False, periodic=False):
+    print("--- 🌳 CONSTRUYENDO EL ÁRBOL DE FUSIONES (TODOS LOS SNAPSHOTS) ---")
+
+    meta = open_simulation_input(META_FILE)
+    masses = meta['masses']
+    box_size = meta.header.get('box_size_pc') if periodic else None
+    if periodic and box_size is None:
+        print("❌ El input no guarda box_size_pc. Regenera las condiciones iniciales.")
+        return
+    traj = open_trajectory(TRAJ_FILE)
+    print(f"📊 {traj.n_bodies} galaxias x {traj.n_frames} snapshots | {n_workers} procesos")
+    skin_text = f"{skin/1000:.1f} kpc" if skin is not None else f"{SKIN_MOVES:g} x p99 del desplazamiento entre cuadros"
+    print(f"   Criterio de fusión: Distancia < {radius/1000:.1f} kpc (skin {skin_text})")
+
+    start_time = time.time()
+    labels_file = LABELS_FILE if save_labels else None
+    catalog, rebuilds = build_merger_history(TRAJ_FILE, masses, radius, skin, n_workers, box_size, labels_file)
+    elapsed = time.time() - start_time
+
+    np.savez_compressed(OUTPUT_FILE, **catalog)
+
+    events = catalog["events"]
+    print(f"✅ Árbol construido en {elapsed:.2f} s ({rebuilds} reconstrucciones de vecinos para {traj.n_frames} cuadros: "
+          f"{traj.n_frames / max(rebuilds, 1):.1f} cuadros por lista)")
+    print(f"🔥 Eventos de fusión registrados: {len(events)}")
+    if len(events):
+        print(f"   Primera fusión: snapshot {events['snapshot'][0]} (t = {events['time'][0]:.1f})")
+    print(f"👑 Masa del monstruo: {catalog['monster_mass'][0]:.2e} -> {catalog['monster_mass'][-1]:.2e} M_sol")
+    print(f"--> Catálogo guardado en {OUTPUT_FILE}")
+    if save_labels:
+        print(f"--> Etiquetas ({traj.n_frames} x {traj.n_bodies}) guardadas en {LABELS_FILE}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Historia de fusiones - Proyecto Chimera")
+    parser.add_argument("--workers", type=int, default=N_WORKERS, help="Procesos en paralelo")
+    parser.add_argument("--radius", type=float, default=MERGER_RADIUS_PC, help="Radio de fusión (pc)")
+    parser.add_argument("--skin", type=float, default=SKIN_PC,
+                        help=f"Margen de la lista de vecinos en pc (por defecto, {SKIN_MOVES:g} x p99 del desplazamiento entre cuadros)")
+    parser.add_argument("--save-labels", action="store_true", help=f"Guardar también la etiqueta de grupo de cada galaxia en cada snapshot ({LABELS_FILE})")
+    parser.add_argument("--periodic", action="store_true", help="Usar la caja periódica del input")
+    args = parser.parse_args()
+
+    run_merger_history(n_workers=args.workers, radius=args.radius, skin=args.skin, save_labels=args.save_labels,
+                       periodic=args.periodic)
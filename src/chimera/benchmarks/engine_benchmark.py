@@ -0,0 +1,388 @@
+"""
+Proyecto Orión - Banco de Pruebas de Motores (Benchmark Suite)
+Corre cada motor sobre un barrido de N (10^2 a 10^6 donde se pueda) y varios
+números de pasos, cada corrida en su propio proceso (RSS pico aislado, un
+motor colgado no tumba al resto). Por corrida guarda:
+
+    seconds              -> tiempo de pared de la función run_* del motor
+    steps_per_s          -> pasos / segundo
+    interactions_per_s   -> N*(N-1) por paso / segundo (equivalente de fuerza
+                            bruta: en árbol y malla mide cuánto trabajo directo reemplazan)
+    peak_rss_mb          -> memoria residente pico del proceso
+    snapshot_seconds     -> tiempo moviendo snapshots (GPU -> RAM y escritura a disco;
+                            con el pipeline de Taichi: bajada GPU -> RAM y espera
+                            del bucle por un slot libre, la escritura se solapa)
+
+Con dos o más números de pasos también calcula la velocidad marginal, que
+descuenta los costos fijos (carga, compilación JIT, armado del árbol inicial).
+
+Uso:
+    python3 src/chimera/benchmarks/engine_benchmark.py --out base.json
+    python3 src/chimera/benchmarks/engine_benchmark.py --compare base.json
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import contextlib
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+REPO_DIR = os.path.join(SRC_DIR, "..")
+sys.path.insert(0, SRC_DIR)
+
+# --- CONFIGURACIÓN ---
+OUTPUT_FILE = "data/processed/benchmarks/engine_benchmark.json"
+N_SWEEP = [100, 1000, 10000, 100000, 1000000]
+STEP_SWEEP = [10, 50]
+TIMEOUT_S = 600          # Por corrida; si un N se pasa, los N mayores de ese motor se saltan
+BOX_MPC = 5.0            # Caja de las condiciones iniciales (la necesita el motor PM)
+SEED = 42
+SPEED_THRESHOLD = 0.10   # Regresión: más de 10% más lento que la línea base
+RSS_THRESHOLD = 0.20     # Regresión: más de 20% más memoria que la línea base
+FORMAT_NAME = "orion-bench"
+FORMAT_VERSION = 1
+
+# Motor -> (módulo, N máximo razonable en CPU)
+ENGINES = {
+    "taichi": ("chimera.engines.gpu_taichi", 100000),
+    "barnes_hut": ("chimera.engines.cpu_barnes_hut", 1000000),
+    "particle_mesh": ("chimera.engines.cpu_particle_mesh", 1000000),
+    "rebound": ("chimera.engines.cpu_rebound", 1000),
+    "torch": ("orion_forces", 100000),
+}
+
+# Métricas comparadas: nombre -> True si más alto es mejor
+METRICS = {
+    "steps_per_s": True,
+    "interactions_per_s": True,
+    "peak_rss_mb": False,
+}
+
+# ---------------------------------------------------------------------------
+# Proceso hijo: una corrida de un motor
+# ---------------------------------------------------------------------------
+
+class _SnapshotTimer:
+    """Envuelve métodos (escritura de la trayectoria, copias GPU -> RAM) y suma su tiempo."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._lock = threading.Lock() # Con el pipeline de snapshots también suma el hilo escritor
+
+    def timed(self, original):
+        timer = self
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with timer._lock:
+                    timer.seconds += time.perf_counter() - t0
+
+        return timed
+
+    def wrap(self, owner, name):
+        setattr(owner, name, self.timed(getattr(owner, name)))
+
+    def wrap_pipeline(self, pipeline_cls):
+        """
+        Snapshots en segundo plano (SnapshotPipeline): la escritura a disco se
+        solapa con el bucle y no cuenta. Se mide la bajada GPU -> RAM (fetch,
+        en el hilo escritor) y la espera del bucle por un slot libre (acquire:
+        el back-pressure cuando el disco no da abasto).
+        """
+        self.wrap(pipeline_cls, "acquire")
+        original_init = pipeline_cls.__init__
+        timer = self
+
+        def init(self, writer, shape, fetch, *args, **kwargs):
+            original_init(self, writer, shape, timer.timed(fetch), *args, **kwargs)
+
+        pipeline_cls.__init__ = init
+
+def _run_torch(input_path, output_path, steps):
+    # Mismo camino de fuerzas que orion_gpu.py / gpu_stress_test.py, con el integrador de los motores
+    import torch
+    from orion_forces import get_acc
+    from chimera.engines.cpu_barnes_hut import G_REAL, DT, SOFTENING
+    from chimera.storage.trajectory_store import TrajectoryWriter
+    from chimera.storage.simulation_input import open_simulation_input
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    data = open_simulation_input(input_path)
+    pos = torch.tensor(np.asarray(data['positions'], dtype=np.float32), device=device)
+    vel = torch.tensor(np.asarray(data['velocities'], dtype=np.float32), device=device)
+    mass = torch.tensor(np.asarray(data['masses'], dtype=np.float32), device=device)[:, None]
+
+    with TrajectoryWriter(output_path, len(pos), np.float32, engine="torch") as writer:
+        for s in range(steps):
+            acc = get_acc(pos, mass, G_REAL, SOFTENING)
+            vel += acc * DT
+            pos += vel * DT
+            if s % 5 == 0:
+                writer.append(pos.cpu().numpy(), t=(s + 1) * DT)
+
+def _worker(spec_path):
+    """Corre un motor según el spec JSON y escribe el resultado al lado."""
+    with open(spec_path) as f:
+        spec = json.load(f)
+    engine, steps, workdir = spec["engine"], spec["steps"], spec["workdir"]
+    input_path = spec["input"]
+    output_path = os.path.join(workdir, f"{engine}.traj")
+
+    if not spec["gpu"]:
+        os.environ.setdefault("TI_ARCH", "x64")     # Taichi en CPU
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""     # Torch en CPU
+    sys.path.insert(0, REPO_DIR)
+
+    timer = _SnapshotTimer()
+    if engine == "taichi":
+        # Snapshots por el pipeline (bajada y disco en el hilo escritor): append/flush no frenan el bucle
+        from chimera.storage.snapshot_pipeline import SnapshotPipeline
+        timer.wrap_pipeline(SnapshotPipeline)
+    else:
+        from chimera.storage.trajectory_store import TrajectoryWriter
+        timer.wrap(TrajectoryWriter, "append")
+        timer.wrap(TrajectoryWriter, "flush")
+
+    with open(os.path.join(workdir, f"{engine}.log"), "w") as log, contextlib.redirect_stdout(log):
+        module = importlib.import_module(ENGINES[engine][0])
+        if engine == "taichi":
+            module.init_taichi()                # Fuera del tiempo medido (como cuando arrancaba al importar)
+
+        if hasattr(module, "INPUT_FILE"):
+            module.INPUT_FILE = input_path
+            module.OUTPUT_FILE = output_path
+        if hasattr(module, "CHECKPOINT_DIR"):
+            module.CHECKPOINT_DIR = os.path.join(workdir, "checkpoints")
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        t0 = time.perf_counter()
+        if engine == "taichi":
+            module.STEPS = steps
+            module.run_taichi_simulation(checkpoint_every=0)
+        elif engine == "barnes_hut":
+            module.run_barnes_hut_simulation(steps=steps, check_sample=0)
+        elif engine == "particle_mesh":
+            module.run_pm_simulation(steps=steps)
+        elif engine == "rebound":
+            # Un "paso" = un intervalo de salida de DT (0.5 Myr); IAS15 elige sus subpasos
+            module.SNAPSHOTS = steps + 1
+            module.SIMULATION_TIME = steps * 0.5e6
+            module.run_rebound_simulation(checkpoint_every=0)
+        elif engine == "torch":
+            _run_torch(input_path, output_path, steps)
+        seconds = time.perf_counter() - t0
+
+    result = {
+        "seconds": seconds,
+        "snapshot_seconds": timer.seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # Linux: ru_maxrss en KB
+        "rss_before_mb": rss_before,
+    }
+    with open(os.path.join(workdir, "result.json"), "w") as f:
+        json.dump(result, f)
+
+# ---------------------------------------------------------------------------
+# Proceso padre: barrido, JSON y comparación
+# ---------------------------------------------------------------------------
+
+def _host_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+def _make_input(workdir, n):
+    path = os.path.join(workdir, f"input_{n}")
+    if not os.path.isdir(path):
+        from chimera.initial_conditions import stream_chimera_scenario
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            stream_chimera_scenario(n, BOX_MPC, SEED, out_dir=path)
+    return path
+
+def run_single(engine, n, steps, input_path, timeout=TIMEOUT_S, gpu=False):
+    """Una corrida en un proceso aparte. Devuelve la fila de resultados."""
+    row = {"engine": engine, "n": n, "steps": steps, "status": "ok"}
+    workdir = tempfile.mkdtemp(prefix=f"orion_bench_{engine}_")
+    try:
+        spec_path = os.path.join(workdir, "spec.json")
+        with open(spec_path, "w") as f:
+            json.dump({"engine": engine, "steps": steps, "input": input_path, "workdir": workdir, "gpu": gpu}, f)
+
+        try:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", spec_path],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            row["status"] = "timeout"
+            return row
+
+        result_path = os.path.join(workdir, "result.json")
+        if proc.returncode != 0 or not os.path.isfile(result_path):
+            row["status"] = "error"
+            row["error"] = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"
+            return row
+
+        with open(result_path) as f:
+            row.update(json.load(f))
+        row["steps_per_s"] = steps / row["seconds"]
+        row["interactions_per_s"] = n * (n - 1) * steps / row["seconds"]
+        row["snapshot_fraction"] = row["snapshot_seconds"] / row["seconds"]
+        return row
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def marginal_rates(results):
+    """Velocidad entre el menor y el mayor número de pasos (sin costos fijos)."""
+    scaling = []
+    for engine in sorted({r["engine"] for r in results}):
+        for n in sorted({r["n"] for r in results if r["engine"] == engine}):
+            runs = sorted((r for r in results if r["engine"] == engine and r["n"] == n and r["status"] == "ok"),
+                          key=lambda r: r["steps"])
+            if len(runs) < 2 or runs[-1]["seconds"] <= runs[0]["seconds"]:
+                continue
+            d_steps = runs[-1]["steps"] - runs[0]["steps"]
+            d_time = runs[-1]["seconds"] - runs[0]["seconds"]
+            scaling.append({"engine": engine, "n": n,
+                            "steps_per_s_marginal": d_steps / d_time,
+                            "interactions_per_s_marginal": n * (n - 1) * d_steps / d_time})
+    return scaling
+
+def run_suite(engines=None, n_sweep=N_SWEEP, step_sweep=STEP_SWEEP, timeout=TIMEOUT_S, gpu=False):
+    engines = list(engines or ENGINES)
+    print(f"--- ⏱️ BANCO DE PRUEBAS: {', '.join(engines)} | N = {n_sweep} | pasos = {step_sweep} ---")
+
+    workdir = tempfile.mkdtemp(prefix="orion_bench_inputs_")
+    results = []
+    try:
+        for engine in engines:
+            max_n = ENGINES[engine][1]
+            blocked = False
+            for n in sorted(n_sweep):
+                for steps in sorted(step_sweep):
+                    if n > max_n or blocked:
+                        results.append({"engine": engine, "n": n, "steps": steps, "status": "skipped"})
+                        continue
+
+                    row = run_single(engine, n, steps, _make_input(workdir, n), timeout, gpu)
+                    results.append(row)
+                    if row["status"] == "ok":
+                        print(f"   {engine:>14} N={n:<8} pasos={steps:<5} {row['steps_per_s']:10.2f} pasos/s "
+                              f"{row['interactions_per_s']:10.3e} int/s  {row['peak_rss_mb']:8.1f} MB  "
+                              f"snapshots {100 * row['snapshot_fraction']:.1f}%")
+                    else:
+                        print(f"   {engine:>14} N={n:<8} pasos={steps:<5} ⚠️ {row['status']} {row.get('error', '')}")
+                        # Si ya no entra en el tiempo, los N mayores tampoco
+                        blocked = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": _host_info(),
+        "config": {"n_sweep": list(n_sweep), "step_sweep": list(step_sweep), "timeout_s": timeout, "gpu": gpu},
+        "results": results,
+        "scaling": marginal_rates(results),
+    }
+
+def save_report(report, path=OUTPUT_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+def load_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    if report.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} no es un reporte '{FORMAT_NAME}'")
+    return report
+
+def compare_reports(baseline, current, speed_threshold=SPEED_THRESHOLD, rss_threshold=RSS_THRESHOLD):
+    """
+    Compara corrida por corrida (motor, N, pasos). Devuelve la lista de
+    regresiones: cada una con la métrica, ambos valores y el cambio relativo.
+    """
+    thresholds = {"steps_per_s": speed_threshold, "interactions_per_s": speed_threshold, "peak_rss_mb": rss_threshold}
+    base = {(r["engine"], r["n"], r["steps"]): r for r in baseline["results"] if r["status"] == "ok"}
+    regressions = []
+    for row in current["results"]:
+        key = (row["engine"], row["n"], row["steps"])
+        ref = base.get(key)
+        if ref is None:
+            continue
+        if row["status"] != "ok":
+            regressions.append({"engine": key[0], "n": key[1], "steps": key[2], "metric": "status",
+                                "baseline": "ok", "current": row["status"], "change": None})
+            continue
+        for metric, higher_is_better in METRICS.items():
+            change = (row[metric] - ref[metric]) / ref[metric]
+            worse = -change if higher_is_better else change
+            if worse > thresholds[metric]:
+                regressions.append({"engine": key[0], "n": key[1], "steps": key[2], "metric": metric,
+                                    "baseline": ref[metric], "current": row[metric], "change": change})
+    return regressions
+
+def print_comparison(baseline, current, regressions):
+    if baseline["host"] != current["host"]:
+        print("⚠️ La línea base es de otra máquina: los tiempos no son directamente comparables.")
+    if not regressions:
+        print("✅ Sin regresiones respecto a la línea base.")
+        return
+    print(f"❌ {len(regressions)} regresiones:")
+    for r in regressions:
+        if r["change"] is None:
+            print(f"   {r['engine']:>14} N={r['n']:<8} pasos={r['steps']:<5} {r['metric']}: {r['baseline']} -> {r['current']}")
+        else:
+            print(f"   {r['engine']:>14} N={r['n']:<8} pasos={r['steps']:<5} {r['metric']}: "
+                  f"{r['baseline']:.4g} -> {r['current']:.4g} ({100 * r['change']:+.1f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banco de pruebas de motores - Proyecto Chimera")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES), help="Motores a medir")
+    parser.add_argument("--n", type=int, nargs="+", default=N_SWEEP, help="Valores de N")
+    parser.add_argument("--steps", type=int, nargs="+", default=STEP_SWEEP, help="Números de pasos")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_S, help="Segundos máximos por corrida")
+    parser.add_argument("--gpu", action="store_true", help="Dejar que Taichi/Torch usen la GPU (por defecto solo CPU)")
+    parser.add_argument("--out", type=str, default=OUTPUT_FILE, help="Archivo JSON de resultados")
+    parser.add_argument("--compare", type=str, default=None, help="JSON de línea base contra el cual buscar regresiones")
+    parser.add_argument("--current", type=str, default=None, help="Comparar este JSON ya existente en vez de correr el barrido")
+    parser.add_argument("--threshold", type=float, default=SPEED_THRESHOLD, help="Caída de velocidad tolerada (fracción)")
+    parser.add_argument("--rss-threshold", type=float, default=RSS_THRESHOLD, help="Aumento de memoria tolerado (fracción)")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker)
+        sys.exit(0)
+
+    if args.current:
+        report = load_report(args.current)
+    else:
+        report = run_suite(args.engines, args.n, args.steps, args.timeout, args.gpu)
+        save_report(report, args.out)
+        print(f"--> Resultados guardados en {args.out}")
+
+    if args.compare:
+        baseline = load_report(args.compare)
+        regressions = compare_reports(baseline, report, args.threshold, args.rss_threshold)
+        print_comparison(baseline, report, regressions)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,119 @@
+"""
+Proyecto Orión - Chequeo de Precisión del Motor Taichi
+Corre gpu_taichi.py sobre las mismas condiciones iniciales en cada modo de
+precisión (f64 de referencia, mixed, f32) y compara:
+
+    energy_drift / momentum_drift / angular_momentum_drift
+                      -> deriva relativa de cada cantidad desde el estado inicial
+    energy_vs_f64     -> |E - E_f64| / |E0| al final
+    pos_err_median / pos_err_max
+                      -> distancia (pc) a las posiciones finales de la corrida f64
+    steps_per_s       -> velocidad del modo
+
+Todo en un solo proceso (Taichi se inicializa una vez, en la primera corrida).
+
+Uso:
+    TI_ARCH=x64 python3 src/chimera/benchmarks/precision_check.py --n 1000 --steps 500 --dt 0.05
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.analysis.conservation import conserved_quantities, drift
+
+# --- CONFIGURACIÓN ---
+OUTPUT_FILE = "data/processed/benchmarks/precision_check.json"
+N_BODIES = 1000
+BOX_MPC = 5.0
+SEED = 42
+STEPS = 500
+MODES = ["f64", "mixed", "f32"]   # f64 primero: es la referencia
+
+def run_mode(engine, precision, input_path, workdir, steps, integrator):
+    engine.INPUT_FILE = input_path
+    engine.OUTPUT_FILE = os.path.join(workdir, f"trajectory_{precision}.traj")
+    engine.STEPS = steps
+    with open(os.path.join(workdir, f"{precision}.log"), "w") as log, contextlib.redirect_stdout(log):
+        t0 = time.perf_counter()
+        state = engine.run_taichi_simulation(checkpoint_every=0, integrator=integrator, precision=precision)
+        seconds = time.perf_counter() - t0
+    return state, seconds
+
+def check_precision(input_path=None, n=N_BODIES, box=BOX_MPC, seed=SEED, steps=STEPS, dt=None, integrator="euler",
+                    modes=MODES):
+    from chimera.engines import gpu_taichi as engine
+    from chimera.storage.simulation_input import open_simulation_input
+    engine.init_taichi()  # Antes de medir: el arranque no cuenta para el primer modo
+    if dt is not None:
+        engine.DT = dt
+        engine.DT_MAX = 4 * dt
+
+    workdir = tempfile.mkdtemp(prefix="orion_precision_")
+    try:
+        if input_path is None:
+            from chimera.initial_conditions import stream_chimera_scenario
+            input_path = os.path.join(workdir, "simulation_input")
+            with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+                stream_chimera_scenario(n, box, seed, out_dir=input_path)
+
+        data = open_simulation_input(input_path)
+        masses = np.asarray(data['masses'], dtype=np.float64)
+        vel0 = np.asarray(data['velocities'], dtype=np.float64)
+        initial = conserved_quantities(data['positions'], vel0, masses, engine.G_REAL, engine.SOFTENING)
+        print(f"--- 🔬 CHEQUEO DE PRECISIÓN: N={len(masses)} | {steps} pasos de DT={engine.DT} | {integrator} ---")
+
+        rows = []
+        reference = None
+        for precision in modes:
+            state, seconds = run_mode(engine, precision, input_path, workdir, steps, integrator)
+            final = conserved_quantities(state["positions"], state["velocities"], masses,
+                                         engine.G_REAL, engine.SOFTENING)
+            row = {"precision": precision, "seconds": seconds, "steps_per_s": steps / seconds}
+            row.update({f"{k}_drift": v for k, v in drift(initial, final, masses, vel0).items()})
+            pos = np.asarray(state["positions"], dtype=np.float64)
+            if precision == "f64":
+                reference = {"pos": pos, "energy": final["energy"]}
+            if reference is not None:
+                err = np.linalg.norm(pos - reference["pos"], axis=1)
+                row["energy_vs_f64"] = abs(final["energy"] - reference["energy"]) / abs(initial["energy"])
+                row["pos_err_median"] = float(np.median(err))
+                row["pos_err_max"] = float(err.max())
+            rows.append(row)
+            print(f"   {precision:>6}: {row['steps_per_s']:9.1f} pasos/s | ΔE/E {row['energy_drift']:.3e} | "
+                  f"ΔP {row['momentum_drift']:.3e} | ΔL {row['angular_momentum_drift']:.3e}"
+                  + (f" | vs f64: ΔE {row['energy_vs_f64']:.3e}, |Δx| mediana {row['pos_err_median']:.3e} pc "
+                     f"máx {row['pos_err_max']:.3e} pc" if "pos_err_max" in row else ""))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {"n": len(masses), "steps": steps, "dt": engine.DT, "integrator": integrator, "results": rows}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chequeo de precisión del motor Taichi - Proyecto Chimera")
+    parser.add_argument("--input", type=str, default=None, help="simulation_input a usar (por defecto se genera uno)")
+    parser.add_argument("--n", type=int, default=N_BODIES, help="Número de galaxias del input generado")
+    parser.add_argument("--box", type=float, default=BOX_MPC, help="Caja del input generado (Mpc)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Semilla del input generado")
+    parser.add_argument("--steps", type=int, default=STEPS, help="Número de pasos")
+    parser.add_argument("--dt", type=float, default=None, help="Paso de tiempo (por defecto el del motor)")
+    parser.add_argument("--integrator", choices=["euler", "kdk"], default="euler", help="Integrador temporal")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="Modos a comparar")
+    parser.add_argument("--out", type=str, default=OUTPUT_FILE, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    modes = sorted(args.modes, key=MODES.index)
+    report = check_precision(args.input, args.n, args.box, args.seed, args.steps, args.dt, args.integrator, modes)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"--> Resultados guardados en {args.out}")
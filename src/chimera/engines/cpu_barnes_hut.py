@@ -0,0 +1,422 @@
+"""
+Proyecto Orión - Motor CPU (Barnes-Hut Octree)
+Gravedad aproximada O(N log N) con un octree construido sobre claves de Morton.
+Pensado para 10^5 - 10^6 galaxias, donde la fuerza bruta O(N^2) ya no alcanza.
+Con --merge-radius los cuerpos que se tocan se fusionan (engines/merging.py)
+y los arreglos se compactan: el árbol se arma solo con los que siguen vivos.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import create_trajectory_writer, ENCODINGS
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.storage.conservation_log import ConservationLog
+from chimera.storage.merger_log import MergerLog
+from chimera.engines.merging import merge_bodies
+from chimera.analysis.conservation import state_diagnostics
+from chimera.profiling.tracer import span, traced
+
+# --- CONFIGURACIÓN ---
+INPUT_FILE = "data/processed/simulation_input"
+OUTPUT_FILE = "data/processed/trajectory_barnes_hut.traj"  # None = trayectoria en memoria
+TRAJ_ENCODING = "raw"   # "raw" (sin pérdida) o "quantized" (comprimida, ~10x más chica; storage/trajectory_codec.py)
+TRAJ_PRECISION = 1e-6   # Paso de cuantización relativo a la caja (solo "quantized")
+G_REAL = 4.30091e-3  # pc (km/s)^2 / Msun
+DT = 0.5             # Mismo paso de tiempo que el motor Taichi
+STEPS = 2000
+SOFTENING = 10.0     # Parsecs
+THETA = 0.5          # Ángulo de apertura (0 = fuerza bruta exacta, más grande = más rápido)
+LEAF_SIZE = 16       # Máximo de cuerpos por hoja del árbol
+MAX_DEPTH = 21       # 21 bits por eje -> claves Morton de 63 bits
+BODY_CHUNK = 8192    # Cuerpos por lote al recorrer el árbol
+MAX_PAIRS = 1 << 17  # Máximo de pares (cuerpo, nodo) vivos a la vez (acota la RAM)
+CHECK_SAMPLE = 1000  # Cuerpos usados para comparar contra fuerza bruta
+DIAGNOSTICS_EVERY = 50   # Pasos entre mediciones de E, P y L (0 = desactivado)
+MAX_ENERGY_DRIFT = 0.0   # Abortar si |E - E0| / |E0| pasa de esto (0 = nunca abortar)
+MERGE_RADIUS = 0.0       # Parsecs: los cuerpos más cerca que esto se fusionan (0 = desactivado)
+MERGE_EVERY = 10         # Pasos entre búsquedas de fusiones (y compactaciones)
+
+def _spread_bits(v):
+    """Intercala 2 ceros entre cada bit (21 bits -> 63 bits)."""
+    v = v.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+def _ragged_arange(counts):
+    """Para counts=[2,3] devuelve [0,1,0,1,2] (índice dentro de cada bloque)."""
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total) - offsets
+
+@traced("bh.build_octree")
+def build_octree(pos, masses, leaf_size=LEAF_SIZE):
+    """
+    Construye el octree nivel por nivel sobre los cuerpos ordenados por Morton.
+    Cada nodo es un rango contiguo [start, start+count) del arreglo ordenado,
+    así que masas y centros de masa salen de sumas acumuladas por rango.
+    """
+    n = len(masses)
+    origin = pos.min(axis=0)
+    box = float((pos.max(axis=0) - origin).max()) * (1 + 1e-9)
+    if box == 0.0:
+        box = 1.0
+
+    cells = np.floor((pos - origin) / box * (1 << MAX_DEPTH)).astype(np.int64)
+    np.clip(cells, 0, (1 << MAX_DEPTH) - 1, out=cells)
+    keys = _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << np.uint64(1)) | (_spread_bits(cells[:, 2]) << np.uint64(2))
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    pos_s = pos[order]
+    mass_s = masses[order]
+    mpos_s = pos_s * mass_s[:, None]
+
+    starts, counts, levels = [], [], []
+    first_child, n_children = [], []
+    level_offset = 0
+
+    # Nivel 0: la raíz contiene a todos
+    lvl_start = np.array([0])
+    lvl_count = np.array([n])
+
+    for level in range(MAX_DEPTH + 1):
+        starts.append(lvl_start)
+        counts.append(lvl_count)
+        levels.append(np.full(len(lvl_start), level))
+        first_child.append(np.full(len(lvl_start), -1))
+        n_children.append(np.zeros(len(lvl_start), dtype=np.int64))
+
+        if level == MAX_DEPTH:
+            break
+
+        # Grupos del siguiente nivel (para TODOS los cuerpos)
+        prefix = keys >> np.uint64(3 * (MAX_DEPTH - level - 1))
+        g_start = np.concatenate(([0], np.flatnonzero(np.diff(prefix)) + 1))
+        g_count = np.diff(np.append(g_start, n))
+
+        # Un hijo existe si su padre no es hoja (padre con más de leaf_size cuerpos)
+        is_open = np.zeros(n, dtype=bool)
+        is_open[np.repeat(lvl_start, lvl_count) + _ragged_arange(lvl_count)] = np.repeat(lvl_count > leaf_size, lvl_count)
+        keep = is_open[g_start]
+        if not keep.any():
+            break
+
+        child_start = g_start[keep]
+        child_count = g_count[keep]
+
+        # Enlazar cada hijo con su padre (los hijos de un padre son contiguos)
+        parent_idx = np.searchsorted(lvl_start, child_start, side='right') - 1
+        uniq, first, cnt = np.unique(parent_idx, return_index=True, return_counts=True)
+        next_offset = level_offset + len(lvl_start)
+        first_child[-1][uniq] = next_offset + first
+        n_children[-1][uniq] = cnt
+
+        level_offset = next_offset
+        lvl_start, lvl_count = child_start, child_count
+
+    start = np.concatenate(starts)
+    count = np.concatenate(counts)
+    level = np.concatenate(levels)
+
+    # Masa y centro de masa por nodo (sumas acumuladas -> sumas por rango)
+    cum_m = np.concatenate(([0.0], np.cumsum(mass_s)))
+    cum_mp = np.vstack((np.zeros((1, 3)), np.cumsum(mpos_s, axis=0)))
+    node_mass = cum_m[start + count] - cum_m[start]
+    node_com = (cum_mp[start + count] - cum_mp[start]) / np.maximum(node_mass, 1e-300)[:, None]
+
+    return {
+        "order": order,
+        "pos": pos_s,
+        "mass": mass_s,
+        "start": start,
+        "count": count,
+        "size": box / (2.0 ** level),
+        "node_mass": node_mass,
+        "com": node_com,
+        "first_child": np.concatenate(first_child),
+        "n_children": np.concatenate(n_children),
+    }
+
+def _walk_chunk(tree, b0, b1, theta, softening, with_potential=False):
+    """Recorre el árbol para los cuerpos ordenados [b0, b1). Devuelve su aceleración (y su potencial)."""
+    pos_s = tree["pos"]
+    mass_s = tree["mass"]
+    start = tree["start"]
+    count = tree["count"]
+    eps2 = softening**2
+    theta2 = theta**2
+
+    n_local = b1 - b0
+    acc = np.zeros((n_local, 3))
+    phi = np.zeros(n_local) if with_potential else None
+
+    def accumulate(local, diff, factor):
+        for k in range(3):
+            acc[:, k] += np.bincount(local, weights=factor * diff[:, k], minlength=n_local)
+
+    def accumulate_potential(local, mass, r2):
+        # Potencial de Plummer con la misma aproximación (nodo lejano = masa puntual en su centro de masa)
+        phi[:] -= np.bincount(local, weights=G_REAL * mass / np.sqrt(r2 + eps2), minlength=n_local)
+
+    # Pila de listas de trabajo (cuerpo, nodo). Las listas grandes se parten a la mitad
+    work = [(np.arange(b0, b1), np.zeros(n_local, dtype=np.int64))]
+
+    while work:
+        bodies, nodes = work.pop()
+        if len(bodies) > MAX_PAIRS:
+            half = len(bodies) // 2
+            work.append((bodies[half:], nodes[half:]))
+            work.append((bodies[:half], nodes[:half]))
+            continue
+
+        diff = tree["com"][nodes] - pos_s[bodies]
+        r2 = np.einsum('ij,ij->i', diff, diff)
+
+        # Criterio de apertura: size / r < theta, y nunca un nodo que contiene al cuerpo
+        inside = (bodies >= start[nodes]) & (bodies < start[nodes] + count[nodes])
+        far = (tree["size"][nodes]**2 < theta2 * r2) & ~inside
+
+        if far.any():
+            factor = G_REAL * tree["node_mass"][nodes[far]] / (r2[far] + eps2)**1.5
+            accumulate(bodies[far] - b0, diff[far], factor)
+            if with_potential:
+                accumulate_potential(bodies[far] - b0, tree["node_mass"][nodes[far]], r2[far])
+
+        near = ~far
+        leaf = near & (tree["n_children"][nodes] == 0)
+
+        # Hojas cercanas: suma directa cuerpo a cuerpo
+        if leaf.any():
+            lb = bodies[leaf]
+            ln = nodes[leaf]
+            cnt = count[ln]
+            rep = np.repeat(lb, cnt)
+            j = np.repeat(start[ln], cnt) + _ragged_arange(cnt)
+            d = pos_s[j] - pos_s[rep]  # Si j == i la diferencia es 0 y no aporta
+            d2 = np.einsum('ij,ij->i', d, d)
+            factor = G_REAL * mass_s[j] / (d2 + eps2)**1.5
+            accumulate(rep - b0, d, factor)
+            if with_potential:
+                other = j != rep  # Al potencial sí aportaría: hay que sacar el par consigo mismo
+                accumulate_potential(rep[other] - b0, mass_s[j[other]], d2[other])
+
+        # Nodos internos cercanos: bajar a los hijos
+        inner = near & ~leaf
+        ib = bodies[inner]
+        inn = nodes[inner]
+        nc = tree["n_children"][inn]
+        if len(ib):
+            work.append((np.repeat(ib, nc), np.repeat(tree["first_child"][inn], nc) + _ragged_arange(nc)))
+
+    return (acc, phi) if with_potential else acc
+
+@traced("bh.forces")
+def compute_accelerations(pos, masses, theta=THETA, softening=SOFTENING, leaf_size=LEAF_SIZE, with_potential=False):
+    """
+    Aceleración Barnes-Hut de todos los cuerpos, en el orden original. Con
+    with_potential devuelve (acc, phi): el potencial sale del mismo recorrido.
+    """
+    tree = build_octree(pos, masses, leaf_size)
+    n = len(masses)
+    acc_sorted = np.empty((n, 3))
+    phi_sorted = np.empty(n) if with_potential else None
+    with span("bh.walk"):
+        for b0 in range(0, n, BODY_CHUNK):
+            b1 = min(b0 + BODY_CHUNK, n)
+            if with_potential:
+                acc_sorted[b0:b1], phi_sorted[b0:b1] = _walk_chunk(tree, b0, b1, theta, softening, True)
+            else:
+                acc_sorted[b0:b1] = _walk_chunk(tree, b0, b1, theta, softening)
+
+    acc = np.empty_like(acc_sorted)
+    acc[tree["order"]] = acc_sorted
+    if not with_potential:
+        return acc
+    phi = np.empty_like(phi_sorted)
+    phi[tree["order"]] = phi_sorted
+    return acc, phi
+
+def direct_accelerations(pos, masses, targets, softening=SOFTENING):
+    """Fuerza bruta (misma fórmula que el kernel Taichi) solo para los cuerpos 'targets'."""
+    acc = np.zeros((len(targets), 3))
+    for c0 in range(0, len(targets), 256):
+        idx = targets[c0:c0 + 256]
+        diff = pos[None, :, :] - pos[idx, None, :]  # (chunk, N, 3)
+        r2 = np.einsum('ijk,ijk->ij', diff, diff)
+        factor = G_REAL * masses[None, :] / (r2 + softening**2)**1.5
+        acc[c0:c0 + 256] = np.einsum('ij,ijk->ik', factor, diff)
+    return acc
+
+def force_error_report(pos, masses, acc_bh, sample=CHECK_SAMPLE, softening=SOFTENING, seed=0):
+    """Compara Barnes-Hut contra suma directa en una muestra de cuerpos."""
+    n = len(masses)
+    rng = np.random.default_rng(seed)
+    targets = np.sort(rng.choice(n, size=min(sample, n), replace=False))
+    acc_ref = direct_accelerations(pos, masses, targets, softening)
+
+    ref_norm = np.linalg.norm(acc_ref, axis=1)
+    rel_err = np.linalg.norm(acc_bh[targets] - acc_ref, axis=1) / np.maximum(ref_norm, 1e-300)
+    return {
+        "n_sample": len(targets),
+        "median": float(np.median(rel_err)),
+        "p99": float(np.percentile(rel_err, 99)),
+        "max": float(rel_err.max()),
+    }
+
+def run_barnes_hut_simulation(theta=THETA, steps=STEPS, check_sample=CHECK_SAMPLE, diagnostics_every=DIAGNOSTICS_EVERY,
+                              max_energy_drift=MAX_ENERGY_DRIFT, merge_radius=MERGE_RADIUS, merge_every=MERGE_EVERY,
+                              initial=None):
+    """initial: condiciones iniciales ya en memoria (SimulationInput) en lugar de INPUT_FILE."""
+    print(f"--- INICIANDO MOTOR CPU (BARNES-HUT, theta={theta}) ---")
+
+    # 1. Cargar datos (mismo formato que los otros motores)
+    data = open_simulation_input(INPUT_FILE) if initial is None else initial # Columnas memory-mapped (sin pickle)
+    masses = data['masses'].astype(np.float64)
+    pos = data['positions'].astype(np.float64)
+    vel = data['velocities'].astype(np.float64)
+
+    N = len(masses)
+    print(f"--> Cargando {N} galaxias en el octree...")
+
+    # 2. Validar la aproximación contra la fuerza bruta antes de arrancar
+    # (con diagnósticos, el potencial del estado inicial sale de este mismo recorrido)
+    phi = None
+    if diagnostics_every > 0:
+        acc, phi = compute_accelerations(pos, masses, theta, with_potential=True)
+    else:
+        acc = compute_accelerations(pos, masses, theta)
+    if check_sample > 0:
+        err = force_error_report(pos, masses, acc, check_sample)
+        print(f"--> Error relativo vs fuerza bruta ({err['n_sample']} cuerpos): "
+              f"mediana {err['median']:.2e} | p99 {err['p99']:.2e} | máx {err['max']:.2e}")
+
+    # 3. Bucle Principal (mismo integrador semi-implícito que el motor Taichi)
+    metadata = {"dt": DT, "steps": steps, "softening": SOFTENING, "g": G_REAL, "theta": theta, "snapshot_every": 5,
+                "diagnostics_every": diagnostics_every}
+    if merge_radius > 0:
+        metadata.update({"merge_radius": merge_radius, "merge_every": merge_every})
+    writer = create_trajectory_writer(OUTPUT_FILE, N, np.float32, engine="barnes_hut", metadata=metadata,
+                                      encoding=TRAJ_ENCODING, precision=TRAJ_PRECISION,
+                                      box_size=data.header.get("box_size_pc"))
+    log = ConservationLog(OUTPUT_FILE) if diagnostics_every > 0 else None # E, P y L junto a la trayectoria
+    # Fusiones: ids = ID original de cada cuerpo vivo, owner = cuerpo vivo donde está cada galaxia original
+    mergers = MergerLog(OUTPUT_FILE) if merge_radius > 0 else None
+    ids = np.arange(N)
+    owner = np.arange(N)
+
+    print(f"--> Comenzando cálculo O(N log N) para {steps} pasos...")
+    start_time = time.time()
+
+    aborted = False
+    s_end = 0
+    with writer, (log or contextlib.nullcontext()), (mergers or contextlib.nullcontext()):
+        for s in range(steps):
+            # Diagnóstico al inicio del paso: el potencial sale del mismo recorrido del árbol
+            diagnose = log is not None and s % diagnostics_every == 0
+
+            # Fusiones al inicio del paso: lo que se integra es el estado ya compactado
+            merged = False
+            if mergers is not None and s % merge_every == 0:
+                with span("merge"):
+                    result = merge_bodies(pos, vel, masses, ids, merge_radius)
+                if result is not None:
+                    # La fusión no es error de integración: su cambio de energía se descuenta de la deriva
+                    rebase = log is not None and log.energy0 is not None
+                    if rebase:
+                        _, phi = compute_accelerations(pos, masses, theta, with_potential=True)
+                        energy_before = sum(state_diagnostics(pos, vel, masses, phi)[:2])
+                    pos, vel, masses, ids, remap, events = result
+                    owner = remap[owner]
+                    mergers.record(s, s * DT, events)
+                    merged = True
+                    diagnose = diagnose or rebase
+
+            if s > 0 or merged:
+                if diagnose:
+                    acc, phi = compute_accelerations(pos, masses, theta, with_potential=True)
+                else:
+                    acc = compute_accelerations(pos, masses, theta)
+            if merged and rebase:
+                log.rebase(sum(state_diagnostics(pos, vel, masses, phi)[:2]) - energy_before)
+            energy_drift = None
+            if diagnose and s % diagnostics_every == 0:
+                with span("diagnostics", step=s):
+                    energy_drift = log.record(s, s * DT, *state_diagnostics(pos, vel, masses, phi))
+
+            # Integración rota: no seguir gastando horas en ella
+            if energy_drift is not None and max_energy_drift > 0 and energy_drift > max_energy_drift:
+                print(f"\n❌ Deriva de energía {energy_drift:.3e} > {max_energy_drift:.3e} en el paso {s}. "
+                      f"Abortando la corrida.")
+                aborted = True
+                break
+
+            vel += acc * DT
+            pos += vel * DT
+            s_end = s + 1
+
+            if s % 5 == 0:
+                # Una fila por galaxia original: las absorbidas, donde está quien las absorbió
+                writer.append(pos[owner] if mergers is not None else pos, t=(s + 1) * DT)
+                print(f"\rStep {s}/{steps} completado", end="")
+
+        # Medición del estado final
+        if log is not None and not aborted and (log.last is None or log.last["step"] != s_end):
+            _, phi = compute_accelerations(pos, masses, theta, with_potential=True)
+            log.record(s_end, s_end * DT, *state_diagnostics(pos, vel, masses, phi))
+
+    end_time = time.time()
+    if aborted:
+        print(f"⚠️ Simulación Barnes-Hut abortada tras {s_end} pasos ({end_time - start_time:.2f} segundos).")
+    else:
+        print(f"\n✅ Simulación Barnes-Hut completada en {end_time - start_time:.2f} segundos.")
+        print(f"   Velocidad: {steps / (end_time - start_time):.2f} pasos/segundo")
+    if log is not None and log.last is not None:
+        print(f"   Conservación: ΔE/E0 = {log.last['energy_drift']:.3e} en el paso {log.last['step']} "
+              f"(registro en {log.path})")
+    if mergers is not None:
+        print(f"   Fusiones: {mergers.n_events} galaxias absorbidas, quedan {len(masses)} de {N} "
+              f"(registro en {mergers.path})")
+    if OUTPUT_FILE is not None:
+        print(f"--> Datos guardados en {OUTPUT_FILE}")
+
+    # Estado final (solo los vivos si hubo fusiones) y lo producido, desde disco o desde memoria
+    return {"positions": pos, "velocities": vel, "masses": masses, "aborted": aborted, "ids": ids, "owner": owner,
+            "trajectory": writer.trajectory(), "conservation": log.records() if log is not None else None,
+            "mergers": mergers.records() if mergers is not None else None}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Motor Barnes-Hut (CPU) - Proyecto Chimera")
+    parser.add_argument("--theta", type=float, default=THETA, help="Ángulo de apertura del árbol")
+    parser.add_argument("--steps", type=int, default=STEPS, help="Número de pasos de tiempo")
+    parser.add_argument("--check", type=int, default=CHECK_SAMPLE, help="Cuerpos para comparar contra fuerza bruta (0 = no comparar)")
+    parser.add_argument("--diagnostics-every", type=int, default=DIAGNOSTICS_EVERY,
+                        help="Pasos entre mediciones de energía y momentos (0 = desactivado)")
+    parser.add_argument("--max-energy-drift", type=float, default=MAX_ENERGY_DRIFT,
+                        help="Abortar si |E - E0| / |E0| supera este valor (0 = nunca)")
+    parser.add_argument("--merge-radius", type=float, default=MERGE_RADIUS,
+                        help="Fusionar cuerpos a menos de este radio en pc (0 = sin fusiones)")
+    parser.add_argument("--merge-every", type=int, default=MERGE_EVERY, help="Pasos entre búsquedas de fusiones")
+    parser.add_argument("--traj-encoding", choices=ENCODINGS, default=TRAJ_ENCODING,
+                        help="Codificación de la trayectoria en disco")
+    parser.add_argument("--traj-precision", type=float, default=TRAJ_PRECISION,
+                        help="Paso de cuantización relativo a la caja (--traj-encoding quantized)")
+    args = parser.parse_args()
+
+    TRAJ_ENCODING = args.traj_encoding
+    TRAJ_PRECISION = args.traj_precision
+
+    run_barnes_hut_simulation(theta=args.theta, steps=args.steps, check_sample=args.check,
+                              diagnostics_every=args.diagnostics_every, max_energy_drift=args.max_energy_drift,
+                              merge_radius=args.merge_radius, merge_every=args.merge_every)
@@ -0,0 +1,358 @@
+"""
+Proyecto Orión - Motor CPU (Particle-Mesh periódico)
+Gravedad en caja periódica con FFT: depósito de masa CIC en una malla,
+Poisson en el espacio de Fourier y fuerzas interpoladas de vuelta (CIC).
+Opcional: corrección de corto alcance partícula-partícula (P3M, separación
+gaussiana tipo TreePM) para resolver escalas menores que una celda.
+Costo por paso: O(N + M^3 log M), en vez de O(N^2).
+Con --merge-radius los cuerpos que se tocan se fusionan (engines/merging.py,
+centros de masa con imagen mínima) y los arreglos se compactan.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+from scipy.special import erfc
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import create_trajectory_writer, ENCODINGS
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.analysis.friends_of_friends import iter_pairs, minimum_image
+from chimera.storage.conservation_log import ConservationLog
+from chimera.storage.merger_log import MergerLog
+from chimera.engines.merging import merge_bodies
+from chimera.analysis.conservation import state_diagnostics
+from chimera.profiling.tracer import span, traced
+
+# --- CONFIGURACIÓN ---
+INPUT_FILE = "data/processed/simulation_input"
+OUTPUT_FILE = "data/processed/trajectory_pm.traj"  # None = trayectoria en memoria
+TRAJ_ENCODING = "raw"   # "raw" (sin pérdida) o "quantized" (comprimida, ~10x más chica; storage/trajectory_codec.py)
+TRAJ_PRECISION = 1e-6   # Paso de cuantización relativo a la caja (solo "quantized")
+G_REAL = 4.30091e-3  # pc (km/s)^2 / Msun
+DT = 0.5             # Mismo paso de tiempo que el motor Taichi
+STEPS = 2000
+SOFTENING = 10.0     # Parsecs (solo en la parte de corto alcance)
+SNAPSHOT_EVERY = 5
+PM_GRID = 128        # Celdas por lado de la malla
+SPLIT_CELLS = 1.25   # r_s (escala de separación largo/corto alcance) en celdas
+SMOOTH_CELLS = 0.5   # PM puro: suavizado gaussiano (en celdas) que acompaña a la deconvolución CIC
+CUTOFF_RS = 4.5      # La fuerza de corto alcance se corta en CUTOFF_RS * r_s
+DIAGNOSTICS_EVERY = 50   # Pasos entre mediciones de E, P y L (0 = desactivado)
+MAX_ENERGY_DRIFT = 0.0   # Abortar si |E - E0| / |E0| pasa de esto (0 = nunca abortar)
+MERGE_RADIUS = 0.0       # Parsecs: los cuerpos más cerca que esto se fusionan (0 = desactivado)
+MERGE_EVERY = 10         # Pasos entre búsquedas de fusiones (y compactaciones)
+
+class ParticleMesh:
+    """Solver de Poisson periódico con malla CIC de `grid`^3 celdas."""
+
+    def __init__(self, box_size, grid=PM_GRID, split_scale=None):
+        self.box_size = float(box_size)
+        self.grid = int(grid)
+        self.cell = self.box_size / self.grid
+        self.split_scale = split_scale  # r_s (pc) o None para PM puro
+
+        # Números de onda de la malla (rfft en el último eje)
+        k = 2 * np.pi * np.fft.fftfreq(self.grid, d=self.cell)
+        kz = 2 * np.pi * np.fft.rfftfreq(self.grid, d=self.cell)
+        self.kx = k[:, None, None]
+        self.ky = k[None, :, None]
+        self.kz = kz[None, None, :]
+        k2 = self.kx**2 + self.ky**2 + self.kz**2
+
+        # Función de Green de Poisson: phi_k = -4 pi G rho_k / k^2 (el modo k=0 se anula)
+        green = np.zeros_like(k2)
+        np.divide(-4 * np.pi * G_REAL, k2, out=green, where=k2 > 0)
+
+        # Deconvolución de la ventana CIC (depósito + interpolación = ventana al cuadrado)
+        half = 0.5 * self.cell
+        window = (np.sinc(self.kx * half / np.pi) * np.sinc(self.ky * half / np.pi) * np.sinc(self.kz * half / np.pi))**2
+        green /= window**2
+
+        # La deconvolución sola amplifica hasta ~225x los modos cerca de Nyquist (ruido de
+        # aliasing: fuerzas erráticas, hasta repulsivas, a pocas celdas). Siempre va con un
+        # suavizado gaussiano: con P3M es el de la separación (lo complementa el erfc de
+        # corto alcance); en PM puro, uno chico de SMOOTH_CELLS celdas
+        smoothing = split_scale if split_scale is not None else SMOOTH_CELLS * self.cell
+        green *= np.exp(-k2 * smoothing**2)
+        self.green = green
+
+    def _cic_corners(self, pos):
+        """Genera (índice plano, peso) para las 8 celdas que toca cada cuerpo."""
+        u = pos / self.cell - 0.5
+        i0 = np.floor(u).astype(np.int64)
+        f = u - i0
+        m = self.grid
+        for dx in (0, 1):
+            wx = f[:, 0] if dx else 1 - f[:, 0]
+            ix = (i0[:, 0] + dx) % m
+            for dy in (0, 1):
+                wy = f[:, 1] if dy else 1 - f[:, 1]
+                iy = (i0[:, 1] + dy) % m
+                for dz in (0, 1):
+                    wz = f[:, 2] if dz else 1 - f[:, 2]
+                    iz = (i0[:, 2] + dz) % m
+                    yield (ix * m + iy) * m + iz, wx * wy * wz
+
+    @traced("pm.deposit")
+    def deposit(self, pos, masses):
+        """Densidad de masa (Msun / pc^3) en la malla con Cloud-In-Cell."""
+        rho = np.zeros(self.grid**3)
+        for flat, w in self._cic_corners(pos):
+            rho += np.bincount(flat, weights=masses * w, minlength=self.grid**3)
+        return rho.reshape((self.grid,) * 3) / self.cell**3
+
+    def accelerations(self, pos, masses, with_potential=False):
+        """
+        Aceleración de largo alcance (malla) de cada cuerpo. Con with_potential
+        devuelve (acc, phi): el potencial interpolado sale del mismo phi_k (una FFT más).
+        """
+        pos = np.mod(pos, self.box_size)
+        rho = self.deposit(pos, masses)
+        with span("pm.fft"):
+            phi_k = np.fft.rfftn(rho) * self.green
+
+        acc = np.zeros((len(pos), 3))
+        for axis, k in enumerate((self.kx, self.ky, self.kz)):
+            # a = -grad(phi) -> en Fourier: -i k phi_k
+            with span("pm.fft"):
+                grid_acc = np.fft.irfftn(-1j * k * phi_k, s=(self.grid,) * 3, axes=(0, 1, 2)).ravel()
+            with span("pm.interpolate"):
+                for flat, w in self._cic_corners(pos):
+                    acc[:, axis] += w * grid_acc[flat]
+        if not with_potential:
+            return acc
+
+        # Potencial relativo a la densidad media (el modo k=0 está anulado). Incluye la
+        # autoenergía de cada nube CIC: un corrimiento ~constante que no afecta la deriva
+        grid_phi = np.fft.irfftn(phi_k, s=(self.grid,) * 3, axes=(0, 1, 2)).ravel()
+        phi = np.zeros(len(pos))
+        for flat, w in self._cic_corners(pos):
+            phi += w * grid_phi[flat]
+        return acc, phi
+
+def check_two_body(grid=64, p3m=False, separations=(2, 4, 8, 16), orientations=40, seed=0):
+    """
+    Fuerza radial de una masa sobre una partícula de prueba, relativa a la
+    newtoniana, en orientaciones y posiciones al azar dentro de la celda.
+    Devuelve [(separación en celdas, media, desvío)]. Con separaciones de
+    ~1/4 de caja la media baja un poco por las imágenes periódicas.
+    """
+    cell = 1000.0  # 1 kpc: el suavizado de corto alcance (SOFTENING) queda despreciable
+    pm = ParticleMesh(grid * cell, grid, split_scale=SPLIT_CELLS * cell if p3m else None)
+    rng = np.random.default_rng(seed)
+    masses = np.array([1.0, 0.0])  # La partícula de prueba no deposita masa
+    rows = []
+    for d in separations:
+        ratios = []
+        for _ in range(orientations):
+            center = rng.uniform(0, pm.box_size, 3)
+            u = rng.normal(size=3)
+            u /= np.linalg.norm(u)
+            pos = np.array([center, center + d * cell * u])
+            acc = compute_accelerations(pm, pos, masses, p3m)
+            ratios.append(-(acc[1] @ u) / (G_REAL / (d * cell)**2))
+        rows.append((d, float(np.mean(ratios)), float(np.std(ratios))))
+    return rows
+
+@traced("pm.short_range")
+def short_range_accelerations(pos, masses, box_size, split_scale, softening=SOFTENING, with_potential=False):
+    """
+    Corrección partícula-partícula (P3M): la parte de la fuerza newtoniana que
+    la malla suavizó, solo para pares a menos de CUTOFF_RS * r_s. Con
+    with_potential devuelve (acc, phi) con el potencial de corto alcance.
+    """
+    pos = np.mod(pos, box_size)
+    n = len(masses)
+    acc = np.zeros((n, 3))
+    phi = np.zeros(n) if with_potential else None
+    rs = split_scale
+
+    for pairs in iter_pairs(pos, CUTOFF_RS * rs, box_size):
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = minimum_image(pos[j] - pos[i], box_size)
+        r2 = np.einsum('ij,ij->i', d, d)
+        r = np.sqrt(r2)
+        r_eff = np.sqrt(r2 + softening**2)
+
+        # Complemento exacto del filtro exp(-k^2 r_s^2) aplicado en la malla
+        x = r / (2 * rs)
+        shape = erfc(x) + (r / (rs * np.sqrt(np.pi))) * np.exp(-x**2)
+        factor = G_REAL * shape / r_eff**3
+
+        for k in range(3):
+            acc[:, k] += np.bincount(i, weights=factor * masses[j] * d[:, k], minlength=n)
+            acc[:, k] -= np.bincount(j, weights=factor * masses[i] * d[:, k], minlength=n)
+
+        if with_potential:
+            # Complemento del potencial de la malla: -G m erfc(r / 2 r_s) / r_eff
+            pair_phi = -G_REAL * erfc(x) / r_eff
+            phi += np.bincount(i, weights=pair_phi * masses[j], minlength=n)
+            phi += np.bincount(j, weights=pair_phi * masses[i], minlength=n)
+    return (acc, phi) if with_potential else acc
+
+@traced("pm.forces")
+def compute_accelerations(pm, pos, masses, p3m=False, with_potential=False):
+    """Aceleración total (malla + corto alcance). Con with_potential devuelve (acc, phi)."""
+    if not with_potential:
+        acc = pm.accelerations(pos, masses)
+        if p3m:
+            acc += short_range_accelerations(pos, masses, pm.box_size, pm.split_scale)
+        return acc
+
+    acc, phi = pm.accelerations(pos, masses, with_potential=True)
+    if p3m:
+        acc_sr, phi_sr = short_range_accelerations(pos, masses, pm.box_size, pm.split_scale, with_potential=True)
+        acc += acc_sr
+        phi += phi_sr
+    return acc, phi
+
+def run_pm_simulation(box_mpc=None, grid=PM_GRID, p3m=False, steps=STEPS, diagnostics_every=DIAGNOSTICS_EVERY,
+                      max_energy_drift=MAX_ENERGY_DRIFT, merge_radius=MERGE_RADIUS, merge_every=MERGE_EVERY,
+                      initial=None):
+    """initial: condiciones iniciales ya en memoria (SimulationInput, con box_size_pc en el header) en lugar de INPUT_FILE."""
+    mode = "P3M" if p3m else "PM"
+    print(f"--- INICIANDO MOTOR CPU ({mode} PERIÓDICO, malla {grid}^3) ---")
+
+    # 1. Cargar datos
+    data = open_simulation_input(INPUT_FILE) if initial is None else initial # Columnas memory-mapped (sin pickle)
+    masses = np.asarray(data['masses'], dtype=np.float64)
+    pos = np.array(data['positions'], dtype=np.float64)
+    vel = np.array(data['velocities'], dtype=np.float64)
+
+    box_size = box_mpc * 1e6 if box_mpc is not None else data.header.get('box_size_pc')
+    if box_size is None:
+        print("❌ El input no guarda box_size_pc. Indica el tamaño de la caja con --box (Mpc).")
+        return
+
+    N = len(masses)
+    pm = ParticleMesh(box_size, grid, split_scale=SPLIT_CELLS * box_size / grid if p3m else None)
+    print(f"--> {N} galaxias | Caja {box_size/1e6:.2f} Mpc | Celda {pm.cell/1e3:.1f} kpc")
+
+    # 2. Bucle Principal (mismo integrador semi-implícito que el motor Taichi)
+    metadata = {"dt": DT, "steps": steps, "softening": SOFTENING, "g": G_REAL, "snapshot_every": SNAPSHOT_EVERY,
+                "box_size_pc": box_size, "grid": grid, "p3m": p3m, "diagnostics_every": diagnostics_every}
+    if merge_radius > 0:
+        metadata.update({"merge_radius": merge_radius, "merge_every": merge_every})
+    writer = create_trajectory_writer(OUTPUT_FILE, N, np.float32, engine="particle_mesh", metadata=metadata,
+                                      encoding=TRAJ_ENCODING, precision=TRAJ_PRECISION, box_size=box_size)
+    # E, P y L junto a la trayectoria. En la caja periódica L no se conserva (y salta
+    # cuando un cuerpo cruza un borde): acá lo que importa es E y P
+    log = ConservationLog(OUTPUT_FILE) if diagnostics_every > 0 else None
+    # Fusiones: ids = ID original de cada cuerpo vivo, owner = cuerpo vivo donde está cada galaxia original
+    mergers = MergerLog(OUTPUT_FILE) if merge_radius > 0 else None
+    ids = np.arange(N)
+    owner = np.arange(N)
+
+    start_time = time.time()
+    aborted = False
+    s_end = 0
+    with writer, (log or contextlib.nullcontext()), (mergers or contextlib.nullcontext()):
+        for s in range(steps):
+            # Fusiones al inicio del paso: lo que se integra es el estado ya compactado
+            rebase = False
+            if mergers is not None and s % merge_every == 0:
+                with span("merge"):
+                    result = merge_bodies(pos, vel, masses, ids, merge_radius, box_size=box_size)
+                if result is not None:
+                    # La fusión no es error de integración: su cambio de energía se descuenta de la deriva
+                    rebase = log is not None and log.energy0 is not None
+                    if rebase:
+                        _, phi = compute_accelerations(pm, pos, masses, p3m, with_potential=True)
+                        energy_before = sum(state_diagnostics(pos, vel, masses, phi)[:2])
+                    pos, vel, masses, ids, remap, events = result
+                    owner = remap[owner]
+                    mergers.record(s, s * DT, events)
+
+            # Diagnóstico al inicio del paso: el potencial sale de la misma solución de Poisson
+            diagnose = log is not None and s % diagnostics_every == 0
+            if diagnose or rebase:
+                acc, phi = compute_accelerations(pm, pos, masses, p3m, with_potential=True)
+                if rebase:
+                    log.rebase(sum(state_diagnostics(pos, vel, masses, phi)[:2]) - energy_before)
+            else:
+                acc = compute_accelerations(pm, pos, masses, p3m)
+            if diagnose:
+                with span("diagnostics", step=s):
+                    energy_drift = log.record(s, s * DT, *state_diagnostics(pos, vel, masses, phi))
+                # Integración rota: no seguir gastando horas en ella
+                if max_energy_drift > 0 and energy_drift > max_energy_drift:
+                    print(f"\n❌ Deriva de energía {energy_drift:.3e} > {max_energy_drift:.3e} en el paso {s}. "
+                          f"Abortando la corrida.")
+                    aborted = True
+                    break
+            vel += acc * DT
+            pos += vel * DT
+            np.mod(pos, box_size, out=pos) # Condiciones de frontera periódicas (Pac-Man)
+            s_end = s + 1
+
+            if s % SNAPSHOT_EVERY == 0:
+                # Una fila por galaxia original: las absorbidas, donde está quien las absorbió
+                writer.append(pos[owner] if mergers is not None else pos, t=(s + 1) * DT)
+                print(f"\rStep {s}/{steps} completado", end="")
+
+        # Medición del estado final
+        if log is not None and not aborted and (log.last is None or log.last["step"] != s_end):
+            _, phi = compute_accelerations(pm, pos, masses, p3m, with_potential=True)
+            log.record(s_end, s_end * DT, *state_diagnostics(pos, vel, masses, phi))
+
+    end_time = time.time()
+    if aborted:
+        print(f"⚠️ Simulación {mode} abortada tras {s_end} pasos ({end_time - start_time:.2f} segundos).")
+    else:
+        print(f"\n✅ Simulación {mode} completada en {end_time - start_time:.2f} segundos.")
+        print(f"   Velocidad: {steps / (end_time - start_time):.2f} pasos/segundo")
+    if log is not None and log.last is not None:
+        print(f"   Conservación: ΔE/E0 = {log.last['energy_drift']:.3e} en el paso {log.last['step']} "
+              f"(registro en {log.path})")
+    if mergers is not None:
+        print(f"   Fusiones: {mergers.n_events} galaxias absorbidas, quedan {len(masses)} de {N} "
+              f"(registro en {mergers.path})")
+    if OUTPUT_FILE is not None:
+        print(f"--> Datos guardados en {OUTPUT_FILE}")
+
+    # Estado final (solo los vivos si hubo fusiones) y lo producido, desde disco o desde memoria
+    return {"positions": pos, "velocities": vel, "masses": masses, "aborted": aborted, "ids": ids, "owner": owner,
+            "trajectory": writer.trajectory(), "conservation": log.records() if log is not None else None,
+            "mergers": mergers.records() if mergers is not None else None}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Motor Particle-Mesh periódico - Proyecto Chimera")
+    parser.add_argument("--box", type=float, default=None, help="Tamaño de la caja en Mpc (por defecto, el del input)")
+    parser.add_argument("--grid", type=int, default=PM_GRID, help="Celdas por lado de la malla")
+    parser.add_argument("--p3m", action="store_true", help="Agregar corrección de corto alcance partícula-partícula")
+    parser.add_argument("--steps", type=int, default=STEPS, help="Número de pasos de tiempo")
+    parser.add_argument("--diagnostics-every", type=int, default=DIAGNOSTICS_EVERY,
+                        help="Pasos entre mediciones de energía y momentos (0 = desactivado)")
+    parser.add_argument("--max-energy-drift", type=float, default=MAX_ENERGY_DRIFT,
+                        help="Abortar si |E - E0| / |E0| supera este valor (0 = nunca)")
+    parser.add_argument("--merge-radius", type=float, default=MERGE_RADIUS,
+                        help="Fusionar cuerpos a menos de este radio en pc (0 = sin fusiones)")
+    parser.add_argument("--merge-every", type=int, default=MERGE_EVERY, help="Pasos entre búsquedas de fusiones")
+    parser.add_argument("--check", action="store_true",
+                        help="Comparar la fuerza de dos cuerpos (PM y P3M) contra Newton y salir")
+    parser.add_argument("--traj-encoding", choices=ENCODINGS, default=TRAJ_ENCODING,
+                        help="Codificación de la trayectoria en disco")
+    parser.add_argument("--traj-precision", type=float, default=TRAJ_PRECISION,
+                        help="Paso de cuantización relativo a la caja (--traj-encoding quantized)")
+    args = parser.parse_args()
+
+    TRAJ_ENCODING = args.traj_encoding
+    TRAJ_PRECISION = args.traj_precision
+
+    if args.check:
+        grid = min(args.grid, 64)
+        print(f"--- 🧪 FUERZA DE DOS CUERPOS / NEWTON (malla {grid}^3) ---")
+        for label, p3m in (("PM", False), ("P3M", True)):
+            rows = check_two_body(grid, p3m)
+            print(f"{label:<4} " + " | ".join(f"{d} celdas: {mean:.2f} ± {std:.2f}" for d, mean, std in rows))
+        sys.exit(0)
+
+    run_pm_simulation(box_mpc=args.box, grid=args.grid, p3m=args.p3m, steps=args.steps,
+                      diagnostics_every=args.diagnostics_every, max_energy_drift=args.max_energy_drift,
+                      merge_radius=args.merge_radius, merge_every=args.merge_every)
@@ -1,80 +1,244 @@
 """
 Proyecto Orión - Motor CPU (REBOUND Reference)
 Simulación de N-Cuerpos de alta precisión para validar colisiones.
-Usa el integrador IAS15 (adaptativo).
+Usa el integrador IAS15 (adaptativo) por defecto; también WHFast, Mercurius
+o leapfrog, gravedad por árbol y choques con fusión (--integrator, --gravity,
+--collision). El estado entra y sale en bloque (serialize_particle_data),
+sin objetos de Python por partícula.
 Autor: Chris (Rubin1)
 """
 
 import rebound
+from rebound import clibrebound
 import numpy as np
 import os
+import sys
 import time
+import argparse
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import TrajectoryWriter
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.storage.checkpoint import CheckpointManager, run_identity
 
 # --- CONFIGURACIÓN ---
-INPUT_FILE = "data/processed/simulation_input.npy"
-OUTPUT_FILE = "data/processed/trajectory_rebound.npy"
+INPUT_FILE = "data/processed/simulation_input"
+OUTPUT_FILE = "data/processed/trajectory_rebound.traj"
 SIMULATION_TIME = 500e6  # 500 Millones de años
 SNAPSHOTS = 100          # Cuántas "fotos" guardamos para la animación
+CHECKPOINT_DIR = "data/processed/checkpoints/rebound"
+CHECKPOINT_EVERY = 5     # Snapshots entre checkpoints (0 = desactivado)
 
-def run_rebound_simulation():
-    print("--- INICIANDO MOTOR CPU (REBOUND IAS15) ---")
-    
-    # 1. Cargar condiciones iniciales
-    if not os.path.exists(INPUT_FILE):
-        raise FileNotFoundError(f"No encuentro {INPUT_FILE}")
-        
-    data = np.load(INPUT_FILE, allow_pickle=True).item()
-    masses = data['masses']
-    pos = data['positions'] # en Parsecs
-    vel = data['velocities'] # en km/s
-    
-    # 2. Configurar REBOUND
+# --- MODOS DE REBOUND ---
+INTEGRATOR = "ias15"     # ias15 (adaptativo, referencia) | whfast | mercurius | leapfrog
+GRAVITY = "basic"        # basic (directa O(N^2)) | compensated | tree (Barnes-Hut O(N log N))
+COLLISION = "none"       # none | direct | tree | line | linetree (las colisiones se fusionan)
+DT_YR = 0.5e6            # Paso fijo de whfast/mercurius/leapfrog (0.5 Myr, como los otros motores)
+THETA = 0.5              # Ángulo de apertura del árbol
+COLLISION_RADIUS_PC = 5000.0  # Radio de cada galaxia para detectar choques
+ROOT_MARGIN = 4.0        # La caja del árbol mide ROOT_MARGIN veces la extensión inicial
+KM_S_TO_PC_YR = 1.022690e-6  # Rebound necesita velocidades en pc/yr, no km/s
+
+INTEGRATORS = ["ias15", "whfast", "mercurius", "leapfrog"]
+GRAVITIES = ["basic", "compensated", "tree"]
+COLLISIONS = ["none", "direct", "tree", "line", "linetree"]
+
+def build_simulation(masses, pos, vel, integrator=INTEGRATOR, gravity=GRAVITY, collision=COLLISION,
+                     theta=THETA, radius=COLLISION_RADIUS_PC, dt=DT_YR):
+    """Crea la simulación REBOUND a partir de las condiciones iniciales."""
     sim = rebound.Simulation()
     sim.units = ('Msun', 'pc', 'yr') # Masas solares, parsecs, años
+    n = len(masses)
     
-    # Añadir partículas
-    print(f"--> Cargando {len(masses)} galaxias en el integrador...")
-    for i in range(len(masses)):
-        # Rebound necesita velocidades en pc/yr, no km/s
-        # Conversión: 1 km/s ~= 1.02e-6 pc/yr
-        km_s_to_pc_yr = 1.022690e-6
-        
-        sim.add(m=masses[i],
-                x=pos[i,0], y=pos[i,1], z=pos[i,2],
-                vx=vel[i,0]*km_s_to_pc_yr, 
-                vy=vel[i,1]*km_s_to_pc_yr, 
-                vz=vel[i,2]*km_s_to_pc_yr)
+    # Reservar N partículas vacías (una sola estructura reutilizada) y copiar
+    # todo el estado de una vez desde los arreglos: cero objetos por partícula
+    print(f"--> Cargando {n} galaxias en el integrador...")
+    blank = rebound.Particle()
+    for _ in range(n):
+        sim.add(blank)
+    sim.set_serialized_particle_data(
+        m=np.ascontiguousarray(masses, dtype=np.float64),
+        xyz=np.ascontiguousarray(pos, dtype=np.float64),
+        vxvyvz=np.ascontiguousarray(vel, dtype=np.float64) * KM_S_TO_PC_YR,
+    )
 
     # Movemos al centro de masa para estabilidad numérica
     sim.move_to_com()
+
+    # El árbol se arma en el primer paso, con la caja (centrada en el origen) ya configurada
+    if gravity == "tree" or collision in ("tree", "linetree"):
+        xyz = np.empty((n, 3))
+        sim.serialize_particle_data(xyz=xyz)
+        sim.root_size = ROOT_MARGIN * 2 * np.abs(xyz).max()
+        sim.N_root_x = sim.N_root_y = sim.N_root_z = 1
+        sim.opening_angle2 = theta**2
+        sim.boundary = "open"
+    sim.gravity = gravity
+
+    if collision != "none":
+        sim.set_serialized_particle_data(r=np.full(n, radius / 2)) # Chocan al quedar a menos de 'radius'
+        sim.collision = collision
+
+    # IAS15: Lento pero preciso (maneja encuentros cercanos sin crashear)
+    # Los demás usan paso fijo: mucho más rápidos con miles de cuerpos
+    sim.integrator = integrator
+    if integrator != "ias15":
+        sim.dt = dt
+    return sim
+
+def merge_recorder(log):
+    """
+    Resolución de choques: fusión de REBOUND (conserva masa y momento) que
+    además anota (p1, p2, resultado) para seguir a qué partícula fue a parar cada galaxia.
+    """
+    def resolve(sim_pointer, collision):
+        outcome = clibrebound.reb_collision_resolve_merge(sim_pointer, collision)
+        log.append((collision.p1, collision.p2, outcome))
+        return outcome
+    return resolve
+
+def apply_merges(owner, log):
+    """
+    Actualiza owner (galaxia original -> índice actual en REBOUND) con las
+    fusiones anotadas. REBOUND borra manteniendo el orden: los índices mayores
+    al borrado bajan en uno. Devuelve cuántas fusiones hubo.
+    """
+    merges = 0
+    for p1, p2, outcome in log:
+        if outcome & 1:
+            removed, survivor = p1, p2
+        elif outcome & 2:
+            removed, survivor = p2, p1
+        else:
+            continue
+        owner[owner == removed] = survivor
+        owner[owner > removed] -= 1
+        merges += 1
+    log.clear()
+    return merges
+
+def run_rebound_simulation(resume=False, checkpoint_every=CHECKPOINT_EVERY, integrator=INTEGRATOR, gravity=GRAVITY,
+                           collision=COLLISION, theta=THETA, radius=COLLISION_RADIUS_PC, dt=DT_YR):
+    print(f"--- INICIANDO MOTOR CPU (REBOUND {integrator.upper()}, gravedad {gravity}, colisiones {collision}) ---")
     
-    # Integrador IAS15: Lento pero preciso (maneja encuentros cercanos sin crashear)
-    sim.integrator = "ias15"
+    # 1. Cargar condiciones iniciales
+    data = open_simulation_input(INPUT_FILE) # Columnas memory-mapped (sin pickle)
+    masses = data['masses']
+    pos = data['positions'] # en Parsecs
+    vel = data['velocities'] # en km/s
+    n_bodies = len(masses)
+    
+    # 2. Configurar REBOUND (o recuperar la simulación guardada, con el estado interno de IAS15)
+    # Solo se continúa un checkpoint de esta misma corrida (mismo input y configuración)
+    identity = run_identity({"masses": masses, "positions": pos, "velocities": vel}, n=n_bodies,
+                            integrator=integrator, gravity=gravity, collision=collision, theta=theta, radius=radius,
+                            dt=dt, simulation_time=SIMULATION_TIME, snapshots=SNAPSHOTS)
+    checkpoints = CheckpointManager(CHECKPOINT_DIR, identity=identity)
+    if not resume and checkpoint_every > 0:
+        checkpoints.reset() # Corrida nueva: los checkpoints de la anterior ya no sirven
+    try:
+        ckpt = checkpoints.latest() if resume else None
+    except ValueError as e:
+        print(f"❌ {e}. Corre sin --resume para empezar de cero.")
+        return
+    if resume and ckpt is None:
+        print(f"⚠️ No hay checkpoints en {CHECKPOINT_DIR}. Empezando desde cero.")
+
+    # owner[i] = índice actual (en REBOUND) de la partícula que contiene a la galaxia i
+    owner = np.arange(n_bodies)
+    if ckpt is None:
+        sim = build_simulation(masses, pos, vel, integrator, gravity, collision, theta, radius, dt)
+        start_index = 0
+        resume_frames = None
+    else:
+        sim = rebound.Simulation(ckpt['rebound_file'])
+        start_index = ckpt['step']
+        resume_frames = ckpt['meta']['n_frames']
+        owner = ckpt['arrays'].get('owner', owner)
+        print(f"--> Continuando desde el snapshot {start_index} (t = {sim.t/1e6:.1f} Myr)")
+
+    # Los punteros a funciones de Python no viajan en el binario: se vuelven a poner
+    merge_log = []
+    if collision != "none":
+        sim.collision_resolve = merge_recorder(merge_log)
     
     # 3. Bucle de Tiempo
     times = np.linspace(0, SIMULATION_TIME, SNAPSHOTS)
-    history = []
+    metadata = {"integrator": integrator, "gravity": gravity, "collision": collision,
+                "simulation_time_yr": SIMULATION_TIME, "snapshots": SNAPSHOTS}
+    if integrator != "ias15":
+        metadata["dt_yr"] = dt
+    if gravity == "tree":
+        metadata["theta"] = theta
+    if collision != "none":
+        metadata["collision_radius_pc"] = radius
+    writer = TrajectoryWriter(OUTPUT_FILE, n_bodies, np.float64, engine="rebound", metadata=metadata,
+                              resume_frames=resume_frames)
+
+    # Buffers reutilizados: REBOUND copia directo a estos arreglos (del lado de C)
+    xyz = np.empty((n_bodies, 3))
+    merges = 0
     
     start_time = time.time()
     
     print(f"--> Simulando {SIMULATION_TIME/1e6} Millones de años...")
-    for i, t in enumerate(times):
-        sim.integrate(t)
-        
-        # Guardamos posiciones actuales (N, 3)
-        positions = np.array([[p.x, p.y, p.z] for p in sim.particles])
-        history.append(positions)
-        
-        # Barra de progreso simple
-        prog = (i / SNAPSHOTS) * 100
-        print(f"\rProgreso: [{int(prog)}%] - Tiempo simulado: {t/1e6:.1f} Myr", end="")
+    with writer:
+        for i in range(start_index, SNAPSHOTS):
+            t = times[i]
+            n_before = sim.N
+            sim.integrate(t)
+
+            # Fusiones de este intervalo; si faltan partículas es que salieron de la caja del árbol
+            new_merges = apply_merges(owner, merge_log)
+            merges += new_merges
+            if sim.N != n_before - new_merges:
+                print(f"\n❌ {n_before - new_merges - sim.N} galaxias salieron de la caja del árbol. "
+                      f"Aumenta ROOT_MARGIN. Corte en t = {t/1e6:.1f} Myr.")
+                break
+            
+            # Guardamos posiciones actuales (N, 3) directo a disco
+            n = sim.N
+            sim.serialize_particle_data(xyz=xyz[:n])
+            positions = xyz if n == n_bodies else xyz[:n][owner] # Las fusionadas siguen al remanente
+            writer.append(positions, t=t)
+            
+            # Barra de progreso simple
+            prog = (i / SNAPSHOTS) * 100
+            print(f"\rProgreso: [{int(prog)}%] - Tiempo simulado: {t/1e6:.1f} Myr", end="")
+
+            # Checkpoint: binario de REBOUND + arreglos de estado
+            if checkpoint_every > 0 and (i + 1) % checkpoint_every == 0 and i + 1 < SNAPSHOTS:
+                writer.flush()
+                state_vel = np.empty((n, 3))
+                state_mass = np.empty(n)
+                sim.serialize_particle_data(vxvyvz=state_vel, m=state_mass)
+                state = {
+                    "positions": xyz[:n].copy(),
+                    "velocities": state_vel,
+                    "masses": state_mass,
+                    "owner": owner,
+                }
+                checkpoints.save(i + 1, state, meta={"time": sim.t, "n_frames": writer.n_frames}, rebound_sim=sim)
 
     end_time = time.time()
     print(f"\n✅ Simulación completada en {end_time - start_time:.2f} segundos.")
-    
-    # 4. Guardar Resultados
-    np.save(OUTPUT_FILE, np.array(history))
+    if collision != "none":
+        print(f"💥 Fusiones por colisión: {merges} ({sim.N} partículas al final)")
     print(f"--> Trayectorias guardadas en {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    run_rebound_simulation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Motor CPU (REBOUND) - Proyecto Chimera")
+    parser.add_argument("--resume", action="store_true", help="Continuar desde el último checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="Snapshots entre checkpoints (0 = desactivado)")
+    parser.add_argument("--integrator", choices=INTEGRATORS, default=INTEGRATOR, help="Integrador de REBOUND")
+    parser.add_argument("--gravity", choices=GRAVITIES, default=GRAVITY, help="Cálculo de gravedad (tree = Barnes-Hut)")
+    parser.add_argument("--collision", choices=COLLISIONS, default=COLLISION, help="Detección de choques (se fusionan)")
+    parser.add_argument("--theta", type=float, default=THETA, help="Ángulo de apertura del árbol")
+    parser.add_argument("--radius", type=float, default=COLLISION_RADIUS_PC, help="Distancia de choque (pc)")
+    parser.add_argument("--dt", type=float, default=DT_YR, help="Paso fijo en años (whfast/mercurius/leapfrog)")
+    args = parser.parse_args()
+    
+    run_rebound_simulation(resume=args.resume, checkpoint_every=args.checkpoint_every, integrator=args.integrator,
+                           gravity=args.gravity, collision=args.collision, theta=args.theta, radius=args.radius,
+                           dt=args.dt)
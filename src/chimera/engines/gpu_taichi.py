@@ -1,95 +1,773 @@
 """
 Proyecto Orión - Motor GPU (Taichi Lang)
 Simulación masiva de N-Cuerpos usando fuerza bruta paralela en GPU.
+
+Cada paso se divide en una pasada de fuerzas (lee posiciones, escribe acc)
+y pasadas de actualización que escriben en el otro buffer de posiciones:
+sin carreras entre hilos, resultados deterministas. Integrador a elegir:
+Euler semi-implícito o leapfrog kick-drift-kick (--integrator kdk).
+
+Los snapshots no frenan el bucle: se copian a un campo de staging en la GPU
+y un hilo escritor los baja a RAM y a disco mientras siguen los pasos.
+
+Con --block-steps cada cuerpo avanza con su propio paso, una potencia de dos
+de DT_MAX elegida por su aceleración (pasos de bloque jerárquicos): en cada
+sub-paso solo se calculan fuerzas para los cuerpos activos, así el tiempo se
+va en los pocos que están en encuentros cercanos.
+
+Precisión (--precision): con posiciones de ~5x10^6 pc un float32 solo resuelve
+~0.5 pc, y con pasos chicos el drift (vel * DT) se redondea. En "mixed" el
+estado (posiciones, velocidades) vive en f64 y cada paso se arma una vista
+f32 relativa al centroide inicial (origen local); los pares se calculan en
+f32 sobre esa vista y se suman por bloques de TILE_J en f32, acumulando los
+bloques en f64. "f64" es la referencia (todo en doble precisión) y "f32" el
+motor de siempre. benchmarks/precision_check.py compara las derivas de
+energía y momento de cada modo contra f64.
+
+Con --merge-radius los cuerpos que se acercan a menos de ese radio se fusionan
+(engines/merging.py): cada MERGE_EVERY pasos se buscan grupos en la CPU y los
+campos se compactan (los vivos al principio, un contador en el dispositivo
+acota todos los bucles), así N baja a medida que la corrida colapsa. La
+trayectoria conserva una fila por galaxia original (un cuerpo absorbido se
+dibuja donde está quien lo absorbió) y las absorciones van a mergers.bin.
+
+Importar el módulo no inicializa nada: Taichi arranca en la primera corrida
+(init_taichi, --arch) y las siguientes del mismo proceso lo reutilizan, igual
+que los campos y los kernels ya compilados si N y la configuración coinciden
+(_device_for). Con initial= y OUTPUT_FILE = None la corrida no lee ni escribe
+archivos (chimera/pipeline.py).
 Autor: Chris (Rubin1)
 """
 
 import taichi as ti
 import numpy as np
 import os
+import sys
 import time
+import argparse
+import contextlib
+import threading
 
-# --- INICIALIZAR GPU ---
-# arch=ti.gpu intentará usar CUDA (NVIDIA) o Vulkan automáticamente
-ti.init(arch=ti.gpu) 
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import create_trajectory_writer, ENCODINGS
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.storage.checkpoint import CheckpointManager, run_identity
+from chimera.storage.snapshot_pipeline import SnapshotPipeline, SNAPSHOT_DEPTH
+from chimera.storage.conservation_log import ConservationLog, angular_momentum_about_com
+from chimera.storage.merger_log import MergerLog
+from chimera.engines.merging import merge_bodies, representatives
+from chimera.profiling.tracer import span, gauge
 
 # --- CONFIGURACIÓN ---
-INPUT_FILE = "data/processed/simulation_input.npy"
-OUTPUT_FILE = "data/processed/trajectory_taichi.npy"
+INPUT_FILE = "data/processed/simulation_input"
+OUTPUT_FILE = "data/processed/trajectory_taichi.traj"  # None = trayectoria en memoria
+TRAJ_ENCODING = "raw"   # "raw" (sin pérdida) o "quantized" (comprimida, ~10x más chica; storage/trajectory_codec.py)
+TRAJ_PRECISION = 1e-6   # Paso de cuantización relativo a la caja (solo "quantized")
+ARCH = "gpu"         # Backend de Taichi: "gpu" (CUDA o Vulkan, lo que haya), "cpu", "cuda", "vulkan"
+ARCHS = {"gpu": ti.gpu, "cpu": ti.cpu, "cuda": ti.cuda, "vulkan": ti.vulkan}
 G_REAL = 4.30091e-3  # pc (km/s)^2 / Msun
 DT = 0.5             # Paso de tiempo (Millones de años)
 STEPS = 2000         # Cuántos pasos simulamos (Total 500 * 0.1 = 50 Myr para prueba rápida)
 SOFTENING = 10.0    # Parsecs (para evitar que la fuerza sea infinita si chocan)
+SNAPSHOT_EVERY = 5   # Guardar un cuadro cada tantos pasos
+CHECKPOINT_DIR = "data/processed/checkpoints/taichi"
+CHECKPOINT_EVERY = 100  # Pasos entre checkpoints (0 = desactivado)
 
-def run_taichi_simulation():
-    print("--- INICIANDO MOTOR GPU (TAICHI CUDA) ---")
-    
-    # 1. Cargar datos
-    data = np.load(INPUT_FILE, allow_pickle=True).item()
-    masses_np = data['masses'].astype(np.float32)
-    pos_np = data['positions'].astype(np.float32) # (N, 3)
-    vel_np = data['velocities'].astype(np.float32) # (N, 3)
-    
-    N = len(masses_np)
-    print(f"--> Cargando {N} galaxias en la VRAM de la RTX 3060...")
+# --- PASOS DE BLOQUE (--block-steps) ---
+DT_MAX = 4 * DT      # Paso más largo (rung 0). Tiene que ser DT * 2^k
+MAX_RUNG = 8         # El rung r avanza con DT_MAX / 2^r (el más fino: DT / 64)
+ETA = 0.5            # Criterio de paso: dt_i = ETA * sqrt(SOFTENING / |a_i|)
 
-    # 2. Reservar memoria en la GPU (Taichi Fields)
-    # Vector de 3 dimensiones para Posición y Velocidad
-    pos = ti.Vector.field(3, dtype=ti.f32, shape=N)
-    vel = ti.Vector.field(3, dtype=ti.f32, shape=N)
-    mass = ti.field(dtype=ti.f32, shape=N)
-    
-    # Copiar datos de RAM (CPU) a VRAM (GPU)
-    pos.from_numpy(pos_np)
-    vel.from_numpy(vel_np)
-    mass.from_numpy(masses_np)
+# --- INTEGRADOR ---
+INTEGRATOR = "euler"  # "euler" (semi-implícito, 1er orden) o "kdk" (leapfrog, 2do orden)
+TILE_J = 128          # Cuerpos 'j' por bloque en la pasada de fuerzas (= hilos por bloque en GPU)
+
+# --- PRECISIÓN ---
+PRECISION = "f32"     # "f32" (todo simple), "mixed" (estado f64, pares f32) o "f64" (referencia)
+PRECISIONS = ["f32", "mixed", "f64"]
+
+# --- DIAGNÓSTICOS DE CONSERVACIÓN ---
+DIAGNOSTICS_EVERY = 50   # Pasos entre mediciones de E, P y L (0 = desactivado)
+MAX_ENERGY_DRIFT = 0.0   # Abortar si |E - E0| / |E0| pasa de esto (0 = nunca abortar)
+N_STATS = 11             # Cinética, potencial, P[3], sum m r[3], L[3]
+
+# --- FUSIONES EN EL MOTOR ---
+MERGE_RADIUS = 0.0  # Parsecs: los cuerpos más cerca que esto se fusionan (0 = desactivado)
+MERGE_EVERY = 10    # Pasos entre búsquedas de fusiones (y compactaciones)
+
+# --- REUTILIZACIÓN ENTRE CORRIDAS (mismo proceso) ---
+DEVICE_CACHE = 4    # Configuraciones (N, precisión, integrador...) cuyos campos y kernels compilados se guardan
+
+_taichi_arch = None  # Backend con el que ya se inicializó Taichi (None = todavía no)
+
+def init_taichi(arch=None):
+    """
+    Inicializa Taichi la primera vez que hace falta (no al importar). Las
+    llamadas siguientes no cuestan nada, salvo que se pida otro backend.
+    """
+    global _taichi_arch
+    arch = arch or ARCH
+    if _taichi_arch == arch:
+        return
+    with span("taichi.init", arch=arch):
+        # arch=ti.gpu intentará usar CUDA (NVIDIA) o Vulkan automáticamente
+        ti.init(arch=ARCHS[arch])
+    _taichi_arch = arch
+    _devices.clear()  # ti.init reinicia el runtime: los campos y kernels anteriores ya no existen
+
+_devices = {}  # Clave -> (campos y kernels, árbol de campos)
+
+def _device_key(N, N_frame, precision, kdk, merging):
+    # Todo lo que los kernels fijan al compilarse: misma clave -> mismos kernels y campos
+    return (_taichi_arch, N, N_frame, precision, kdk, merging, G_REAL, SOFTENING, TILE_J, DT_MAX, MAX_RUNG, ETA,
+            SNAPSHOT_DEPTH)
+
+def _device_for(N, N_frame, precision, kdk, merging):
+    """
+    Campos y kernels para N cuerpos con esta configuración. Los kernels fijan N,
+    los dtypes y las constantes del módulo al compilarse, así que se guardan los
+    de hasta DEVICE_CACHE configuraciones: otra corrida con la misma clave
+    (miles de corridas chicas en el mismo proceso, chimera/pipeline.py) no
+    reserva memoria ni recompila. Al llegar una más, se liberan todas
+    destruyendo sus árboles de campos.
+    """
+    key = _device_key(N, N_frame, precision, kdk, merging)
+    if key in _devices:
+        return _devices[key][0]
+    if len(_devices) >= max(1, DEVICE_CACHE):
+        # Se liberan todas juntas: en Taichi 1.7 (LLVM), destruir un árbol y dejar otros vivos
+        # hace que, tras un kernel lanzado desde otro hilo (la bajada del escritor), destroy()
+        # de los que quedan falle (delete_snode_tree). Sin árboles vivos no pasa
+        for _, tree in _devices.values():
+            tree.destroy()
+        _devices.clear()
+    with span("engine.alloc_fields", n=N):
+        device, tree = _build_device(N, N_frame, precision, kdk, merging)
+        # La bajada corre en el hilo escritor: compilada allá, destroy() del árbol falla
+        # (el backend LLVM guarda estado por hilo). Se compila acá, una vez por slot
+        for slot in device["staging"]:
+            device["download"](slot, np.empty((N_frame, 3), dtype=np.float32))
+    _devices[key] = (device, tree)
+    return device
+
+def _build_device(N, N_frame, precision, kdk, merging):
+    """Reserva los campos (en un árbol propio, para poder liberarlo) y define los kernels sobre ellos."""
+    mixed = precision == "mixed"
+    real = ti.f32 if precision == "f32" else ti.f64  # Estado: posiciones, velocidades, aceleraciones
+    pair = ti.f64 if precision == "f64" else ti.f32  # Cálculo de cada par en la pasada de fuerzas
+    ticks_per_block = 2**MAX_RUNG
+    fb = ti.FieldsBuilder()
+
+    def field(dtype, shape=None, vector=False):
+        f = ti.Vector.field(3, dtype=dtype) if vector else ti.field(dtype=dtype)
+        if shape is None:
+            fb.place(f)  # Escalar (shape=())
+        else:
+            fb.dense(ti.i, shape).place(f)
+        return f
+
+    # 2. Memoria en la GPU (Taichi Fields)
+    # Posiciones con doble buffer: el paso lee de uno y escribe en el otro
+    pos = [field(real, N, vector=True) for _ in range(2)]
+    vel = field(real, N, vector=True)
+    acc = field(real, N, vector=True)
+    mass = field(pair, N)
+
+    # Precisión mixta: vista f32 de las posiciones relativa a un origen local (el
+    # centroide inicial), rearmada antes de cada pasada de fuerzas. Cerca del
+    # origen el f32 resuelve mucho mejor que con coordenadas absolutas de la caja
+    view = field(ti.f32, N, vector=True) if mixed else None
+    origin = field(ti.f64, vector=True)
+
+    # Potencial por cuerpo (solo en las pasadas con diagnóstico) y sumas de la reducción
+    phi = field(real, N)
+    stats = field(ti.f64, N_STATS)
+
+    # Fusiones: cuántos cuerpos siguen vivos y en qué slot está cada galaxia original
+    n_live = field(ti.i32)
+    owner = field(ti.i32, N_frame) if merging else None
+
+    # Pasos de bloque: rung de cada cuerpo e índices de los activos en cada tick
+    rung = field(ti.i32, N)
+    active = field(ti.i32, N)
+    n_active = field(ti.i32)
+    top = field(ti.i32)
+
+    # Snapshots: slots de staging (con fusiones, una fila por galaxia original)
+    staging = [field(ti.f32, N_frame, vector=True) for _ in range(SNAPSHOT_DEPTH)]
+    tree = fb.finalize()
+
+    @ti.func
+    def n_bodies():
+        # Sin fusiones el límite es la constante N (los kernels quedan exactamente como siempre)
+        n = N
+        if ti.static(merging):
+            n = n_live[None]
+        return n
 
-    # 3. El Kernel Físico (Esto corre en paralelo en miles de hilos)
     @ti.kernel
-    def compute_step():
-        # Paralelización automática sobre 'i'
-        for i in range(N):
-            force = ti.Vector([0.0, 0.0, 0.0])
-            p_i = pos[i]
-            
-            # Bucle interno: Sumar fuerza de todas las otras 'j'
-            # Aquí está el sudor: 10,000 x 10,000 iteraciones
-            for j in range(N):
+    def refresh_view(src: ti.template(), dst: ti.template()):
+        for i in range(n_bodies()):
+            dst[i] = ti.cast(src[i] - origin[None], ti.f32)
+
+    # 3. Los Kernels Físicos (Esto corre en paralelo en miles de hilos)
+    # Pasada de fuerzas: solo lee posiciones y solo escribe acc -> sin carreras,
+    # el resultado no depende del orden de los hilos.
+    @ti.func
+    def gravity_on(i, src: ti.template(), with_potential: ti.template()):
+        total = ti.Vector([0.0, 0.0, 0.0], dt=real)
+        total_phi = ti.cast(0.0, real)
+        p_i = src[i]
+        # Bucle interno por bloques de 'j': los hilos vecinos recorren el mismo
+        # bloque a la vez, así cada pos[j] se lee una vez de memoria y el resto sale de caché
+        force = ti.Vector([0.0, 0.0, 0.0], dt=pair)
+        potential = ti.cast(0.0, pair)
+        # Constantes en la precisión de los pares (un literal suelto sería f32 también en modo f64)
+        g = pair(G_REAL)
+        eps2 = pair(SOFTENING**2)
+        n = n_bodies()
+        for t in range((n + TILE_J - 1) // TILE_J):
+            j0 = t * TILE_J
+            for j in range(j0, ti.min(j0 + TILE_J, n)):
                 if i != j:
-                    diff = pos[j] - p_i
-                    r = diff.norm()
+                    diff = src[j] - p_i
                     # Gravedad suavizada (Plummer model simplificado)
                     # F = G * m1 * m2 / (r^2 + e^2)
-                    r_eff = ti.sqrt(r**2 + SOFTENING**2)
-                    factor = G_REAL * mass[j] / (r_eff**3)
-                    force += factor * diff
-            
-            # Integración Semi-Implícita de Euler
-            vel[i] += force * DT
-            pos[i] += vel[i] * DT
+                    r_eff = ti.sqrt(diff.norm_sqr() + eps2)
+                    force += g * mass[j] / (r_eff**3) * diff
+                    if ti.static(with_potential):
+                        # Potencial de Plummer del mismo par (ya tenemos r_eff): casi gratis
+                        potential -= g * mass[j] / r_eff
+            if ti.static(mixed):
+                # Suma del bloque en f32, acumulada en f64
+                total += ti.cast(force, ti.f64)
+                force = ti.Vector([0.0, 0.0, 0.0], dt=pair)
+                if ti.static(with_potential):
+                    total_phi += ti.cast(potential, ti.f64)
+                    potential = 0.0
+        if ti.static(not mixed):
+            total = force
+            total_phi = potential
+        if ti.static(with_potential):
+            phi[i] = total_phi
+        return total
 
-    # 4. Bucle Principal
-    history = [] # Guardaremos en RAM para no saturar la VRAM
+    @ti.kernel
+    def compute_forces(src: ti.template(), with_potential: ti.template()):
+        ti.loop_config(block_dim=TILE_J)
+        for i in range(n_bodies()):
+            acc[i] = gravity_on(i, src, with_potential)
+
+    # Pasadas de actualización: cada hilo toca solo su propio cuerpo
+    @ti.kernel
+    def kick(dt: real):
+        for i in range(n_bodies()):
+            vel[i] += acc[i] * dt
+
+    @ti.kernel
+    def drift(src: ti.template(), dst: ti.template(), dt: real):
+        for i in range(n_bodies()):
+            dst[i] = src[i] + vel[i] * dt
+
+    # 3a. Diagnósticos de conservación: reducción en el dispositivo a N_STATS números
+    @ti.kernel
+    def reduce_stats(src: ti.template()):
+        for k in range(N_STATS):
+            stats[k] = 0.0
+        for i in range(n_bodies()):
+            m = ti.cast(mass[i], ti.f64)
+            v = ti.cast(vel[i], ti.f64)
+            r = ti.cast(src[i], ti.f64) - origin[None]
+            stats[0] += 0.5 * m * v.dot(v)
+            stats[1] += 0.5 * m * ti.cast(phi[i], ti.f64)  # 1/2: cada par aparece dos veces
+            l = m * r.cross(v)
+            for k in ti.static(range(3)):
+                stats[2 + k] += m * v[k]
+                stats[5 + k] += m * r[k]
+                stats[8 + k] += l[k]
+
+    # 3b. Pasos de bloque jerárquicos
+    @ti.kernel
+    def collect_active(tick: ti.i32) -> ti.i32:
+        # Un cuerpo está activo cuando el tick cae justo al final de su paso
+        n_active[None] = 0
+        for i in range(N):
+            if tick % (ticks_per_block >> rung[i]) == 0:
+                k = ti.atomic_add(n_active[None], 1)
+                active[k] = i
+        return n_active[None]
+
+    @ti.kernel
+    def active_forces(src: ti.template()):
+        for k in range(n_active[None]):
+            i = active[k]
+            acc[i] = gravity_on(i, src, False)
+
+    @ti.kernel
+    def kick_active(tick: ti.i32, first: ti.i32):
+        for k in range(n_active[None]):
+            i = active[k]
+            a = acc[i].norm()
+            dt_old = DT_MAX / (1 << rung[i])
+
+            # Rung pedido por el criterio de aceleración: DT_MAX / 2^r <= ETA * sqrt(eps / |a|)
+            r = 0
+            if a > 0:
+                r = ti.cast(ti.ceil(ti.log(DT_MAX / (ETA * ti.sqrt(SOFTENING / a))) / ti.log(2.0)), ti.i32)
+            r = ti.max(0, ti.min(r, MAX_RUNG))
+
+            # Achicar el paso se puede siempre; agrandarlo solo si el tick está alineado con el paso nuevo
+            while r < rung[i] and tick % (ticks_per_block >> r) != 0:
+                r += 1
+            rung[i] = r
+            dt_new = DT_MAX / (1 << r)
+
+            if ti.static(kdk):
+                # KDK jerárquico: medio kick que cierra el paso viejo + medio kick que abre el nuevo
+                if first:
+                    dt_old = 0.0
+                vel[i] += acc[i] * (0.5 * (dt_old + dt_new))
+            else:
+                # Mismo Euler semi-implícito, con el paso propio del cuerpo
+                vel[i] += acc[i] * dt_new
+
+    @ti.kernel
+    def finest_rung() -> ti.i32:
+        top[None] = 0
+        for i in range(N):
+            ti.atomic_max(top[None], rung[i])
+        return top[None]
+
+    # 3c. Snapshots: copia GPU -> GPU al slot de staging y bajada a un buffer de host
+    @ti.kernel
+    def stage(src: ti.template(), dst: ti.template()):
+        for i in range(N_frame):
+            if ti.static(merging):
+                dst[i] = ti.cast(src[owner[i]], ti.f32)
+            else:
+                dst[i] = ti.cast(src[i], ti.f32)
+
+    @ti.kernel
+    def download(src: ti.template(), out: ti.types.ndarray()):
+        for i in range(N_frame):
+            for k in ti.static(range(3)):
+                out[i, k] = src[i][k]
+
+    device = {"pos": pos, "vel": vel, "acc": acc, "mass": mass, "view": view, "origin": origin, "phi": phi,
+              "stats": stats, "n_live": n_live, "owner": owner, "rung": rung, "staging": staging,
+              "refresh_view": refresh_view, "compute_forces": compute_forces, "kick": kick, "drift": drift,
+              "reduce_stats": reduce_stats, "collect_active": collect_active, "active_forces": active_forces,
+              "kick_active": kick_active, "finest_rung": finest_rung, "stage": stage, "download": download}
+    return device, tree
+
+def run_taichi_simulation(resume=False, checkpoint_every=CHECKPOINT_EVERY, block_steps=False, integrator=INTEGRATOR,
+                          precision=PRECISION, diagnostics_every=DIAGNOSTICS_EVERY, max_energy_drift=MAX_ENERGY_DRIFT,
+                          merge_radius=MERGE_RADIUS, merge_every=MERGE_EVERY, arch=None, initial=None):
+    """initial: condiciones iniciales ya en memoria (dict con masses/positions/velocities) en lugar de INPUT_FILE."""
+    print(f"--- INICIANDO MOTOR GPU (TAICHI CUDA, {integrator.upper()}, {precision}) ---")
+    if merge_radius > 0 and block_steps:
+        # Con pasos de bloque los cuerpos lentos están a mitad de su paso en cada DT: no hay un estado común que fusionar
+        print("❌ Las fusiones en el motor (--merge-radius) no se pueden combinar con --block-steps.")
+        return None
+    kdk = integrator == "kdk"
+    mixed = precision == "mixed"
+    real_np = np.float32 if precision == "f32" else np.float64
+
+    init_taichi(arch)
+
+    # 1. Cargar datos
+    with span("engine.load"):
+        data = open_simulation_input(INPUT_FILE) if initial is None else initial # Columnas memory-mapped (sin pickle)
+        masses_np = data['masses'].astype(real_np)
+        pos_np = data['positions'].astype(real_np) # (N, 3)
+        vel_np = data['velocities'].astype(real_np) # (N, 3)
+
+    # ¿Continuar desde un checkpoint? Reemplaza el estado inicial por el guardado. Solo
+    # si es de esta misma corrida: mismas condiciones iniciales y misma configuración
+    config = {"n": len(masses_np), "integrator": integrator, "precision": precision, "block_steps": bool(block_steps),
+              "merge_radius": float(merge_radius), "merge_every": int(merge_every), "dt": DT,
+              "softening": SOFTENING, "snapshot_every": SNAPSHOT_EVERY}
+    if block_steps:
+        config.update(dt_max=DT_MAX, max_rung=MAX_RUNG, eta=ETA)
+    identity = run_identity({"masses": data['masses'], "positions": data['positions'],
+                             "velocities": data['velocities']}, **config)
+    checkpoints = CheckpointManager(CHECKPOINT_DIR, identity=identity)
+    if not resume and checkpoint_every > 0:
+        checkpoints.reset() # Corrida nueva: los checkpoints de la anterior ya no sirven
+    start_step = 0
+    resume_frames = None
+    rungs_np = None
+    owner_np = None   # Mapa de IDs (solo con fusiones): galaxia original -> slot compacto
+    energy0 = None
+    if resume:
+        try:
+            ckpt = checkpoints.latest()
+        except ValueError as e:
+            print(f"❌ {e}. Corre sin --resume para empezar de cero.")
+            return None
+        if ckpt is None:
+            print(f"⚠️ No hay checkpoints en {CHECKPOINT_DIR}. Empezando desde cero.")
+        else:
+            pos_np = ckpt['arrays']['positions']
+            vel_np = ckpt['arrays']['velocities']
+            masses_np = ckpt['arrays']['masses']
+            rungs_np = ckpt['arrays'].get('rungs')
+            owner_np = ckpt['arrays'].get('owner')
+            energy0 = ckpt['meta'].get('energy0')
+            start_step = ckpt['step']
+            resume_frames = ckpt['meta']['n_frames']
+            print(f"--> Continuando desde el paso {start_step} (t = {ckpt['meta']['time']:.1f})")
     
-    print(f"--> Comenzando cálculo de fuerza bruta ({N}^2 interacciones por paso)...")
+    N = len(masses_np)
+    print(f"--> Cargando {N} galaxias en la VRAM de la RTX 3060...")
+
+    # Con fusiones, N es la capacidad de los campos y n_live cuántos siguen vivos (los
+    # primeros n_live slots); los cuadros siguen teniendo una fila por galaxia original
+    merging = merge_radius > 0 or owner_np is not None
+    if merging:
+        owner_np = np.arange(N, dtype=np.int64) if owner_np is None else np.asarray(owner_np, dtype=np.int64)
+        ids_np = representatives(owner_np)
+    N_frame = len(owner_np) if merging else N
+
+    # 2. Campos y kernels en la GPU: los de la corrida anterior si la configuración coincide
+    device = _device_for(N, N_frame, precision, kdk, merging)
+    pos, vel, acc, mass, view, origin, phi, stats, n_live, owner, rung, staging = (
+        device[k] for k in ("pos", "vel", "acc", "mass", "view", "origin", "phi", "stats", "n_live", "owner",
+                            "rung", "staging"))
+    refresh_view, compute_forces, kick, drift, reduce_stats = (
+        device[k] for k in ("refresh_view", "compute_forces", "kick", "drift", "reduce_stats"))
+    collect_active, active_forces, kick_active, finest_rung, stage, download = (
+        device[k] for k in ("collect_active", "active_forces", "kick_active", "finest_rung", "stage", "download"))
+    cur = 0  # Índice del buffer con las posiciones vigentes
+
+    # Copiar datos de RAM (CPU) a VRAM (GPU). Lo que no se copia se pone en cero:
+    # un campo reutilizado arranca igual que uno recién reservado
+    with span("engine.from_numpy", sync=ti.sync):
+        pos[cur].from_numpy(pos_np.astype(real_np))
+        vel.from_numpy(vel_np.astype(real_np))
+        mass.from_numpy(masses_np.astype(np.float64 if precision == "f64" else np.float32))
+        for f in (pos[1 - cur], acc, phi) + ((view,) if mixed else ()):
+            f.fill(0)
+    origin.from_numpy(np.asarray(pos_np, dtype=np.float64).mean(axis=0))
+    n_live[None] = N
+    if merging:
+        owner.from_numpy(owner_np.astype(np.int32))
+
+    def forces_of(src):
+        """Fuente de la pasada de fuerzas: las posiciones mismas o su vista f32 (precisión mixta)."""
+        if mixed:
+            with span("refresh_view", sync=ti.sync):
+                refresh_view(src, view)
+            return view
+        return src
+
+    # Con el trazado activo cada pasada espera al dispositivo (ti.sync) para que su
+    # span mida el kernel y no solo el lanzamiento; apagado, se lanzan como siempre
+    def forces(src, with_potential):
+        src = forces_of(src)
+        with span("forces", sync=ti.sync):
+            compute_forces(src, with_potential)
+
+    # 3a. Diagnósticos de conservación: el potencial sale de la misma pasada de
+    # fuerzas y una reducción en el dispositivo junta todo en N_STATS números
+    # (a la RAM solo baja eso, nunca las posiciones)
+    total_mass = float(np.sum(masses_np, dtype=np.float64))
+
+    def measure(step, t):
+        """Reduce el estado actual (phi ya calculado) y lo agrega al registro. Devuelve la deriva de energía."""
+        with span("diagnostics", step=step):
+            reduce_stats(pos[cur])
+            s = stats.to_numpy()
+            momentum = s[2:5]
+            angular = angular_momentum_about_com(s[8:11], s[5:8], momentum, total_mass)
+            energy_drift = log.record(step, t, s[0], s[1], momentum, angular)
+        gauge("energy_drift", energy_drift)
+        return energy_drift
+
+    def global_step(s, diagnose=False):
+        """
+        Avanza todos los cuerpos un DT y alterna los buffers de posición. Con
+        diagnose, la pasada de fuerzas también calcula el potencial y se mide
+        el estado en el que posiciones y velocidades están sincronizadas:
+        Euler antes del kick (estado al inicio del paso), KDK al final.
+        Devuelve la deriva de energía medida (o None).
+        """
+        nonlocal cur
+        drift_e = None
+        if kdk:
+            # Leapfrog KDK: acc ya tiene las fuerzas de las posiciones actuales
+            with span("kick", sync=ti.sync):
+                kick(0.5 * DT)
+            with span("drift", sync=ti.sync):
+                drift(pos[cur], pos[1 - cur], DT)
+            cur = 1 - cur
+            forces(pos[cur], diagnose)
+            with span("kick", sync=ti.sync):
+                kick(0.5 * DT)
+            if diagnose:
+                drift_e = measure(s + 1, (s + 1) * DT)
+        else:
+            # Euler semi-implícito (mismo esquema de siempre, ahora sin carreras)
+            forces(pos[cur], diagnose)
+            if diagnose:
+                drift_e = measure(s, s * DT)
+            with span("kick", sync=ti.sync):
+                kick(DT)
+            with span("drift", sync=ti.sync):
+                drift(pos[cur], pos[1 - cur], DT)
+            cur = 1 - cur
+        return drift_e
+
+    # 3b. Pasos de bloque jerárquicos: el tiempo se mide en "ticks" del paso más fino
+    ticks_per_block = 2**MAX_RUNG
+    ticks_per_dt = int(round(ticks_per_block * DT / DT_MAX))
+    dt_fine = DT_MAX / ticks_per_block
+
+    # Sin rungs guardados todos arrancan en el más fino: activos ya y libres de elegir su paso
+    fresh_start = rungs_np is None
+    rung.from_numpy(np.full(N, MAX_RUNG, dtype=np.int32) if fresh_start else rungs_np.astype(np.int32))
+
+    def block_step(tick):
+        """Avanza un DT completo. Devuelve el tick final y cuántas fuerzas se evaluaron."""
+        nonlocal cur, fresh_start
+        end = tick + ticks_per_dt
+        evaluated = 0
+        while tick < end:
+            n = collect_active(tick)
+            gauge("active_bodies", n)
+            if n:
+                src = forces_of(pos[cur])
+                with span("forces.active", sync=ti.sync, n=n):
+                    active_forces(src)
+                with span("kick", sync=ti.sync):
+                    kick_active(tick, int(fresh_start))
+                fresh_start = False
+                evaluated += n
+            # Saltar directo al próximo tick en que alguien esté activo (sin pasarse del DT)
+            # Todos los cuerpos se mueven en cada sub-paso: las posiciones siempre están sincronizadas
+            interval = ticks_per_block >> finest_rung()
+            stride = min(interval - tick % interval, end - tick)
+            with span("drift", sync=ti.sync):
+                drift(pos[cur], pos[1 - cur], stride * dt_fine)
+            cur = 1 - cur
+            tick += stride
+        return tick, evaluated
+
+    # 3c. Snapshots asíncronos: copia GPU -> GPU a un slot de staging (no espera a nadie);
+    # el hilo escritor baja el slot a un buffer de host reutilizado y lo escribe a disco
+    # Con fusiones el cuadro se arma por el mapa de IDs: fila i = slot donde vive la galaxia i
+    # Taichi no admite llamadas desde dos hilos a la vez: los kernels del bucle y la
+    # bajada del hilo escritor se turnan con este lock (la escritura a disco queda afuera)
+    device_lock = threading.Lock()
+
+    def fetch(slot, out):
+        download(staging[slot], out)
+
+    # 3d. Fusiones: el estado baja a la CPU, se agrupa con FoF y vuelve compactado
+    mass_np = np.float64 if precision == "f64" else np.float32
+
+    def energy_now():
+        """Energía total del estado actual (pasada de fuerzas con potencial + reducción)."""
+        forces(pos[cur], True)
+        reduce_stats(pos[cur])
+        s = stats.to_numpy()
+        return s[0] + s[1]
+
+    def merge_step(step):
+        """Fusiona los cuerpos a menos de merge_radius y compacta los campos. Devuelve cuántos se absorbieron."""
+        nonlocal owner_np, ids_np
+        n = n_live[None]
+        result = merge_bodies(pos[cur].to_numpy()[:n], vel.to_numpy()[:n], mass.to_numpy()[:n], ids_np, merge_radius)
+        if result is None:
+            return 0
+        new_pos, new_vel, new_masses, ids_np, remap, events = result
+        # La fusión no es error de integración: su cambio de energía se descuenta de la deriva
+        rebase = log is not None and log.energy0 is not None
+        energy_before = energy_now() if rebase else None
+
+        # Vivos al principio; la cola no se lee nunca (todos los bucles van hasta n_live)
+        n = len(new_masses)
+        for field, values, dtype in ((pos[cur], new_pos, real_np), (vel, new_vel, real_np), (mass, new_masses, mass_np)):
+            padded = np.zeros((N,) + values.shape[1:], dtype=dtype)
+            padded[:n] = values
+            field.from_numpy(padded)
+        n_live[None] = n
+        owner_np = remap[owner_np]
+        owner.from_numpy(owner_np.astype(np.int32))
+        mergers.record(step, step * DT, events)
+        gauge("live_bodies", n)
+
+        if rebase:
+            log.rebase(energy_now() - energy_before) # Deja en acc las fuerzas del estado fusionado
+        elif kdk:
+            forces(pos[cur], False) # El próximo medio kick usa acc: tiene que ser del estado fusionado
+        return len(events)
+
+    # 4. Bucle Principal
+    # Cada snapshot va directo a disco (nada de acumular el historial en RAM)
+    metadata = {"dt": DT, "steps": STEPS, "softening": SOFTENING, "g": G_REAL, "snapshot_every": SNAPSHOT_EVERY,
+                "integrator": integrator, "precision": precision, "diagnostics_every": diagnostics_every}
+    if block_steps:
+        metadata.update({"block_steps": True, "dt_max": DT_MAX, "max_rung": MAX_RUNG, "eta": ETA})
+    if merging:
+        metadata.update({"merge_radius": merge_radius, "merge_every": merge_every})
+    writer = create_trajectory_writer(OUTPUT_FILE, N_frame, np.float32, engine="taichi", metadata=metadata,
+                                      resume_frames=resume_frames, encoding=TRAJ_ENCODING, precision=TRAJ_PRECISION,
+                                      box_size=data.header.get("box_size_pc"))
+    # Serie de E, P y L dentro del directorio de la trayectoria
+    log = None
+    resume_step = start_step if resume_frames is not None else None
+    if diagnostics_every > 0:
+        log = ConservationLog(OUTPUT_FILE, resume_step=resume_step, energy0=energy0)
+    # Absorciones (ID sobreviviente, ID absorbido, masas...) también dentro de la trayectoria
+    mergers = MergerLog(OUTPUT_FILE, resume_step=resume_step) if merge_radius > 0 else None
+
+    if block_steps:
+        print(f"--> Pasos de bloque: DT_MAX = {DT_MAX} -> DT_MAX/2^{MAX_RUNG} = {dt_fine:.2e} (fuerzas solo para los activos)")
+    else:
+        print(f"--> Comenzando cálculo de fuerza bruta ({N}^2 interacciones por paso)...")
     start_time = time.time()
-    
-    for s in range(STEPS):
-        compute_step() # <--- La magia ocurre aquí
-        
-        # Sincronizar GPU y guardar snapshot cada 5 pasos para no llenar el disco
-        if s % 5 == 0:
-            ti.sync() # Esperar a que la GPU termine
-            history.append(pos.to_numpy())
-            print(f"\rStep {s}/{STEPS} completado", end="")
+    tick = start_step * ticks_per_dt
+    evaluated = 0
+    # Euler mide al inicio del paso (dentro de la pasada de fuerzas); KDK y los pasos de bloque, al final
+    measure_at_start = not kdk and not block_steps
+    if mergers is not None and start_step == 0:
+        with span("merge"):
+            merge_step(0) # Pares que ya arrancan dentro del radio
+    initial_measure = log is not None and not measure_at_start and start_step % diagnostics_every == 0
+    if kdk and not block_steps:
+        forces(pos[cur], initial_measure) # El primer medio kick necesita las fuerzas iniciales
+    elif initial_measure:
+        forces(pos[cur], True)
+    if initial_measure:
+        measure(start_step, start_step * DT)
+
+    aborted = False
+    s_end = start_step
+    pipeline = SnapshotPipeline(writer, (N_frame, 3), fetch, fetch_dtype=np.float32, lock=device_lock)
+    with writer, pipeline, (log or contextlib.nullcontext()), (mergers or contextlib.nullcontext()):
+        for s in range(start_step, STEPS):
+            # Guardar snapshot cada 5 pasos para no llenar el disco.
+            # El slot se pide antes del paso: si el disco va atrasado, acá se espera (back-pressure)
+            snapshot = s % SNAPSHOT_EVERY == 0
+            slot = pipeline.acquire() if snapshot else None
+            diagnose = log is not None and (s if measure_at_start else s + 1) % diagnostics_every == 0
+
+            with device_lock, span("step", step=s):
+                if block_steps:
+                    tick, n = block_step(tick)
+                    evaluated += n
+                    energy_drift = None
+                    if diagnose:
+                        # Pasada completa aparte (las fuerzas de los inactivos no se usan: se pisan sin problema)
+                        forces(pos[cur], True)
+                        energy_drift = measure(s + 1, (s + 1) * DT)
+                else:
+                    energy_drift = global_step(s, diagnose) # <--- La magia ocurre aquí
+                if mergers is not None and (s + 1) % merge_every == 0:
+                    with span("merge"):
+                        merge_step(s + 1)
+                if snapshot:
+                    with span("snapshot.stage", sync=ti.sync):
+                        stage(pos[cur], staging[slot])
+
+            if snapshot:
+                pipeline.submit(slot, t=(s + 1) * DT)
+                print(f"\rStep {s}/{STEPS} completado", end="")
+            s_end = s + 1
+
+            # Integración rota: no seguir gastando horas en ella
+            if energy_drift is not None and max_energy_drift > 0 and energy_drift > max_energy_drift:
+                print(f"\n❌ Deriva de energía {energy_drift:.3e} > {max_energy_drift:.3e} en el paso {log.last['step']}. "
+                      f"Abortando la corrida.")
+                aborted = True
+                break
+
+            # Checkpoint: estado completo + cuántos cuadros ya están en disco
+            if checkpoint_every > 0 and (s + 1) % checkpoint_every == 0 and s + 1 < STEPS:
+                with span("checkpoint", step=s + 1):
+                    pipeline.drain() # Todos los cuadros encolados tienen que estar escritos
+                    writer.flush()
+                    meta = {"time": (s + 1) * DT, "n_frames": writer.n_frames, "integrator": integrator,
+                            "precision": precision}
+                    with device_lock:
+                        n = n_live[None] # Con fusiones solo se guardan los vivos (más el mapa de IDs)
+                        state = {"positions": pos[cur].to_numpy()[:n], "velocities": vel.to_numpy()[:n],
+                                 "masses": mass.to_numpy()[:n]}
+                        if block_steps:
+                            state["rungs"] = rung.to_numpy() # Los cuerpos lentos pueden estar a mitad de su paso
+                    if merging:
+                        state["owner"] = owner_np
+                        if log is not None:
+                            meta["energy0"] = log.energy0 # Incluye el descuento de las fusiones
+                    checkpoints.save(s + 1, state, meta=meta)
+
+        # Medición del estado final (si la cadencia no cayó justo ahí)
+        if log is not None and not aborted and (log.last is None or log.last["step"] != s_end):
+            with device_lock:
+                forces(pos[cur], True)
+                measure(s_end, s_end * DT)
 
     end_time = time.time()
-    print(f"\n✅ Simulación GPU completada en {end_time - start_time:.2f} segundos.")
-    print(f"   Velocidad: {STEPS / (end_time - start_time):.1f} pasos/segundo")
-    
-    # 5. Guardar
-    np.save(OUTPUT_FILE, np.array(history))
-    print(f"--> Datos guardados en {OUTPUT_FILE}")
+    steps_done = s_end - start_step
+    if aborted:
+        print(f"⚠️ Simulación GPU abortada tras {steps_done} pasos ({end_time - start_time:.2f} segundos).")
+    else:
+        print(f"\n✅ Simulación GPU completada en {end_time - start_time:.2f} segundos.")
+    print(f"   Velocidad: {steps_done / (end_time - start_time):.1f} pasos/segundo")
+    print(f"   Snapshots: {pipeline.frames} escritos en segundo plano ({pipeline.write_seconds:.2f} s), "
+          f"bucle detenido esperando disco {pipeline.wait_seconds:.2f} s")
+    if block_steps and steps_done:
+        print(f"   Fuerzas evaluadas: {evaluated / steps_done:.0f} por DT (paso global: {N})")
+        print(f"   Cuerpos por rung: {np.bincount(rung.to_numpy(), minlength=MAX_RUNG + 1).tolist()}")
+    if log is not None and log.last is not None:
+        print(f"   Conservación: ΔE/E0 = {log.last['energy_drift']:.3e} en el paso {log.last['step']} "
+              f"(registro en {log.path})")
+    if mergers is not None:
+        print(f"   Fusiones: {mergers.n_events} galaxias absorbidas, quedan {n_live[None]} de {N_frame} "
+              f"(registro en {mergers.path})")
+    if OUTPUT_FILE is not None:
+        print(f"--> Datos guardados en {OUTPUT_FILE}")
+
+    # Estado final en la precisión del motor (para diagnósticos de conservación).
+    # Con fusiones: solo los vivos, más ids (ID original de cada uno) y owner (galaxia -> fila).
+    # trajectory y los registros salen de memoria si la corrida no escribió a disco
+    n = n_live[None]
+    state = {"positions": pos[cur].to_numpy()[:n], "velocities": vel.to_numpy()[:n], "masses": mass.to_numpy()[:n],
+             "aborted": aborted, "trajectory": writer.trajectory(),
+             "conservation": log.records() if log is not None else None,
+             "mergers": mergers.records() if mergers is not None else None}
+    if merging:
+        state.update({"ids": ids_np, "owner": owner_np})
+    return state
 
 if __name__ == "__main__":
-    run_taichi_simulation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Motor GPU (Taichi) - Proyecto Chimera")
+    parser.add_argument("--resume", action="store_true", help="Continuar desde el último checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="Pasos entre checkpoints (0 = desactivado)")
+    parser.add_argument("--block-steps", action="store_true", help="Pasos individuales (potencias de dos) según la aceleración")
+    parser.add_argument("--integrator", choices=["euler", "kdk"], default=INTEGRATOR, help="Integrador temporal")
+    parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION,
+                        help="f32, mixed (estado f64 + pares f32) o f64 (referencia)")
+    parser.add_argument("--diagnostics-every", type=int, default=DIAGNOSTICS_EVERY,
+                        help="Pasos entre mediciones de energía y momentos (0 = desactivado)")
+    parser.add_argument("--max-energy-drift", type=float, default=MAX_ENERGY_DRIFT,
+                        help="Abortar si |E - E0| / |E0| supera este valor (0 = nunca)")
+    parser.add_argument("--merge-radius", type=float, default=MERGE_RADIUS,
+                        help="Fusionar cuerpos a menos de este radio en pc (0 = sin fusiones)")
+    parser.add_argument("--merge-every", type=int, default=MERGE_EVERY, help="Pasos entre búsquedas de fusiones")
+    parser.add_argument("--arch", choices=list(ARCHS), default=ARCH, help="Backend de Taichi")
+    parser.add_argument("--traj-encoding", choices=ENCODINGS, default=TRAJ_ENCODING,
+                        help="Codificación de la trayectoria en disco")
+    parser.add_argument("--traj-precision", type=float, default=TRAJ_PRECISION,
+                        help="Paso de cuantización relativo a la caja (--traj-encoding quantized)")
+    args = parser.parse_args()
+
+    TRAJ_ENCODING = args.traj_encoding
+    TRAJ_PRECISION = args.traj_precision
+    
+    run_taichi_simulation(resume=args.resume, checkpoint_every=args.checkpoint_every, block_steps=args.block_steps,
+                          integrator=args.integrator, precision=args.precision,
+                          diagnostics_every=args.diagnostics_every, max_energy_drift=args.max_energy_drift,
+                          merge_radius=args.merge_radius, merge_every=args.merge_every, arch=args.arch)
\ No newline at end of file
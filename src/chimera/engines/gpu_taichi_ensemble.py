@@ -0,0 +1,168 @@
+"""
+Proyecto Orión - Motor GPU de Ensambles (Taichi Lang)
+Avanza E realizaciones independientes (semillas distintas) en el mismo
+lanzamiento: los campos tienen forma (E, N) y cada kernel recorre los E x N
+cuerpos a la vez. Las fuerzas solo se suman dentro de cada realización (no hay
+fuerzas cruzadas), así cada miembro evoluciona igual que si corriera solo.
+
+Con ~100 galaxias por realización una corrida suelta deja la GPU casi vacía y
+paga el arranque (ti.init, compilación, carga) cada vez; acá ese costo se paga
+una vez y el rendimiento crece con E.
+
+Entrada: ensemble_input (initial_conditions.py --ensemble E). Salida: una sola
+trayectoria con E*N cuerpos, el miembro e en las filas [e*N, (e+1)*N); el
+header guarda ensemble_size, members y seeds.
+Autor: Chris (Rubin1)
+"""
+
+import taichi as ti
+import numpy as np
+import os
+import sys
+import time
+import argparse
+import threading
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import TrajectoryWriter
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.storage.snapshot_pipeline import SnapshotPipeline, SNAPSHOT_DEPTH
+from chimera.engines.gpu_taichi import init_taichi, ARCH, ARCHS
+
+# --- CONFIGURACIÓN (mismas unidades y paso que el motor Taichi) ---
+INPUT_FILE = "data/processed/ensemble_input"
+OUTPUT_FILE = "data/processed/trajectory_ensemble.traj"
+G_REAL = 4.30091e-3  # pc (km/s)^2 / Msun
+DT = 0.5             # Paso de tiempo (Millones de años)
+STEPS = 2000
+SOFTENING = 10.0     # Parsecs
+SNAPSHOT_EVERY = 5
+INTEGRATOR = "euler"  # "euler" (semi-implícito) o "kdk" (leapfrog)
+
+def run_ensemble_simulation(integrator=INTEGRATOR, steps=STEPS, arch=None):
+    print(f"--- INICIANDO MOTOR GPU DE ENSAMBLES (TAICHI, {integrator.upper()}) ---")
+    init_taichi(arch) # Mismo arranque perezoso que el motor Taichi
+    kdk = integrator == "kdk"
+
+    # 1. Cargar datos: columnas planas (E*N) -> (E, N)
+    try:
+        data = open_simulation_input(INPUT_FILE)
+    except FileNotFoundError:
+        print(f"❌ No encuentro {INPUT_FILE}. Genera el ensamble con: initial_conditions.py --ensemble E")
+        return
+    E = data.header.get("ensemble_size")
+    if E is None:
+        print(f"❌ {INPUT_FILE} no es un ensamble (falta ensemble_size en el header).")
+        return
+    masses_np = data['masses'].astype(np.float32).reshape(E, -1)
+    N = masses_np.shape[1]
+    pos_np = data['positions'].astype(np.float32).reshape(E, N, 3)
+    vel_np = data['velocities'].astype(np.float32).reshape(E, N, 3)
+    print(f"--> {E} realizaciones x {N} galaxias = {E * N} cuerpos en un solo lanzamiento")
+
+    # 2. Campos (E, N): un eje extra por realización
+    pos = [ti.Vector.field(3, dtype=ti.f32, shape=(E, N)) for _ in range(2)]
+    vel = ti.Vector.field(3, dtype=ti.f32, shape=(E, N))
+    acc = ti.Vector.field(3, dtype=ti.f32, shape=(E, N))
+    mass = ti.field(dtype=ti.f32, shape=(E, N))
+    cur = 0
+
+    pos[cur].from_numpy(pos_np)
+    vel.from_numpy(vel_np)
+    mass.from_numpy(masses_np)
+
+    # 3. Kernels: un hilo por (realización, cuerpo); 'j' solo recorre la misma realización
+    @ti.kernel
+    def compute_forces(src: ti.template()):
+        for e, i in ti.ndrange(E, N):
+            force = ti.Vector([0.0, 0.0, 0.0])
+            p_i = src[e, i]
+            for j in range(N):
+                if i != j:
+                    diff = src[e, j] - p_i
+                    r_eff = ti.sqrt(diff.norm_sqr() + SOFTENING**2)
+                    force += G_REAL * mass[e, j] / (r_eff**3) * diff
+            acc[e, i] = force
+
+    @ti.kernel
+    def kick(dt: ti.f32):
+        for e, i in ti.ndrange(E, N):
+            vel[e, i] += acc[e, i] * dt
+
+    @ti.kernel
+    def drift(src: ti.template(), dst: ti.template(), dt: ti.f32):
+        for e, i in ti.ndrange(E, N):
+            dst[e, i] = src[e, i] + vel[e, i] * dt
+
+    def step():
+        nonlocal cur
+        if kdk:
+            kick(0.5 * DT)
+            drift(pos[cur], pos[1 - cur], DT)
+            cur = 1 - cur
+            compute_forces(pos[cur])
+            kick(0.5 * DT)
+        else:
+            compute_forces(pos[cur])
+            kick(DT)
+            drift(pos[cur], pos[1 - cur], DT)
+            cur = 1 - cur
+
+    # Snapshots asíncronos (igual que gpu_taichi.py), bajados ya en orden de filas e*N + i
+    staging = [ti.Vector.field(3, dtype=ti.f32, shape=(E, N)) for _ in range(SNAPSHOT_DEPTH)]
+
+    @ti.kernel
+    def stage(src: ti.template(), dst: ti.template()):
+        for e, i in ti.ndrange(E, N):
+            dst[e, i] = src[e, i]
+
+    @ti.kernel
+    def download(src: ti.template(), out: ti.types.ndarray()):
+        for e, i in ti.ndrange(E, N):
+            for k in ti.static(range(3)):
+                out[e * N + i, k] = src[e, i][k]
+
+    device_lock = threading.Lock()
+
+    def fetch(slot, out):
+        download(staging[slot], out)
+
+    # 4. Bucle Principal
+    metadata = {"dt": DT, "steps": steps, "softening": SOFTENING, "g": G_REAL, "snapshot_every": SNAPSHOT_EVERY,
+                "integrator": integrator, "ensemble_size": E, "members": N, "seeds": data.header.get("seeds")}
+    writer = TrajectoryWriter(OUTPUT_FILE, E * N, np.float32, engine="taichi_ensemble", metadata=metadata)
+
+    print(f"--> Comenzando cálculo ({E} x {N}^2 interacciones por paso, sin fuerzas entre realizaciones)...")
+    start_time = time.time()
+    if kdk:
+        compute_forces(pos[cur])
+
+    pipeline = SnapshotPipeline(writer, (E * N, 3), fetch, fetch_dtype=np.float32, lock=device_lock)
+    with writer, pipeline:
+        for s in range(steps):
+            snapshot = s % SNAPSHOT_EVERY == 0
+            slot = pipeline.acquire() if snapshot else None
+
+            with device_lock:
+                step()
+                if snapshot:
+                    stage(pos[cur], staging[slot])
+
+            if snapshot:
+                pipeline.submit(slot, t=(s + 1) * DT)
+                print(f"\rStep {s}/{steps} completado", end="")
+
+    elapsed = time.time() - start_time
+    print(f"\n✅ Ensamble completado en {elapsed:.2f} segundos.")
+    print(f"   Velocidad: {steps / elapsed:.1f} pasos/segundo ({E * steps / elapsed:.1f} pasos-realización/segundo)")
+    print(f"--> Datos guardados en {OUTPUT_FILE} (analizar con merger_counter.py --ensemble)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Motor GPU de ensambles (Taichi) - Proyecto Chimera")
+    parser.add_argument("--integrator", choices=["euler", "kdk"], default=INTEGRATOR, help="Integrador temporal")
+    parser.add_argument("--steps", type=int, default=STEPS, help="Número de pasos de tiempo")
+    parser.add_argument("--arch", choices=list(ARCHS), default=ARCH, help="Backend de Taichi")
+    args = parser.parse_args()
+
+    run_ensemble_simulation(integrator=args.integrator, steps=args.steps, arch=args.arch)
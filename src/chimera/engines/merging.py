@@ -0,0 +1,77 @@
+"""
+Proyecto Orión - Fusiones en el Motor (Colisiones Inelásticas)
+Los cuerpos a menos de un radio de fusión se combinan en uno solo: masa
+total, centro de masa y velocidad del centro de masa (se conservan masa y
+momento lineal; la energía del movimiento relativo y el momento angular
+interno del par se pierden, como en una fusión real). Los grupos se buscan
+con Friends-of-Friends, así una cadena a-b-c se fusiona de una vez. En caja
+periódica (box_size) los pares y los centros de masa van con imagen mínima.
+
+Los arreglos quedan compactados (solo los cuerpos vivos, en el mismo orden):
+N baja a medida que la corrida colapsa y la pasada O(N^2) se abarata. El
+motor mantiene el mapa de IDs:
+
+    ids[k]    -> ID original que representa al slot compacto k (el más chico del grupo)
+    owner[i]  -> slot compacto donde vive hoy el cuerpo original i
+
+y cada cuadro de la trayectoria se arma como pos[owner] (N original filas).
+Cada absorción va a storage/merger_log.py (mergers.bin dentro de la trayectoria).
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+
+from chimera.analysis.friends_of_friends import find_groups, minimum_image
+from chimera.storage.merger_log import MERGER_DTYPE
+from chimera.profiling.tracer import traced
+
+@traced("merge.bodies")
+def merge_bodies(pos, vel, masses, ids, radius, box_size=None):
+    """
+    Fusiona los cuerpos a menos de 'radius'. Devuelve None si no hubo ninguna
+    fusión, o (pos, vel, masses, ids, remap, events): el estado compactado,
+    remap[k] = slot nuevo del slot viejo k, y un evento MERGER_DTYPE por cuerpo absorbido.
+    box_size: lado de la caja periódica (pc); el centro de masa vuelve a la caja.
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    vel = np.asarray(vel, dtype=np.float64)
+    masses = np.asarray(masses, dtype=np.float64)
+    labels = find_groups(pos, radius, box_size)  # Etiqueta = índice más chico del grupo
+    keep = labels == np.arange(len(labels))
+    if keep.all():
+        return None
+
+    survivors = np.flatnonzero(keep)
+    remap = np.searchsorted(survivors, labels)
+    n = len(survivors)
+    members = np.bincount(remap, minlength=n)
+    merged = members > 1
+
+    new_masses = masses[survivors].copy()
+    new_pos = pos[survivors].copy()
+    new_vel = vel[survivors].copy()
+    # Solo se tocan los grupos con fusión: los demás cuerpos quedan bit a bit iguales
+    total = np.bincount(remap, weights=masses, minlength=n)
+    new_masses[merged] = total[merged]
+    # En caja periódica, relativo al sobreviviente con imagen mínima (como group_catalog):
+    # un grupo partido por un borde no termina en el medio de la caja
+    rel = pos if box_size is None else minimum_image(pos - pos[labels], box_size)
+    for k in range(3):
+        new_pos[merged, k] = np.bincount(remap, weights=masses * rel[:, k], minlength=n)[merged] / total[merged]
+        new_vel[merged, k] = np.bincount(remap, weights=masses * vel[:, k], minlength=n)[merged] / total[merged]
+    if box_size is not None:
+        new_pos[merged] = np.mod(new_pos[merged] + pos[survivors[merged]], box_size)
+
+    absorbed = np.flatnonzero(~keep)
+    events = np.zeros(len(absorbed), dtype=MERGER_DTYPE)
+    events["survivor"] = ids[labels[absorbed]]
+    events["absorbed"] = ids[absorbed]
+    events["survivor_mass"] = masses[labels[absorbed]]
+    events["absorbed_mass"] = masses[absorbed]
+    events["position"] = new_pos[remap[absorbed]]
+    events["velocity"] = new_vel[remap[absorbed]]
+    return new_pos, new_vel, new_masses, ids[survivors], remap, events
+
+def representatives(owner):
+    """ids a partir de owner: el ID original más chico de cada slot (primera aparición)."""
+    return np.unique(owner, return_index=True)[1]
@@ -7,6 +7,12 @@ Autor: Chris (Rubin1)
 import numpy as np
 import argparse
 import os
+import sys
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chimera.storage.simulation_input import SimulationInputWriter, save_simulation_input
+from chimera.profiling.tracer import span, traced
 
 # --- CONSTANTES FÍSICAS (Unidades: Masas Solares, Parsecs, km/s) ---
 G = 4.30091e-3        # pc (km/s)^2 / Msun
@@ -20,80 +26,129 @@ def get_hubble_parameter(z):
     E_z = np.sqrt(OMEGA_M * (1 + z)**3 + OMEGA_L)
     return H0 * E_z  # km/s / Mpc
 
-def generate_chimera_scenario(n_galaxies, box_size_mpc, seed):
-    np.random.seed(seed)
-    
-    print(f"--- INICIALIZANDO SIMULACIÓN QUIMERA (Seed: {seed}) ---")
-    print(f"Redshift: z={REDSHIFT_Z}")
-    print(f"Caja: {box_size_mpc} Mpc^3")
-    
-    # 1. Definir Masas (Log-Normal Distribution)
-    # Basado en datos JWST: Galaxias compactas masivas (10^9 a 10^11 Msun)
-    mean_mass = 1e10 
-    sigma_mass = 0.5  # Dispersión
-    masses = np.random.lognormal(mean=np.log(mean_mass), sigma=sigma_mass, size=n_galaxies)
-    masses[0] = 1e13
-    # 2. Generar Posiciones "Clustered" (No aleatorias puras)
-    # Las galaxias nacen en nidos. Creamos 3 "nidos" principales.
+# --- GENERACIÓN POR BLOQUES ---
+CHUNK_SIZE = 1_000_000   # Galaxias por bloque (acota la RAM al generar 10^7+)
+KING_MASS = 1e13         # Masa de la galaxia central (índice 0)
+MEAN_MASS = 1e10         # Galaxias compactas masivas (10^9 a 10^11 Msun)
+SIGMA_MASS = 0.5         # Dispersión log-normal
+CLUSTER_SIGMA_PC = 200000  # Tamaño de cada nido (Gaussian blob ~200 kpc)
+PECULIAR_SIGMA = 100     # Velocidad peculiar (km/s)
+
+def _random_streams(seed):
+    """
+    Un generador independiente por cantidad aleatoria (derivados de la misma semilla).
+    Así cada bloque consume exactamente los mismos números que si se generara todo
+    de una vez: el resultado depende de la semilla, no del tamaño de bloque.
+    """
+    names = ("centers", "masses", "clusters", "offsets", "peculiar")
+    children = np.random.SeedSequence(seed).spawn(len(names))
+    return {name: np.random.default_rng(child) for name, child in zip(names, children)}
+
+def iter_chimera_chunks(n_galaxies, box_size_mpc, seed, chunk_size=CHUNK_SIZE):
+    """
+    Genera el escenario por bloques, todo con operaciones de arreglos completos.
+    Devuelve (inicio, masas, posiciones, velocidades) para cada bloque.
+    """
+    rngs = _random_streams(seed)
+
+    # Las galaxias nacen en nidos: ~1 nido por cada 10 galaxias
     box_size_pc = box_size_mpc * 1e6
     n_clusters = int(n_galaxies / 10) + 1
-    cluster_centers = np.random.rand(n_clusters, 3) * box_size_pc
-    
-    positions = []
-    velocities = []
-    
+    cluster_centers = rngs["centers"].random((n_clusters, 3)) * box_size_pc
+
     Hz = get_hubble_parameter(REDSHIFT_Z) # H(z) en km/s / Mpc
     Hz_per_pc = Hz / 1e6 # Convertir a km/s / pc
-    
-    for i in range(n_galaxies):
+    center = box_size_pc / 2
+
+    for start in range(0, n_galaxies, chunk_size):
+        count = min(chunk_size, n_galaxies - start)
+
+        # 1. Masas (Log-Normal, basado en datos JWST)
+        masses = rngs["masses"].lognormal(mean=np.log(MEAN_MASS), sigma=SIGMA_MASS, size=count)
+
+        # 2. Posiciones "Clustered": nido al azar + dispersión gaussiana
+        cluster_idx = (rngs["clusters"].random(count) * n_clusters).astype(np.int64)
+        np.minimum(cluster_idx, n_clusters - 1, out=cluster_idx)
+        positions = cluster_centers[cluster_idx]
+        positions += rngs["offsets"].standard_normal((count, 3)) * CLUSTER_SIGMA_PC
 
-        if i == 0:
-            # EL REY: En el centro exacto, quieto.
-            pos = np.array([box_size_pc/2, box_size_pc/2, box_size_pc/2])
-            positions.append(pos)
-            velocities.append(np.array([0.0, 0.0, 0.0])) # Velocidad cero
-            continue # Saltar al siguiente
-        # Elegir un nido aleatorio
-        cluster_idx = np.random.randint(0, n_clusters)
-        center = cluster_centers[cluster_idx]
-        
-        # Dispersión alrededor del nido (Gaussian blob ~200 kpc)
-        offset = np.random.randn(3) * 200000 
-        pos = center + offset
-        
         # Condiciones de frontera periódicas (Pac-Man)
-        pos = pos % box_size_pc
-        positions.append(pos)
-        
-        # 3. Velocidades: Flujo de Hubble + Velocidad Peculiar
-        # Flujo de Hubble: V = H(z) * distancia (expansion del universo)
-        # Nota: Calculamos la velocidad relativa al centro de la caja para simplificar
-        dist_from_center = pos - (box_size_pc / 2)
-        v_hubble = dist_from_center * Hz_per_pc
-        
-        # Velocidad Peculiar (Movimiento propio, caída hacia el nido)
-        # Las galaxias en cúmulos se mueven rápido (~500 km/s)
-        v_peculiar = np.random.randn(3) * 100
-        
-        total_vel = v_hubble + v_peculiar
-        velocities.append(total_vel)
-
-    return masses, np.array(positions), np.array(velocities)
-
-def save_data(masses, pos, vel, filename="simulation_input.npy"):
-    # Guardamos en formato estructurado para que Rebound y Taichi lo entiendan
-    data = {
-        "redshift": REDSHIFT_Z,
-        "masses": masses,
-        "positions": pos,
-        "velocities": vel
-    }
-    
-    # Crear carpeta data si no existe
-    os.makedirs("data/processed", exist_ok=True)
+        np.mod(positions, box_size_pc, out=positions)
+
+        # 3. Velocidades: Flujo de Hubble (relativo al centro de la caja) + Velocidad Peculiar
+        velocities = (positions - center) * Hz_per_pc
+        velocities += rngs["peculiar"].standard_normal((count, 3)) * PECULIAR_SIGMA
+
+        if start == 0:
+            # EL REY: En el centro exacto, quieto.
+            masses[0] = KING_MASS
+            positions[0] = center
+            velocities[0] = 0.0
+
+        yield start, masses, positions, velocities
+
+@traced("ic.generate")
+def generate_chimera_scenario(n_galaxies, box_size_mpc, seed, chunk_size=CHUNK_SIZE):
+    print(f"--- INICIALIZANDO SIMULACIÓN QUIMERA (Seed: {seed}) ---")
+    print(f"Redshift: z={REDSHIFT_Z}")
+    print(f"Caja: {box_size_mpc} Mpc^3")
+
+    # Arreglos finales reservados una sola vez (sin listas ni copias intermedias)
+    masses = np.empty(n_galaxies)
+    positions = np.empty((n_galaxies, 3))
+    velocities = np.empty((n_galaxies, 3))
+
+    for start, m, p, v in iter_chimera_chunks(n_galaxies, box_size_mpc, seed, chunk_size):
+        stop = start + len(m)
+        masses[start:stop] = m
+        positions[start:stop] = p
+        velocities[start:stop] = v
+
+    return masses, positions, velocities
+
+def generate_ensemble(n_galaxies, box_size_mpc, seeds, chunk_size=CHUNK_SIZE):
+    """
+    Una realización independiente por semilla, apiladas en un eje extra:
+    masas (E, N), posiciones y velocidades (E, N, 3). Cada una es idéntica a
+    la que daría generate_chimera_scenario con esa semilla.
+    """
+    n_members = len(seeds)
+    masses = np.empty((n_members, n_galaxies))
+    positions = np.empty((n_members, n_galaxies, 3))
+    velocities = np.empty((n_members, n_galaxies, 3))
+
+    for e, seed in enumerate(seeds):
+        for start, m, p, v in iter_chimera_chunks(n_galaxies, box_size_mpc, seed, chunk_size):
+            stop = start + len(m)
+            masses[e, start:stop] = m
+            positions[e, start:stop] = p
+            velocities[e, start:stop] = v
+
+    return masses, positions, velocities
+
+@traced("ic.stream")
+def stream_chimera_scenario(n_galaxies, box_size_mpc, seed, out_dir="data/processed/simulation_input", chunk_size=CHUNK_SIZE):
+    """
+    Igual que generate_chimera_scenario pero escribiendo cada bloque directo a
+    disco (formato por columnas), sin tener nunca el escenario completo en RAM.
+    """
+    print(f"--- INICIALIZANDO SIMULACIÓN QUIMERA EN STREAMING (Seed: {seed}) ---")
+    print(f"Redshift: z={REDSHIFT_Z} | Caja: {box_size_mpc} Mpc^3 | Bloques de {chunk_size} galaxias")
+
+    with SimulationInputWriter(out_dir, n_galaxies, REDSHIFT_Z, box_size_pc=box_size_mpc * 1e6, seed=seed) as writer:
+        for start, m, p, v in iter_chimera_chunks(n_galaxies, box_size_mpc, seed, chunk_size):
+            with span("ic.write_chunk", start=start):
+                writer.write(start, m, p, v)
+            print(f"\r--> {start + len(m)}/{n_galaxies} galaxias escritas", end="")
+
+    print(f"\n✅ Datos guardados exitosamente en: {out_dir}")
+
+@traced("ic.save")
+def save_data(masses, pos, vel, filename="simulation_input", **header_extra):
+    # Guardamos por columnas (.npy crudos + header JSON) para que Rebound, Taichi
+    # y los analizadores lo abran con memory-mapping, sin pickle
     filepath = os.path.join("data/processed", filename)
-    
-    np.save(filepath, data)
+    save_simulation_input(filepath, masses, pos, vel, REDSHIFT_Z, **header_extra)
     print(f"✅ Datos guardados exitosamente en: {filepath}")
 
 if __name__ == "__main__":
@@ -102,8 +157,23 @@ if __name__ == "__main__":
     parser.add_argument("--n", type=int, default=100, help="Número de galaxias")
     parser.add_argument("--box", type=float, default=5.0, help="Tamaño de la caja en Mpc")
     parser.add_argument("--seed", type=int, default=42, help="Semilla aleatoria")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Galaxias por bloque")
+    parser.add_argument("--stream", action="store_true", help="Escribir por bloques directo a disco (para 10^7+ galaxias)")
+    parser.add_argument("--ensemble", type=int, default=0,
+                        help="Generar E realizaciones (semillas seed..seed+E-1) apiladas en ensemble_input")
     
     args = parser.parse_args()
     
-    m, p, v = generate_chimera_scenario(args.n, args.box, args.seed)
-    save_data(m, p, v)
\ No newline at end of file
+    if args.ensemble > 0:
+        # Todas las realizaciones en un solo input: el motor de ensambles las avanza juntas
+        seeds = list(range(args.seed, args.seed + args.ensemble))
+        print(f"--- INICIALIZANDO ENSAMBLE QUIMERA: {args.ensemble} realizaciones x {args.n} galaxias ---")
+        print(f"Redshift: z={REDSHIFT_Z} | Caja: {args.box} Mpc^3 | Semillas {seeds[0]}..{seeds[-1]}")
+        m, p, v = generate_ensemble(args.n, args.box, seeds, chunk_size=args.chunk)
+        save_data(m.reshape(-1), p.reshape(-1, 3), v.reshape(-1, 3), filename="ensemble_input",
+                  box_size_pc=args.box * 1e6, seed=args.seed, ensemble_size=args.ensemble, seeds=seeds)
+    elif args.stream:
+        stream_chimera_scenario(args.n, args.box, args.seed, chunk_size=args.chunk)
+    else:
+        m, p, v = generate_chimera_scenario(args.n, args.box, args.seed, chunk_size=args.chunk)
+        save_data(m, p, v, box_size_pc=args.box * 1e6, seed=args.seed)
\ No newline at end of file
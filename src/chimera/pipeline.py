@@ -0,0 +1,145 @@
+"""
+Proyecto Orión - Pipeline en un Solo Proceso
+Corre las tres etapas (condiciones iniciales -> motor -> análisis de
+fusiones) dentro del mismo proceso, pasando los arreglos NumPy en memoria en
+lugar de escribirlos y releerlos de data/processed:
+
+    from chimera.pipeline import run_pipeline
+    result = run_pipeline(n=500, box=5.0, seed=42, engine="taichi", arch="cpu")
+    result["trajectory"][-1], result["mergers"], result["seconds"]
+
+Sin out_dir no se escribe nada en disco (ni trayectoria, ni registros, ni
+checkpoints). Con out_dir cada etapa deja además sus archivos de siempre
+(simulation_input, trajectory.traj, mergers.npz) para el animador y los
+analizadores.
+
+Los motores se importan recién cuando se usan y se configuran cambiando las
+constantes de su módulo (como en parameter_sweep.py), que se restauran al
+terminar. Taichi se inicializa una sola vez en la primera corrida: varias
+semillas seguidas en el mismo proceso no pagan de nuevo el arranque.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import contextlib
+import importlib
+import io
+import os
+import time
+
+from chimera.initial_conditions import generate_chimera_scenario, REDSHIFT_Z
+from chimera.storage.simulation_input import simulation_input_from_arrays, save_simulation_input
+from chimera.analysis.merger_counter import merger_summary, MERGER_RADIUS_PC
+from chimera.profiling.tracer import span
+
+# Motor -> módulo (se importa al usarlo). Rebound queda fuera: su tiempo se mide en años
+ENGINES = {
+    "taichi": "chimera.engines.gpu_taichi",
+    "barnes_hut": "chimera.engines.cpu_barnes_hut",
+    "particle_mesh": "chimera.engines.cpu_particle_mesh",
+}
+ENGINE_RUNNERS = {
+    "taichi": "run_taichi_simulation",
+    "barnes_hut": "run_barnes_hut_simulation",
+    "particle_mesh": "run_pm_simulation",
+}
+
+INPUT_DIR = "simulation_input"    # Dentro de out_dir
+TRAJ_FILE = "trajectory.traj"     # Dentro de out_dir
+CATALOG_FILE = "mergers.npz"      # Dentro de out_dir
+
+@contextlib.contextmanager
+def configured(module, **constants):
+    """Cambia constantes del módulo del motor mientras dura el bloque y después las restaura."""
+    saved = {name: getattr(module, name) for name in constants if hasattr(module, name)}
+    for name, value in constants.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name in constants:
+            if name in saved:
+                setattr(module, name, saved[name])
+            else:
+                delattr(module, name)
+
+def run_pipeline(n=100, box=5.0, seed=42, engine="taichi", arch=None, steps=None, dt=None, softening=None,
+                 radius=MERGER_RADIUS_PC, periodic=False, out_dir=None, engine_options=None, quiet=False,
+                 traj_encoding=None):
+    """
+    Condiciones iniciales + motor + análisis en memoria. engine_options pasa
+    argumentos extra al motor (integrator, precision, merge_radius, theta...).
+    traj_encoding: "raw" o "quantized" para la trayectoria de out_dir.
+    Devuelve el estado final, la trayectoria, los registros y el catálogo, con
+    los segundos de cada etapa en result["seconds"].
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconocido: {engine} (opciones: {', '.join(ENGINES)})")
+    options = dict(engine_options or {})
+    seconds = {}
+    # quiet: sin los prints de progreso de cada etapa (corridas en serie)
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+
+    with output:
+        # 1. Condiciones iniciales (en memoria; a disco solo con out_dir)
+        t0 = time.perf_counter()
+        with span("pipeline.ic", n=n, seed=seed):
+            masses, positions, velocities = generate_chimera_scenario(n, box, seed)
+            initial = simulation_input_from_arrays(masses, positions, velocities, REDSHIFT_Z,
+                                                   box_size_pc=box * 1e6, seed=seed)
+            if out_dir is not None:
+                save_simulation_input(os.path.join(out_dir, INPUT_DIR), masses, positions, velocities, REDSHIFT_Z,
+                                      box_size_pc=box * 1e6, seed=seed)
+        seconds["ic"] = time.perf_counter() - t0
+
+        # 2. Motor (importado recién ahora; Taichi se inicializa en su primera corrida)
+        t0 = time.perf_counter()
+        with span("pipeline.engine", engine=engine):
+            module = importlib.import_module(ENGINES[engine])
+            constants = {"OUTPUT_FILE": os.path.join(out_dir, TRAJ_FILE) if out_dir is not None else None}
+            if dt is not None:
+                constants["DT"] = dt
+                if hasattr(module, "DT_MAX"):
+                    constants["DT_MAX"] = 4 * dt
+            if softening is not None:
+                constants["SOFTENING"] = softening
+            if traj_encoding is not None:
+                constants["TRAJ_ENCODING"] = traj_encoding
+            if hasattr(module, "CHECKPOINT_DIR"):
+                if out_dir is not None:
+                    constants["CHECKPOINT_DIR"] = os.path.join(out_dir, "checkpoints")
+                else:
+                    options.setdefault("checkpoint_every", 0)  # Sin disco, sin checkpoints
+            if engine == "taichi":
+                if steps is not None:
+                    constants["STEPS"] = steps
+                options["arch"] = arch
+            elif steps is not None:
+                options["steps"] = steps
+
+            with configured(module, **constants):
+                state = getattr(module, ENGINE_RUNNERS[engine])(initial=initial, **options)
+        seconds["engine"] = time.perf_counter() - t0
+        if state is None:
+            raise RuntimeError(f"{engine} no devolvió un estado final")
+
+        # 3. Análisis de fusiones sobre el último cuadro
+        t0 = time.perf_counter()
+        with span("pipeline.analysis"):
+            box_size = box * 1e6 if periodic else None
+            catalog, mergers, monster = merger_summary(np.asarray(state["trajectory"][-1]), masses, box_size, radius)
+            if out_dir is not None:
+                np.savez_compressed(os.path.join(out_dir, CATALOG_FILE), catalog=catalog)
+        seconds["analysis"] = time.perf_counter() - t0
+
+    return {
+        "params": {"n": n, "box": box, "seed": seed, "engine": engine, "arch": arch, "radius": radius,
+                   "periodic": periodic},
+        "initial": initial,
+        "state": state,
+        "trajectory": state["trajectory"],
+        "catalog": catalog,
+        "mergers": mergers,
+        "monster": monster,
+        "seconds": seconds,
+    }
@@ -0,0 +1,248 @@
+"""
+Proyecto Orión - Trazas de Ejecución (Spans y Contadores)
+Instrumentación liviana para ver en qué se va el tiempo sin un profiler
+externo. Se activa con una variable de entorno (o enable()):
+
+    ORION_TRACE=traza.json python3 src/chimera/engines/gpu_taichi.py
+
+y al salir escribe traza.json en el formato de eventos de Chrome (abrir en
+chrome://tracing o https://ui.perfetto.dev) e imprime una tabla por span:
+llamadas, tiempo total, tiempo propio (sin los spans hijos), promedio y máximo.
+
+    with span("forces", sync=ti.sync):   # sync: esperar a la GPU antes de medir el final
+        ...
+    count("snapshots")                    # contador acumulado (evento "C")
+    gauge("active_bodies", n)             # valor instantáneo (evento "C")
+
+Apagado, span() devuelve siempre el mismo objeto vacío y count()/gauge() solo
+miran una bandera: el costo es una llamada de función por punto instrumentado.
+
+Con procesos hijos (pool de video, barridos) cada hijo hereda la variable y
+escribe su propia traza <nombre>.<pid>.json; se juntan con:
+    python3 src/chimera/profiling/tracer.py traza.json traza.*.json --merge todo.json
+Autor: Chris (Rubin1)
+"""
+
+import argparse
+import atexit
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+
+TRACE_ENV = "ORION_TRACE"
+SUMMARY_ROWS = 25  # Spans en la tabla resumen (los de más tiempo propio)
+
+_enabled = False
+_path = None
+_finished = False
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_local = threading.local()
+_t0 = time.perf_counter()
+
+def _now_us():
+    return (time.perf_counter() - _t0) * 1e6
+
+class _NullSpan:
+    """Span de cuando el trazado está apagado: no hace nada."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "sync", "start", "child_us")
+
+    def __init__(self, name, cat, args, sync):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.sync = sync
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.child_us = 0.0
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc):
+        if self.sync is not None:
+            self.sync()
+        end = _now_us()
+        dur = end - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_us += dur
+        event = {"name": self.name, "cat": self.cat, "ph": "X", "ts": self.start, "dur": dur,
+                 "pid": os.getpid(), "tid": threading.get_ident(), "self": dur - self.child_us}
+        if self.args:
+            event["args"] = self.args
+        _events.append(event)
+        return False
+
+def span(name, cat="orion", sync=None, **args):
+    """Intervalo con nombre (context manager). sync: función a llamar antes de cerrar (p. ej. ti.sync)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args, sync)
+
+def traced(name=None, cat="orion"):
+    """Decorador: cada llamada a la función es un span."""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        def wrapper(*a, **kw):
+            if not _enabled:
+                return func(*a, **kw)
+            with _Span(label, cat, None, None):
+                return func(*a, **kw)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """Suma n al contador 'name' y registra su valor acumulado."""
+    if not _enabled:
+        return
+    with _lock:
+        value = _counters[name] = _counters.get(name, 0) + n
+    _events.append({"name": name, "ph": "C", "ts": _now_us(), "pid": os.getpid(), "args": {name: value}})
+
+def gauge(name, value):
+    """Registra el valor instantáneo de 'name' (p. ej. cuerpos activos, deriva de energía)."""
+    if not _enabled:
+        return
+    _events.append({"name": name, "ph": "C", "ts": _now_us(), "pid": os.getpid(), "args": {name: value}})
+
+def enabled():
+    return _enabled
+
+def enable(path=None):
+    """Activa el trazado. Con path, la traza se escribe ahí al salir del proceso."""
+    global _enabled, _path
+    _enabled = True
+    _path = path
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    _events.clear()
+    _counters.clear()
+
+def events():
+    return list(_events)
+
+def _process_path(path):
+    # Los procesos hijos escriben su propia traza al lado de la del padre
+    if multiprocessing.parent_process() is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext or '.json'}"
+
+def write_trace(path, trace_events=None):
+    """Escribe la traza en el formato JSON de eventos de Chrome."""
+    trace_events = _events if trace_events is None else trace_events
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+def summarize(trace_events=None):
+    """Agrega los spans por nombre: llamadas, total, propio, promedio y máximo (ms)."""
+    trace_events = _events if trace_events is None else trace_events
+    spans = [e for e in trace_events if e.get("ph") == "X"]
+    rows = {}
+    for e in spans:
+        row = rows.setdefault(e["name"], {"name": e["name"], "calls": 0, "total_ms": 0.0, "self_ms": 0.0,
+                                          "max_ms": 0.0})
+        dur = e["dur"] / 1e3
+        row["calls"] += 1
+        row["total_ms"] += dur
+        row["self_ms"] += e.get("self", e["dur"]) / 1e3
+        row["max_ms"] = max(row["max_ms"], dur)
+    for row in rows.values():
+        row["mean_ms"] = row["total_ms"] / row["calls"]
+    wall = 0.0
+    if spans:
+        wall = (max(e["ts"] + e["dur"] for e in spans) - min(e["ts"] for e in spans)) / 1e3
+    return sorted(rows.values(), key=lambda r: r["self_ms"], reverse=True), wall
+
+def print_summary(trace_events=None, limit=SUMMARY_ROWS):
+    rows, wall = summarize(trace_events)
+    if not rows:
+        print("⚠️ La traza no tiene spans.")
+        return
+    print(f"\n📊 TRAZA: {wall:.1f} ms entre el primer y el último span (ordenado por tiempo propio)")
+    print(f"{'span':<32} {'llamadas':>9} {'total ms':>11} {'propio ms':>11} {'%':>6} {'prom ms':>9} {'máx ms':>9}")
+    for r in rows[:limit]:
+        share = 100 * r["self_ms"] / wall if wall > 0 else 0.0
+        print(f"{r['name'][:32]:<32} {r['calls']:>9} {r['total_ms']:>11.2f} {r['self_ms']:>11.2f} {share:>6.1f} "
+              f"{r['mean_ms']:>9.3f} {r['max_ms']:>9.3f}")
+    if len(rows) > limit:
+        print(f"   ... y {len(rows) - limit} spans más")
+
+def _finish():
+    global _finished
+    if _finished or not _enabled or _path is None or not _events:
+        return
+    _finished = True
+    path = _process_path(_path)
+    write_trace(path)
+    # La tabla solo en el proceso principal (los hijos se resumen al juntar las trazas)
+    if multiprocessing.parent_process() is None:
+        print_summary()
+        print(f"--> Traza guardada en {path}")
+
+def _after_fork():
+    # Un hijo con fork arranca con los eventos del padre: no volver a escribirlos
+    global _finished
+    _finished = False
+    reset()
+    _local.stack = []
+
+def _register_finalizer(_=None):
+    multiprocessing.util.Finalize(None, _finish, exitpriority=0)
+
+# atexit en el proceso principal. Los hijos de multiprocessing con fork salen con
+# os._exit (sin atexit) pero corren sus finalizadores, que multiprocessing borra
+# al arrancar cada hijo: por eso se vuelve a registrar después del fork
+atexit.register(_finish)
+_register_finalizer()
+os.register_at_fork(after_in_child=_after_fork)
+multiprocessing.util.register_after_fork(_NULL_SPAN, _register_finalizer)
+
+if os.environ.get(TRACE_ENV):
+    enable(os.environ[TRACE_ENV])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumen (y unión) de trazas - Proyecto Chimera")
+    parser.add_argument("traces", nargs="+", help="Archivos de traza JSON")
+    parser.add_argument("--merge", type=str, default=None, help="Escribir todas las trazas juntas en este archivo")
+    parser.add_argument("--rows", type=int, default=SUMMARY_ROWS, help="Filas de la tabla")
+    args = parser.parse_args()
+
+    merged = []
+    for path in args.traces:
+        with open(path) as f:
+            merged.extend(json.load(f)["traceEvents"])
+    print_summary(merged, args.rows)
+    if args.merge:
+        write_trace(args.merge, merged)
+        print(f"--> {len(merged)} eventos guardados en {args.merge}")
@@ -0,0 +1,141 @@
+"""
+Proyecto Orión - Imágenes de Densidad Proyectada
+En vez de un marcador por cuerpo, proyecta las posiciones sobre una malla 2D
+(histograma o CIC, con np.bincount) y colorea píxeles: el costo por imagen es
+O(N) sumas enteras más O(alto x ancho), y con 10^5+ cuerpos no se satura.
+
+    density = splat(x, y, extent, shape, weights)     -> masa (o conteo) por píxel
+    level   = tone_map(density, "asinh" | "log")      -> brillo en [0, 1]
+    rgb     = colorize(level, cmap)                    -> (alto, ancho, 3) uint8
+
+render_density() hace los tres pasos y, con color_by (p. ej. |v|), colorea
+cada píxel por el promedio pesado de esa cantidad y usa la densidad como brillo.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import matplotlib
+from matplotlib.colors import LinearSegmentedColormap
+import matplotlib.image
+
+IMAGE_SHAPE = (1024, 1024)   # (alto, ancho) en píxeles
+TONE = "asinh"               # "asinh", "log" o "linear"
+ASINH_STRETCH = 0.02         # Fracción de vmax donde asinh pasa de lineal a logarítmico
+LOG_RANGE = 1e4              # Rango dinámico del mapeo log (vmax / valor más débil visible)
+COLOR_PERCENTILES = (1, 99)  # Rango de color_by por defecto (robusto a valores extremos)
+VMAX_PERCENTILE = 99.5       # Blanco = este percentil de los píxeles ocupados (no el máximo: unos pocos
+                             # cuerpos muy masivos dejarían todo lo demás negro)
+
+def get_cmap(cmap):
+    """Nombre de un colormap de matplotlib, lista de colores (negro -> ... ) o Colormap."""
+    if isinstance(cmap, (list, tuple)):
+        return LinearSegmentedColormap.from_list("orion", list(cmap))
+    if isinstance(cmap, str):
+        return matplotlib.colormaps[cmap]
+    return cmap
+
+def splat(x, y, extent, shape=IMAGE_SHAPE, weights=None, method="cic"):
+    """
+    Suma de 'weights' (o conteo) por píxel. extent = (x0, x1, y0, y1); la fila 0
+    es y0. method: "hist" (cada cuerpo a su píxel) o "cic" (reparte entre los 4
+    píxeles vecinos: imagen más suave con pocos cuerpos por píxel).
+    """
+    x0, x1, y0, y1 = extent
+    h, w = shape
+    u = (np.asarray(x, dtype=np.float64) - x0) * (w / (x1 - x0))
+    v = (np.asarray(y, dtype=np.float64) - y0) * (h / (y1 - y0))
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+    if method == "hist":
+        keep = (u >= 0) & (u < w) & (v >= 0) & (v < h)
+        flat = v[keep].astype(np.intp) * w + u[keep].astype(np.intp)
+        img = np.bincount(flat, weights=None if weights is None else weights[keep], minlength=h * w)
+        return img.reshape(h, w).astype(np.float64)
+
+    # CIC sobre una malla con un píxel de borde: sin casos especiales en las orillas
+    u -= 0.5
+    v -= 0.5
+    keep = (u > -1) & (u < w) & (v > -1) & (v < h)
+    u, v = u[keep], v[keep]
+    wt = np.ones(len(u)) if weights is None else weights[keep]
+    iu, iv = np.floor(u), np.floor(v)
+    fu, fv = u - iu, v - iv
+    stride = w + 2
+    base = (iv.astype(np.intp) + 1) * stride + iu.astype(np.intp) + 1
+    size = (h + 2) * stride
+    # astype: sin cuerpos, bincount devuelve enteros aunque se le pasen pesos
+    img = np.bincount(base, weights=wt * (1 - fu) * (1 - fv), minlength=size).astype(np.float64)
+    img += np.bincount(base + 1, weights=wt * fu * (1 - fv), minlength=size)
+    img += np.bincount(base + stride, weights=wt * (1 - fu) * fv, minlength=size)
+    img += np.bincount(base + stride + 1, weights=wt * fu * fv, minlength=size)
+    return img.reshape(h + 2, stride)[1:-1, 1:-1]
+
+def robust_vmax(img, percentile=VMAX_PERCENTILE):
+    """Percentil de los píxeles no vacíos (0 si la imagen está vacía)."""
+    occupied = img[img > 0]
+    return float(np.percentile(occupied, percentile)) if len(occupied) else 0.0
+
+def tone_map(img, tone=TONE, vmax=None, stretch=ASINH_STRETCH, log_range=LOG_RANGE):
+    """Lleva la densidad a [0, 1]. vmax fijo evita el parpadeo entre cuadros de un video."""
+    vmax = robust_vmax(img) if vmax is None else float(vmax)
+    if vmax <= 0:
+        return np.zeros(img.shape)
+    x = np.asarray(img, dtype=np.float64) / vmax
+    if tone == "asinh":
+        level = np.arcsinh(x / stretch) / np.arcsinh(1 / stretch)
+    elif tone == "log":
+        level = np.log1p(x * log_range) / np.log1p(log_range)
+    elif tone == "linear":
+        level = x
+    else:
+        raise ValueError(f"Mapeo de tonos desconocido: {tone}")
+    return np.clip(level, 0, 1)
+
+def colorize(level, cmap="inferno", brightness=None):
+    """Valores en [0, 1] -> RGB uint8 con una tabla de 256 colores (opcional: brillo por píxel)."""
+    lut = get_cmap(cmap)(np.linspace(0, 1, 256))[:, :3]
+    rgb = lut[np.rint(np.clip(level, 0, 1) * 255).astype(np.intp)]
+    if brightness is not None:
+        rgb = rgb * brightness[..., None]
+    return np.rint(rgb * 255).astype(np.uint8)
+
+def render_density(pos, extent, shape=IMAGE_SHAPE, axes=(0, 1), weights=None, color_by=None, color_range=None,
+                   method="cic", tone=TONE, vmax=None, cmap="inferno"):
+    """
+    Imagen RGB (alto, ancho, 3) uint8 de las posiciones proyectadas sobre 'axes',
+    con +y hacia arriba. weights: p. ej. masas (None = conteo). color_by: una
+    cantidad por cuerpo (p. ej. |v|) para el color; la densidad da el brillo.
+    """
+    pos = np.asarray(pos)
+    x, y = pos[:, axes[0]], pos[:, axes[1]]
+    density = splat(x, y, extent, shape, weights, method)
+    level = tone_map(density, tone, vmax)
+
+    if color_by is None:
+        return colorize(level, cmap)[::-1]
+
+    color_by = np.asarray(color_by, dtype=np.float64)
+    if color_range is not None:
+        lo, hi = color_range
+    elif len(color_by):
+        lo, hi = np.percentile(color_by, COLOR_PERCENTILES)
+    else:
+        lo, hi = 0.0, 1.0  # Cuadro vacío: no hay de dónde sacar el rango (la imagen sale negra igual)
+    weighted = color_by if weights is None else color_by * weights
+    total = splat(x, y, extent, shape, weighted, method)
+    mean = np.divide(total, density, out=np.zeros_like(total), where=density > 0)
+    return colorize((mean - lo) / max(hi - lo, 1e-300), cmap, brightness=level)[::-1]
+
+def density_vmax(pos, extent, shape=IMAGE_SHAPE, axes=(0, 1), weights=None, method="cic"):
+    """vmax de una imagen de referencia (p. ej. el primer cuadro), para fijarlo en todo un video."""
+    pos = np.asarray(pos)
+    return robust_vmax(splat(pos[:, axes[0]], pos[:, axes[1]], extent, shape, weights, method))
+
+def axes_shape(ax):
+    """(alto, ancho) en píxeles del área de un Axes: la imagen se dibuja 1 a 1, sin reescalar."""
+    bbox = ax.get_window_extent()
+    return max(1, int(round(bbox.height))), max(1, int(round(bbox.width)))
+
+def save_image(path, rgb):
+    """Escribe los píxeles tal cual (sin figura de matplotlib)."""
+    matplotlib.image.imsave(path, rgb)
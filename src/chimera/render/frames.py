@@ -0,0 +1,112 @@
+"""
+Proyecto Orión - Cuadros y Nivel de Detalle
+Piezas compartidas por el animador interactivo y el renderizador de video:
+lectura de cuadros bajo demanda (memmap + caché LRU), línea de tiempo con
+saltos e interpolación, submuestreo pesado por masa y densidad en celdas.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+from collections import OrderedDict
+
+LOD_THRESHOLD = 50000   # Con más cuerpos que esto, no se dibujan todos
+LOD_POINTS = 20000      # Puntos del submuestreo pesado por masa
+LOD_BINS = 64           # Celdas por lado en el modo densidad
+CACHE_FRAMES = 8        # Cuadros decodificados que se guardan en RAM (LRU)
+LIMIT_MPC = 20.0        # Lado de la caja dibujada
+LOD_SEED = 0            # Semilla fija: el mismo submuestreo en cada corrida
+
+class FrameSource:
+    """
+    Cuadros bajo demanda: la trayectoria queda en disco (memmap) y solo los
+    últimos CACHE_FRAMES cuadros leídos viven en RAM (caché LRU).
+    Con submuestreo solo se leen las filas elegidas de cada cuadro.
+    """
+
+    def __init__(self, traj, rows=None, cache_frames=CACHE_FRAMES):
+        self.traj = traj
+        self.rows = rows  # Índices (ordenados) de los cuerpos a leer, o None para todos
+        self.cache_frames = cache_frames
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.traj)
+
+    def __getitem__(self, index):
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+
+        frame = self.traj[index]
+        pos = np.asarray(frame if self.rows is None else frame[self.rows], dtype=np.float32) / 1e6 # Mpc
+        self._cache[index] = pos
+        if len(self._cache) > self.cache_frames:
+            self._cache.popitem(last=False)
+        return pos
+
+    def between(self, i0, i1, w):
+        """Interpolación lineal entre los cuadros i0 e i1 (w = 0 -> i0, w = 1 -> i1)."""
+        if w == 0 or i0 == i1:
+            return self[i0]
+        return (1 - w) * self[i0] + w * self[i1]
+
+def build_timeline(n_frames, stride=1, interp=0):
+    """
+    Cuadros a mostrar como (i0, i1, w): un snapshot de cada 'stride' y
+    'interp' cuadros interpolados entre cada par consecutivo.
+    """
+    snapshots = list(range(0, n_frames, max(1, stride)))
+    timeline = [(a, b, k / (interp + 1)) for a, b in zip(snapshots[:-1], snapshots[1:]) for k in range(interp + 1)]
+    timeline.append((snapshots[-1], snapshots[-1], 0.0))
+    return timeline
+
+def mass_weighted_sample(masses, k, seed=LOD_SEED):
+    """
+    k cuerpos sin reemplazo con probabilidad proporcional a la masa
+    (claves de Efraimidis-Spirakis: O(N), sin bucles).
+    """
+    masses = np.asarray(masses, dtype=np.float64)
+    if k >= len(masses):
+        return np.arange(len(masses))
+    u = np.random.default_rng(seed).random(len(masses))
+    keys = np.log(u) / np.maximum(masses, 1e-300)
+    return np.sort(np.argpartition(-keys, k)[:k]) # Ordenados: lectura secuencial del memmap
+
+def binned_density(pos, weights, bins=LOD_BINS, limit=LIMIT_MPC):
+    """Masa por celda de una malla bins^3: centros de las celdas ocupadas y su masa."""
+    hist, edges = np.histogramdd(pos, bins=bins, range=[(0, limit)] * 3, weights=weights)
+    occupied = np.nonzero(hist)
+    centers = [(e[:-1] + e[1:])[i] / 2 for e, i in zip(edges, occupied)]
+    return np.stack(centers, axis=1), hist[occupied]
+
+def resolve_lod(lod, n_bodies):
+    """'auto' -> 'subsample' con muchos cuerpos, 'none' si no."""
+    if lod == 'auto':
+        return 'subsample' if n_bodies > LOD_THRESHOLD else 'none'
+    return lod
+
+def point_style(masses, n_bodies, lod, max_points=LOD_POINTS):
+    """
+    Filas a leer (o None), masas y tamaños de punto según el nivel de detalle.
+    Si el input no coincide con la trayectoria, todas las masas valen 1.
+    """
+    if len(masses) != n_bodies:
+        print(f"⚠️ Aviso: El input tiene {len(masses)} masas pero la trayectoria tiene {n_bodies} cuerpos.")
+        masses = np.ones(n_bodies)
+        sizes = np.ones(n_bodies) * 2
+    else:
+        masses = np.asarray(masses, dtype=np.float64)
+        sizes = np.log10(masses) * 0.5
+
+    rows = None
+    if lod == 'subsample':
+        rows = mass_weighted_sample(masses, max_points)
+        sizes = np.full(len(rows), 2.0) # Cada punto representa la misma masa
+    return rows, masses, sizes
+
+def density_points(pos, masses, bins=LOD_BINS, limit=LIMIT_MPC):
+    """(centros, tamaños, colores) de las celdas ocupadas para el modo densidad."""
+    centers, mass = binned_density(pos, masses, bins, limit)
+    if len(mass) == 0:
+        return centers, mass, mass
+    return centers, 4 + 2 * np.log10(mass / mass.min()), np.log10(mass)
@@ -0,0 +1,351 @@
+"""
+Proyecto Orión - Renderizador de Video sin Cabeza (Paralelo)
+Renderiza los cuadros de un video en un pool de procesos, cada uno con su
+propio lienzo Agg, y los manda EN ORDEN como RGB crudo a un ffmpeg por stdin:
+
+    workers:  escena(fig) -> draw(i) -> canvas Agg -> bytes RGB
+    principal: ventana acotada de cuadros en vuelo -> ffmpeg stdin (rawvideo rgb24)
+
+El video se codifica por segmentos de SEGMENT_FRAMES cuadros (un ffmpeg a la
+vez, cada segmento se renombra al terminar) y al final se concatenan sin
+recodificar. Si la corrida se corta, se retoma desde el primer segmento que
+falta. Los cuadros dependen solo de su índice (semillas fijas, tamaño y dpi
+fijos), así que el resultado no cambia con el número de procesos.
+
+Una escena es una función de nivel de módulo make_scene(fig, **args) que
+prepara la figura y devuelve draw(i). Los args deben ser serializables a JSON
+(se guardan en el manifiesto para validar la reanudación). De los args que son
+rutas (*_path) el manifiesto guarda además tamaño y fecha de cada archivo, y de
+la trayectoria su header y número de cuadros: si se re-simula en la misma ruta,
+los segmentos viejos no se reutilizan.
+
+Uso:
+    python3 src/chimera/render/video_renderer.py --traj data/processed/trajectory_taichi.traj --out chimera.mp4
+    python3 src/chimera/render/video_renderer.py --view density --tone asinh   # Imagen de densidad (N grande)
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+from matplotlib.figure import Figure # Sin pyplot: cada proceso dibuja en su lienzo Agg, sin monitor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.trajectory_store import open_trajectory
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.render.frames import (FrameSource, build_timeline, resolve_lod, point_style, density_points,
+                                   LOD_POINTS, LOD_BINS, LIMIT_MPC)
+from chimera.render.density_image import render_density, density_vmax, TONE
+
+# --- CONFIGURACIÓN ---
+FPS = 30
+WIDTH, HEIGHT = 1280, 720   # Pares (yuv420p lo exige)
+DPI = 100
+SEGMENT_FRAMES = 300        # Cuadros por segmento (unidad de reanudación)
+PREFETCH = 4                # Cuadros en vuelo por proceso (acota la RAM si ffmpeg va lento)
+N_WORKERS = os.cpu_count() or 1
+FFMPEG = "ffmpeg"
+ENCODER_THREADS = 4         # Fijo: x264 con otro número de hilos da otros bytes
+ENCODER_ARGS = ["-c:v", "libx264", "-preset", "medium", "-crf", "18", "-pix_fmt", "yuv420p"]
+BITEXACT_ARGS = ["-fflags", "+bitexact", "-flags:v", "+bitexact", "-map_metadata", "-1"]
+MANIFEST_FILE = "manifest.json"
+META_FILE = "data/processed/simulation_input"
+
+# --- ESCENA POR DEFECTO: TRAYECTORIA 3D (mismo estilo que el animador) ---
+def trajectory_scene(fig, traj_path, meta_path=META_FILE, lod='auto', stride=1, interp=0, max_points=LOD_POINTS,
+                     bins=LOD_BINS, limit=LIMIT_MPC, title="", color='orange', alpha=0.3, elev=30.0, azim=-60.0,
+                     rotate=0.0):
+    """Vista 3D de una trayectoria guardada. rotate: grados de azimut por cuadro."""
+    traj = open_trajectory(traj_path)
+    try:
+        masses = open_simulation_input(meta_path)['masses']
+    except FileNotFoundError:
+        masses = np.ones(traj.n_bodies)
+    lod = resolve_lod(lod, traj.n_bodies)
+    rows, masses, sizes = point_style(masses, traj.n_bodies, lod, max_points)
+    source = FrameSource(traj, rows, cache_frames=2) # Cada proceso recorre cuadros contiguos
+    timeline = build_timeline(len(traj), stride, interp)
+
+    ax = fig.add_subplot(111, projection='3d')
+    fig.patch.set_facecolor('black')
+    ax.set_facecolor('black')
+    ax.xaxis.set_pane_color((0.1, 0.1, 0.1, 1.0))
+    ax.yaxis.set_pane_color((0.1, 0.1, 0.1, 1.0))
+    ax.zaxis.set_pane_color((0.1, 0.1, 0.1, 1.0))
+    ax.grid(False)
+    ax.set_xlim(0, limit)
+    ax.set_ylim(0, limit)
+    ax.set_zlim(0, limit)
+    ax.set_title(title or f"Chimera: {traj.n_bodies} Galaxias", color='white')
+
+    if lod == 'density':
+        graph = ax.scatter([], [], [], s=[], c=[], cmap='inferno', alpha=0.6, edgecolors='none')
+    else:
+        graph = ax.scatter([], [], [], s=[], c=color, alpha=alpha, edgecolors='none')
+    txt_time = ax.text2D(0.05, 0.95, "", transform=ax.transAxes, color='white')
+
+    def draw(index):
+        i0, i1, w = timeline[index]
+        pos = source.between(i0, i1, w)
+        if lod == 'density':
+            pos, s, c = density_points(pos, masses, bins, limit)
+            graph.set_array(c)
+        else:
+            s = sizes
+        graph._offsets3d = (pos[:,0], pos[:,1], pos[:,2])
+        graph.set_sizes(s)
+        ax.view_init(elev=elev, azim=azim + rotate * index)
+        txt_time.set_text(f"Frame: {i0 + w * (i1 - i0):.2f}" if interp else f"Frame: {i0}")
+
+    return draw
+
+# --- ESCENA RÁPIDA: DENSIDAD PROYECTADA (costo por cuadro ~ tamaño de la imagen, no N) ---
+def density_scene(fig, traj_path, meta_path=META_FILE, stride=1, interp=0, limit=LIMIT_MPC, axes=(0, 1),
+                  weight='mass', tone=TONE, cmap='inferno', title=""):
+    """Trayectoria proyectada sobre 'axes' como imagen de densidad (pesada por masa o por conteo)."""
+    traj = open_trajectory(traj_path)
+    masses = None
+    if weight == 'mass':
+        try:
+            masses = np.asarray(open_simulation_input(meta_path)['masses'], dtype=np.float64)
+        except FileNotFoundError:
+            pass
+        if masses is not None and len(masses) != traj.n_bodies:
+            print(f"⚠️ Aviso: El input tiene {len(masses)} masas pero la trayectoria tiene {traj.n_bodies} cuerpos.")
+            masses = None
+    source = FrameSource(traj, cache_frames=2)
+    timeline = build_timeline(len(traj), stride, interp)
+
+    fig.patch.set_facecolor('black')
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.axis('off')
+    width, height = fig.canvas.get_width_height()
+    shape = (height, width)
+    extent = (0, limit, 0, limit * height / width) # Píxeles cuadrados
+    vmax = density_vmax(source[0], extent, shape, axes, masses) # Escala fija: sin parpadeo
+    image = ax.imshow(np.zeros(shape + (3,), dtype=np.uint8), extent=extent, interpolation='nearest')
+    ax.text(0.5, 0.97, title or f"Chimera: {traj.n_bodies} Galaxias", transform=ax.transAxes, color='white',
+            ha='center', va='top')
+    txt_time = ax.text(0.02, 0.02, "", transform=ax.transAxes, color='white')
+
+    def draw(index):
+        i0, i1, w = timeline[index]
+        pos = source.between(i0, i1, w)
+        image.set_data(render_density(pos, extent, shape, axes, masses, tone=tone, vmax=vmax, cmap=cmap))
+        txt_time.set_text(f"Frame: {i0 + w * (i1 - i0):.2f}" if interp else f"Frame: {i0}")
+
+    return draw
+
+def trajectory_frames(traj_path, stride=1, interp=0):
+    """Número de cuadros de video que produce trajectory_scene."""
+    return len(build_timeline(open_trajectory(traj_path).n_frames, stride, interp))
+
+# --- PROCESOS DE RENDER ---
+_worker = {}
+
+def _init_worker(scene, scene_args, width, height, dpi):
+    module, name = scene
+    make_scene = getattr(importlib.import_module(module), name)
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    _worker["draw"] = make_scene(fig, **scene_args)
+    _worker["canvas"] = canvas
+    _worker["size"] = (height, width)
+
+def _render_frame(index):
+    """Dibuja el cuadro 'index' y devuelve sus bytes RGB (alto x ancho x 3)."""
+    _worker["draw"](index)
+    canvas = _worker["canvas"]
+    canvas.draw()
+    rgba = np.asarray(canvas.buffer_rgba())
+    if rgba.shape[:2] != _worker["size"]:
+        raise RuntimeError(f"El lienzo mide {rgba.shape[1]}x{rgba.shape[0]}, se esperaba "
+                           f"{_worker['size'][1]}x{_worker['size'][0]} (revisa bbox/tight_layout de la escena)")
+    return np.ascontiguousarray(rgba[..., :3]).tobytes()
+
+def _rendered_frames(pool, indices, window):
+    """Cuadros renderizados en orden, con a lo sumo 'window' en vuelo (back-pressure)."""
+    in_flight = deque()
+    for index in indices:
+        in_flight.append(pool.submit(_render_frame, index))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+def _scene_ref(make_scene):
+    """
+    (módulo, nombre) de la escena. Con 'spawn' el __main__ de los hijos es el
+    mismo script del padre (importado sin correr su bloque __main__).
+    """
+    return make_scene.__module__, make_scene.__qualname__
+
+# --- FFMPEG ---
+def _ffmpeg_encode(ffmpeg, width, height, fps, output, log):
+    cmd = [ffmpeg, "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+           *ENCODER_ARGS, "-threads", str(ENCODER_THREADS), *BITEXACT_ARGS, output]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=log)
+
+def _ffmpeg_concat(ffmpeg, parts, output, work_dir, log):
+    list_file = os.path.join(work_dir, "segments.txt")
+    with open(list_file, "w") as f:
+        for part in parts:
+            f.write(f"file '{os.path.basename(part)}'\n")
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file,
+           "-c", "copy", *BITEXACT_ARGS, output]
+    return subprocess.run(cmd, stderr=log).returncode
+
+def _source_identity(path):
+    """[archivo, bytes, mtime_ns] de cada archivo de la ruta (un archivo suelto o un directorio .traj / input)."""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+    else:
+        files = [path]
+    return [[os.path.basename(f), os.path.getsize(f), os.stat(f).st_mtime_ns] for f in files if os.path.isfile(f)]
+
+def _scene_sources(scene_args):
+    """Identidad de las entradas de la escena (args *_path): lo que hace válidos los segmentos ya hechos."""
+    sources = {}
+    for name, value in sorted(scene_args.items()):
+        if not name.endswith("_path") or not isinstance(value, str):
+            continue
+        if name == "traj_path":
+            traj = open_trajectory(value)
+            files = _source_identity(value) if os.path.exists(value) else []
+            sources[name] = {"header": traj.header, "n_frames": traj.n_frames, "files": files}
+        elif os.path.exists(value):
+            sources[name] = {"files": _source_identity(value)}
+    return sources
+
+def _prepare_work_dir(work_dir, manifest, resume):
+    """Reutiliza los segmentos ya hechos solo si el manifiesto coincide."""
+    manifest_path = os.path.join(work_dir, MANIFEST_FILE)
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return True
+        print("⚠️ Los segmentos guardados son de otra configuración: se empieza de cero.")
+    if os.path.isdir(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return False
+
+def render_video(make_scene, scene_args, n_frames, output, fps=FPS, width=WIDTH, height=HEIGHT, dpi=DPI,
+                 n_workers=N_WORKERS, segment_frames=SEGMENT_FRAMES, ffmpeg=FFMPEG, resume=True, keep_parts=False):
+    """
+    Renderiza n_frames cuadros de la escena a 'output'. Devuelve True si el
+    video quedó completo.
+    """
+    if shutil.which(ffmpeg) is None:
+        print(f"❌ No encuentro '{ffmpeg}'. Instálalo (p. ej. apt install ffmpeg) o indica la ruta con --ffmpeg.")
+        return False
+
+    scene = _scene_ref(make_scene)
+    segment_frames = segment_frames if segment_frames > 0 else n_frames
+    ext = os.path.splitext(output)[1] or ".mp4"
+    work_dir = output + ".parts"
+    manifest = {"scene": list(scene), "scene_args": scene_args, "n_frames": n_frames, "fps": fps,
+                "width": width, "height": height, "dpi": dpi, "segment_frames": segment_frames,
+                "encoder": ENCODER_ARGS + ["-threads", str(ENCODER_THREADS)], "sources": _scene_sources(scene_args)}
+    resumed = _prepare_work_dir(work_dir, manifest, resume)
+
+    segments = [(a, min(a + segment_frames, n_frames)) for a in range(0, n_frames, segment_frames)]
+    parts = [os.path.join(work_dir, f"segment_{k:05d}{ext}") for k in range(len(segments))]
+    todo = [k for k, part in enumerate(parts) if not os.path.exists(part)]
+    if resumed and len(todo) < len(parts):
+        print(f"--> Reanudando: {len(parts) - len(todo)}/{len(parts)} segmentos ya estaban listos")
+
+    print(f"🎬 Renderizando {n_frames} cuadros {width}x{height} @ {fps} fps con {n_workers} procesos "
+          f"({len(segments)} segmentos)")
+    start_time = time.time()
+    rendered = 0
+    log_path = os.path.join(work_dir, "ffmpeg.log")
+    with open(log_path, "ab") as log:
+        if todo:
+            indices = (i for k in todo for i in range(*segments[k]))
+            # 'spawn': un hijo creado con fork heredaría el stdin de ffmpeg y éste nunca vería el EOF
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker,
+                                     initargs=(scene, scene_args, width, height, dpi)) as pool:
+                frames = _rendered_frames(pool, indices, max(1, n_workers * PREFETCH))
+                for k in todo:
+                    a, b = segments[k]
+                    tmp = os.path.join(work_dir, f"segment_{k:05d}.part{ext}")
+                    proc = _ffmpeg_encode(ffmpeg, width, height, fps, tmp, log)
+                    try:
+                        for _ in range(a, b):
+                            proc.stdin.write(next(frames))
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass # ffmpeg murió: el código de salida lo explica
+                    if proc.wait() != 0:
+                        print(f"\n❌ ffmpeg falló en el segmento {k} (ver {log_path})")
+                        return False
+                    os.replace(tmp, parts[k])
+                    rendered += b - a
+                    elapsed = time.time() - start_time
+                    print(f"\r🎥 Segmento {k + 1}/{len(segments)} listo | {rendered / elapsed:.1f} cuadros/s", end="")
+            print()
+
+        if len(parts) == 1:
+            shutil.copyfile(parts[0], output)
+        elif _ffmpeg_concat(ffmpeg, parts, output, work_dir, log) != 0:
+            print(f"❌ ffmpeg falló al concatenar los segmentos (ver {log_path})")
+            return False
+
+    if not keep_parts:
+        shutil.rmtree(work_dir)
+    elapsed = time.time() - start_time
+    print(f"✅ ¡Video completado! Guardado como '{output}'")
+    print(f"⏱️ Tiempo de renderizado: {elapsed:.2f} segundos ({rendered} cuadros nuevos)")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renderizador de video paralelo - Proyecto Chimera")
+    parser.add_argument("--traj", type=str, default="data/processed/trajectory_taichi.traj", help="Trayectoria a renderizar")
+    parser.add_argument("--meta", type=str, default=META_FILE, help="Input con las masas")
+    parser.add_argument("--out", type=str, default="chimera.mp4", help="Video de salida")
+    parser.add_argument("--fps", type=int, default=FPS)
+    parser.add_argument("--size", type=str, default=f"{WIDTH}x{HEIGHT}", help="Resolución ANCHOxALTO (pares)")
+    parser.add_argument("--workers", type=int, default=N_WORKERS, help="Procesos de render")
+    parser.add_argument("--segment", type=int, default=SEGMENT_FRAMES, help="Cuadros por segmento (0 = uno solo)")
+    parser.add_argument("--lod", type=str, default='auto', choices=['auto', 'none', 'subsample', 'density'])
+    parser.add_argument("--points", type=int, default=LOD_POINTS, help="Puntos del submuestreo")
+    parser.add_argument("--bins", type=int, default=LOD_BINS, help="Celdas por lado en el modo densidad")
+    parser.add_argument("--stride", type=int, default=1, help="Usar un snapshot de cada tantos")
+    parser.add_argument("--interp", type=int, default=0, help="Cuadros interpolados entre snapshots")
+    parser.add_argument("--rotate", type=float, default=0.0, help="Grados de giro de la cámara por cuadro")
+    parser.add_argument("--view", type=str, default="3d", choices=["3d", "density"],
+                        help="3d: puntos en perspectiva; density: imagen de densidad proyectada en XY (rápida con N grande)")
+    parser.add_argument("--tone", type=str, default=TONE, choices=["asinh", "log", "linear"], help="Mapeo de tonos (--view density)")
+    parser.add_argument("--ffmpeg", type=str, default=FFMPEG, help="Ejecutable de ffmpeg")
+    parser.add_argument("--no-resume", action="store_true", help="Ignorar segmentos de una corrida anterior")
+    parser.add_argument("--keep-parts", action="store_true", help="No borrar los segmentos al terminar")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    if args.view == "density":
+        scene = density_scene
+        scene_args = {"traj_path": args.traj, "meta_path": args.meta, "stride": args.stride, "interp": args.interp,
+                      "tone": args.tone}
+    else:
+        scene = trajectory_scene
+        scene_args = {"traj_path": args.traj, "meta_path": args.meta, "lod": args.lod, "stride": args.stride,
+                      "interp": args.interp, "max_points": args.points, "bins": args.bins, "rotate": args.rotate}
+    render_video(scene, scene_args, trajectory_frames(args.traj, args.stride, args.interp), args.out,
+                 fps=args.fps, width=width, height=height, n_workers=args.workers, segment_frames=args.segment,
+                 ffmpeg=args.ffmpeg, resume=not args.no_resume, keep_parts=args.keep_parts)
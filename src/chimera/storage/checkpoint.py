@@ -0,0 +1,158 @@
+"""
+Proyecto Orión - Checkpoints (Guardar y Continuar)
+Guarda periódicamente el estado completo de una integración para poder
+continuarla con --resume si la máquina nos corre a mitad de camino.
+
+Estructura (un directorio por motor):
+    checkpoint_000120/state.npz       -> arreglos (pos, vel, masas...) + metadatos
+    checkpoint_000120/simulation.bin  -> (opcional) binario de REBOUND
+    LATEST                            -> nombre del último checkpoint completo
+
+LATEST solo se actualiza cuando el checkpoint ya está completo en disco,
+así que una interrupción durante el guardado deja intacto el anterior. La
+limpieza nunca borra el que nombra LATEST.
+
+Cada checkpoint guarda la identidad de la corrida (huella de las condiciones
+iniciales + configuración del motor): latest() se niega a devolver uno de otra
+corrida. Una corrida nueva (sin --resume) vacía el directorio con reset().
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+
+LATEST_FILE = "LATEST"
+STATE_FILE = "state.npz"
+REBOUND_FILE = "simulation.bin"
+KEEP_LAST = 2  # Checkpoints viejos que conservamos (por si el último está dañado)
+PREFIX = "checkpoint_"
+
+def run_identity(arrays, **config):
+    """
+    Identidad de una corrida: huella (sha256) de los arreglos de entrada más la
+    configuración del motor (escalares serializables a JSON).
+    """
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        a = np.ascontiguousarray(arrays[name])
+        digest.update(f"{name}:{a.dtype.str}:{a.shape}".encode())
+        digest.update(a.tobytes())
+    identity = {"input": digest.hexdigest()[:16], **config}
+    return json.loads(json.dumps(identity))  # Igual a como vuelve del disco (tuplas -> listas)
+
+def _step_of(name):
+    return int(name[len(PREFIX):])
+
+class CheckpointManager:
+    def __init__(self, directory, keep=KEEP_LAST, identity=None):
+        """identity: run_identity() de la corrida; se guarda en cada checkpoint y latest() la exige."""
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.identity = identity
+
+    def reset(self):
+        """Borra los checkpoints y LATEST (corrida nueva: nada de otra corrida queda para --resume)."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(PREFIX) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in (LATEST_FILE, LATEST_FILE + ".tmp"):
+                os.remove(path)
+
+    def save(self, step, arrays, meta=None, rebound_sim=None):
+        """
+        Guarda el estado del paso `step`.
+        arrays: dict de arreglos NumPy (se guardan sin pérdida)
+        meta: dict de escalares serializables a JSON (tiempo, cuadros escritos...)
+        rebound_sim: si se pasa, se guarda también su binario (estado del integrador)
+        """
+        name = f"{PREFIX}{step:09d}"
+        final_dir = os.path.join(self.directory, name)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        meta = dict(meta or {})
+        meta["step"] = int(step)
+        if self.identity is not None:
+            meta["identity"] = self.identity
+        with open(os.path.join(tmp_dir, STATE_FILE), "wb") as f:
+            np.savez(f, __meta__=np.array(json.dumps(meta)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if rebound_sim is not None:
+            rebound_path = os.path.join(tmp_dir, REBOUND_FILE)
+            # REBOUND >= 4 usa save_to_file; versiones viejas usan save
+            save = getattr(rebound_sim, "save_to_file", None) or rebound_sim.save
+            save(rebound_path)
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+        # Publicar el checkpoint recién terminado
+        tmp_latest = os.path.join(self.directory, LATEST_FILE + ".tmp")
+        with open(tmp_latest, "w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_latest, os.path.join(self.directory, LATEST_FILE))
+
+        self._prune()
+        return final_dir
+
+    def _latest_name(self):
+        latest_path = os.path.join(self.directory, LATEST_FILE)
+        if not os.path.exists(latest_path):
+            return None
+        with open(latest_path) as f:
+            return f.read().strip()
+
+    def _prune(self):
+        """
+        Conserva el que nombra LATEST y los keep-1 anteriores a él (por paso).
+        Los de pasos mayores que LATEST son de una corrida anterior: se borran.
+        """
+        latest = self._latest_name()
+        if latest is None:
+            return
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith(PREFIX) and not n.endswith(".tmp") and n != latest]
+        older = sorted((n for n in names if _step_of(n) < _step_of(latest)), key=_step_of)
+        keep = set(older[len(older) - (self.keep - 1):]) if self.keep > 1 else set()
+        for old in names:
+            if old not in keep:
+                shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+
+    def latest(self):
+        """
+        Devuelve el último checkpoint como dict con 'step', 'arrays', 'meta'
+        y 'rebound_file' (ruta o None). Si no hay ninguno, devuelve None.
+        ValueError si el checkpoint es de otra corrida (otra identidad).
+        """
+        name = self._latest_name()
+        if name is None:
+            return None
+        path = os.path.join(self.directory, name)
+
+        with np.load(os.path.join(path, STATE_FILE)) as data:
+            meta = json.loads(str(data["__meta__"]))
+            arrays = {k: data[k] for k in data.files if k != "__meta__"}
+
+        if self.identity is not None and meta.get("identity") != self.identity:
+            saved = meta.get("identity") or {}
+            diff = sorted(k for k in set(saved) | set(self.identity) if saved.get(k) != self.identity.get(k))
+            raise ValueError(f"El checkpoint {name} es de otra corrida (difiere: {', '.join(diff)})")
+
+        rebound_file = os.path.join(path, REBOUND_FILE)
+        return {
+            "step": meta["step"],
+            "arrays": arrays,
+            "meta": meta,
+            "rebound_file": rebound_file if os.path.exists(rebound_file) else None,
+        }
@@ -0,0 +1,136 @@
+"""
+Proyecto Orión - Registro de Conservación (Telemetría de la Corrida)
+Serie de tiempo de energía, momento lineal y momento angular que los motores
+escriben DENTRO del directorio de la trayectoria, en conservation.bin: un
+registro binario fijo (CONSERVATION_DTYPE, ~100 bytes) por medición, agregado
+y vaciado a disco en cuanto se mide.
+
+    step, t                      -> paso y tiempo del estado medido
+    kinetic, potential, energy   -> Msun (km/s)^2
+    momentum[3]                  -> sum m v
+    angular_momentum[3]          -> respecto al centro de masa
+    energy_drift                 -> |E - E0| / |E0| (E0 = primer registro)
+
+record() devuelve la deriva para que el motor aborte si se pasa del límite.
+Las fusiones en el motor cambian E sin que sea error de integración: el motor
+corre E0 con rebase() y lo guarda en sus checkpoints (energy0 al continuar).
+Con traj_path=None el registro queda en memoria (corridas sin disco): records().
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import io
+import os
+
+CONSERVATION_FILE = "conservation.bin"
+CONSERVATION_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("t", np.float64),
+    ("kinetic", np.float64),
+    ("potential", np.float64),
+    ("energy", np.float64),
+    ("momentum", np.float64, 3),
+    ("angular_momentum", np.float64, 3),
+    ("energy_drift", np.float64),
+])
+
+def angular_momentum_about_com(l_origin, mr, momentum, total_mass):
+    """L respecto al centro de masa a partir de sumas respecto a un origen fijo: L_o - (sum m r) x P / M."""
+    return np.asarray(l_origin) - np.cross(mr, momentum) / total_mass
+
+class ConservationLog:
+    """Agrega mediciones a <trayectoria>/conservation.bin."""
+
+    def __init__(self, traj_path, resume_step=None, energy0=None):
+        """
+        resume_step: al continuar desde un checkpoint, descarta los registros desde ese paso (se vuelven a medir).
+        energy0: E0 guardado en el checkpoint (si se corrió con rebase), en lugar del primer registro.
+        """
+        self.energy0 = energy0
+        self.last = None
+        if traj_path is None:
+            self.path = None
+            self._file = io.BytesIO()
+            return
+        os.makedirs(traj_path, exist_ok=True)
+        self.path = os.path.join(traj_path, CONSERVATION_FILE)
+
+        if resume_step is not None and os.path.exists(self.path):
+            records = open_conservation_log(traj_path)
+            records = records[records["step"] < resume_step]
+            records.tofile(self.path)
+            if len(records):
+                if energy0 is None:
+                    self.energy0 = float(records["energy"][0])
+                self.last = records[-1]
+            self._file = open(self.path, "ab")
+        else:
+            self._file = open(self.path, "wb")
+
+    def rebase(self, delta):
+        """Suma a E0 un cambio de energía que no es error de integración (p. ej. una fusión)."""
+        if self.energy0 is not None:
+            self.energy0 += delta
+
+    def record(self, step, t, kinetic, potential, momentum, angular_momentum):
+        energy = kinetic + potential
+        if self.energy0 is None:
+            self.energy0 = energy
+        rec = np.zeros(1, dtype=CONSERVATION_DTYPE)
+        rec["step"] = step
+        rec["t"] = t
+        rec["kinetic"] = kinetic
+        rec["potential"] = potential
+        rec["energy"] = energy
+        rec["momentum"] = momentum
+        rec["angular_momentum"] = angular_momentum
+        rec["energy_drift"] = abs(energy - self.energy0) / abs(self.energy0) if self.energy0 else 0.0
+        self._file.write(rec.tobytes())
+        self._file.flush()
+        self.last = rec[0]
+        return float(rec["energy_drift"][0])
+
+    def records(self):
+        """Registros escritos hasta ahora (arreglo estructurado)."""
+        if self.path is None:
+            return np.frombuffer(self._file.getvalue(), dtype=CONSERVATION_DTYPE).copy()
+        return open_conservation_log(os.path.dirname(self.path))
+
+    def close(self):
+        if self.path is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_conservation_log(traj_path):
+    """Registros de una trayectoria (arreglo estructurado; vacío si el motor no midió nada)."""
+    path = os.path.join(traj_path, CONSERVATION_FILE)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=CONSERVATION_DTYPE)
+    # Un registro a medias (corrida cortada) se ignora
+    count = os.path.getsize(path) // CONSERVATION_DTYPE.itemsize
+    return np.fromfile(path, dtype=CONSERVATION_DTYPE, count=count)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumen de la telemetría de conservación - Proyecto Chimera")
+    parser.add_argument("trajectory", type=str, help="Directorio .traj")
+    args = parser.parse_args()
+
+    records = open_conservation_log(args.trajectory)
+    if not len(records):
+        print(f"⚠️ {args.trajectory} no tiene registro de conservación.")
+    else:
+        p0 = np.linalg.norm(records["momentum"][0])
+        l0 = np.linalg.norm(records["angular_momentum"][0])
+        print(f"{'paso':>8} {'t':>10} {'E':>12} {'ΔE/E0':>10} {'|P|':>10} {'|L|':>10}")
+        for r in records:
+            print(f"{r['step']:>8} {r['t']:>10.2f} {r['energy']:>12.4e} {r['energy_drift']:>10.2e} "
+                  f"{np.linalg.norm(r['momentum']):>10.3e} {np.linalg.norm(r['angular_momentum']):>10.3e}")
+        print(f"--> {len(records)} registros | deriva máxima de energía {records['energy_drift'].max():.3e} | "
+              f"|P| {p0:.3e} -> {np.linalg.norm(records['momentum'][-1]):.3e} | "
+              f"|L| {l0:.3e} -> {np.linalg.norm(records['angular_momentum'][-1]):.3e}")
@@ -0,0 +1,128 @@
+"""
+Proyecto Orión - Registro de Fusiones en el Motor
+Con fusiones en el motor (--merge-radius) cada absorción queda en
+mergers.bin DENTRO del directorio de la trayectoria: un registro binario fijo
+(MERGER_DTYPE) por cuerpo absorbido, agregado y vaciado a disco en cuanto
+ocurre.
+
+    step, t                  -> paso y tiempo de la fusión
+    survivor, absorbed       -> IDs originales (fila en simulation_input)
+    survivor_mass            -> masa del sobreviviente antes de la fusión
+    absorbed_mass            -> masa del cuerpo absorbido
+    position, velocity       -> centro de masa y velocidad del resultado
+
+La trayectoria sigue teniendo una fila por ID original: un cuerpo absorbido
+se dibuja en la posición de quien lo absorbió. owners_at() reconstruye ese
+mapa de IDs en cualquier paso a partir del registro. Con traj_path=None el
+registro queda en memoria (corridas sin disco): records().
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import io
+import os
+
+MERGER_FILE = "mergers.bin"
+MERGER_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("t", np.float64),
+    ("survivor", np.int64),
+    ("absorbed", np.int64),
+    ("survivor_mass", np.float64),
+    ("absorbed_mass", np.float64),
+    ("position", np.float64, 3),
+    ("velocity", np.float64, 3),
+])
+
+class MergerLog:
+    """Agrega eventos de fusión a <trayectoria>/mergers.bin."""
+
+    def __init__(self, traj_path, resume_step=None):
+        """resume_step: al continuar desde un checkpoint, descarta los eventos desde ese paso (se vuelven a producir)."""
+        self.n_events = 0
+        if traj_path is None:
+            self.path = None
+            self._file = io.BytesIO()
+            return
+        os.makedirs(traj_path, exist_ok=True)
+        self.path = os.path.join(traj_path, MERGER_FILE)
+
+        if resume_step is not None and os.path.exists(self.path):
+            records = open_merger_log(traj_path)
+            records = records[records["step"] < resume_step]
+            records.tofile(self.path)
+            self.n_events = len(records)
+            self._file = open(self.path, "ab")
+        else:
+            self._file = open(self.path, "wb")
+
+    def record(self, step, t, events):
+        """events: arreglo MERGER_DTYPE (step y t se completan acá)."""
+        events = np.array(events, dtype=MERGER_DTYPE)
+        events["step"] = step
+        events["t"] = t
+        self._file.write(events.tobytes())
+        self._file.flush()
+        self.n_events += len(events)
+
+    def records(self):
+        """Eventos escritos hasta ahora (arreglo estructurado)."""
+        if self.path is None:
+            return np.frombuffer(self._file.getvalue(), dtype=MERGER_DTYPE).copy()
+        return open_merger_log(os.path.dirname(self.path))
+
+    def close(self):
+        if self.path is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_merger_log(traj_path):
+    """Eventos de una trayectoria (arreglo estructurado; vacío si no hubo fusiones en el motor)."""
+    path = os.path.join(traj_path, MERGER_FILE)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=MERGER_DTYPE)
+    # Un registro a medias (corrida cortada) se ignora
+    count = os.path.getsize(path) // MERGER_DTYPE.itemsize
+    return np.fromfile(path, dtype=MERGER_DTYPE, count=count)
+
+def owners_at(records, n_bodies, step=None):
+    """
+    ID original del cuerpo que contiene a cada uno de los n_bodies en el paso
+    dado (por defecto, al final): el propio ID si sigue vivo.
+    """
+    owner = np.arange(n_bodies, dtype=np.int64)
+    if step is not None:
+        records = records[records["step"] <= step]
+    owner[records["absorbed"]] = records["survivor"]
+    # Cadenas (a absorbido por b, b después por c): saltar hasta la raíz
+    while True:
+        grand = owner[owner]
+        if np.array_equal(grand, owner):
+            return owner
+        owner = grand
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumen del registro de fusiones en el motor - Proyecto Chimera")
+    parser.add_argument("trajectory", type=str, help="Directorio .traj")
+    args = parser.parse_args()
+
+    records = open_merger_log(args.trajectory)
+    if not len(records):
+        print(f"⚠️ {args.trajectory} no tiene fusiones registradas.")
+    else:
+        steps, per_step = np.unique(records["step"], return_counts=True)
+        print(f"{'paso':>8} {'t':>10} {'fusiones':>9}")
+        for step, n in zip(steps, per_step):
+            print(f"{step:>8} {records['t'][records['step'] == step][0]:>10.2f} {n:>9}")
+        n_bodies = int(max(records["survivor"].max(), records["absorbed"].max())) + 1
+        owner = owners_at(records, n_bodies)
+        roots, members = np.unique(owner, return_counts=True)
+        biggest = roots[np.argmax(members)]
+        print(f"--> {len(records)} cuerpos absorbidos en {len(steps)} pasos | "
+              f"el mayor remanente (ID {biggest}) junta {members.max()} galaxias")
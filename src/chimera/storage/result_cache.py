@@ -0,0 +1,149 @@
+"""
+Proyecto Orión - Caché de Resultados por Contenido
+Cada etapa de un barrido (condiciones iniciales, motor, análisis) guarda su
+salida en un directorio cuyo nombre es el hash de TODO lo que la determina:
+
+    clave = sha256(etapa, parámetros, claves de las etapas de las que depende,
+                   versión del código = hash de los archivos fuente involucrados)
+
+Los archivos fuente involucrados se sacan de los imports: los módulos de la
+etapa y todo lo de chimera.* que importan, directa o indirectamente (también
+los imports dentro de funciones). Se leen con ast, sin importar nada: armar
+las claves no inicializa Taichi ni carga los motores.
+
+Misma clave -> mismo resultado, se reutiliza. Si cambia un parámetro o el
+código de esa etapa (o de una anterior), la clave cambia y se recalcula solo
+desde ahí. Nada se sobrescribe: corridas distintas viven en claves distintas.
+
+    data/cache/<etapa>/<ab>/<clave>/
+        record.json  -> parámetros, dependencias, versión y resultado (se escribe al final)
+        ...          -> archivos de la etapa (trayectoria, input, catálogo)
+
+Cada entrada se arma en un directorio temporal y se publica con un rename
+atómico: una corrida cortada nunca deja una entrada a medias.
+Autor: Chris (Rubin1)
+"""
+
+import ast
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import time
+import uuid
+
+CACHE_DIR = "data/cache"
+RECORD_FILE = "record.json"
+
+def _canonical(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+def _source_path(name):
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        raise ImportError(f"No encuentro el módulo {name}")
+    return spec.origin
+
+def _find(name):
+    # find_spec importa los paquetes padre: acá solo son directorios (chimera.engines),
+    # nunca un módulo como gpu_taichi
+    try:
+        return importlib.util.find_spec(name)
+    except ImportError:
+        return None
+
+def _imported_modules(path, package):
+    """Módulos de package que importa el archivo (import x, from x import y, from x import submódulo)."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+            spec = _find(node.module) if node.module.startswith(package) else None
+            if spec is not None and spec.submodule_search_locations is not None:
+                # "from chimera.storage import trajectory_codec": lo importado es un módulo
+                names += [f"{node.module}.{alias.name}" for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name.startswith(package + "."):
+                spec = _find(name)
+                if spec is not None and spec.origin is not None and spec.origin.endswith(".py"):
+                    found.add(name)
+    return found
+
+def code_dependencies(*modules, package="chimera"):
+    """Los módulos dados más todos los de package que importan, siguiendo los imports hasta el final."""
+    pending, seen = list(modules), set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        pending.extend(_imported_modules(_source_path(name), package) - seen)
+    return sorted(seen)
+
+def code_version(*modules):
+    """Hash del código fuente de los módulos dados (por nombre de import) y de sus dependencias en chimera.*."""
+    digest = hashlib.sha256()
+    for name in code_dependencies(*modules):
+        origin = _source_path(name)
+        digest.update(name.encode())
+        with open(origin, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def stage_key(stage, params, depends=(), code=""):
+    """Clave de una etapa: sus parámetros, las claves de las que depende y la versión del código."""
+    payload = {"stage": stage, "params": params, "depends": list(depends), "code": code}
+    return hashlib.sha256(_canonical(payload).encode()).hexdigest()
+
+class ResultCache:
+    """Directorio de entradas <etapa>/<clave>, publicadas de forma atómica."""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key[:2], key)
+
+    def has(self, stage, key):
+        return os.path.isfile(os.path.join(self.path(stage, key), RECORD_FILE))
+
+    def load(self, stage, key):
+        with open(os.path.join(self.path(stage, key), RECORD_FILE)) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def build(self, stage, key, params=None, depends=(), code=""):
+        """
+        Directorio de trabajo para una entrada nueva. Al salir sin error se
+        guarda record.json con el resultado (entry['result']) y se publica.
+        """
+        final = self.path(stage, key)
+        tmp = os.path.join(self.root, stage, f".tmp-{key[:16]}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp)
+        entry = {"stage": stage, "key": key, "params": params, "depends": list(depends), "code": code,
+                 "dir": tmp, "result": None}
+        try:
+            yield entry
+            entry["created"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            entry.pop("dir")
+            with open(os.path.join(tmp, RECORD_FILE), "w") as f:
+                json.dump(entry, f, indent=2, default=str)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            try:
+                os.rename(tmp, final)
+            except OSError:
+                # Otro proceso publicó la misma clave primero: su resultado es equivalente
+                if not self.has(stage, key):
+                    raise
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
@@ -0,0 +1,158 @@
+"""
+Proyecto Orión - Formato de Condiciones Iniciales (sin pickle)
+Un directorio con una columna .npy cruda por cantidad más un header JSON:
+
+    simulation_input/
+        header.json      -> redshift, N, tamaño de caja, semilla, columnas
+        masses.npy       -> (N,)
+        positions.npy    -> (N, 3) en parsecs
+        velocities.npy   -> (N, 3) en km/s
+
+Cada columna se abre con mmap_mode (cero copias, lectura parcial, páginas
+compartidas entre procesos). El header se escribe al final: si no está,
+el directorio está incompleto.
+
+Uso para convertir archivos viejos (dict guardado con np.save):
+    python3 src/chimera/storage/simulation_input.py --convert data/processed/simulation_input.npy
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import json
+import os
+
+FORMAT_NAME = "orion-input"
+FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+DEFAULT_PATH = "data/processed/simulation_input"
+COLUMNS = {
+    "masses": (),
+    "positions": (3,),
+    "velocities": (3,),
+}
+
+class SimulationInput(dict):
+    """Se usa como el dict de siempre (data['masses'], data['redshift']...) más el header."""
+
+    def __init__(self, columns, header):
+        super().__init__(columns)
+        self["redshift"] = header.get("redshift")
+        self.header = header
+
+    @property
+    def n_galaxies(self):
+        return len(self["masses"])
+
+class SimulationInputWriter:
+    """Reserva las columnas en disco y deja escribirlas por bloques."""
+
+    def __init__(self, path, n_galaxies, redshift, dtype=np.float64, **header_extra):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        # Quitar el header viejo primero: hasta terminar, el directorio cuenta como incompleto
+        header_path = os.path.join(path, HEADER_FILE)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+
+        self.columns = {
+            name: np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+",
+                                            dtype=dtype, shape=(n_galaxies,) + tail)
+            for name, tail in COLUMNS.items()
+        }
+        self.header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "redshift": redshift,
+            "n_galaxies": int(n_galaxies),
+            "columns": {name: {"dtype": np.dtype(dtype).str, "shape": [int(n_galaxies)] + list(tail)}
+                        for name, tail in COLUMNS.items()},
+        }
+        self.header.update(header_extra)
+
+    def write(self, start, masses, positions, velocities):
+        stop = start + len(masses)
+        self.columns["masses"][start:stop] = masses
+        self.columns["positions"][start:stop] = positions
+        self.columns["velocities"][start:stop] = velocities
+
+    def close(self):
+        for column in self.columns.values():
+            column.flush()
+        self.columns = {}
+
+        tmp = os.path.join(self.path, HEADER_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.header, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, HEADER_FILE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Solo publicamos el header si todo salió bien
+        if exc_type is None:
+            self.close()
+
+def simulation_input_from_arrays(masses, positions, velocities, redshift, **header_extra):
+    """SimulationInput en memoria (mismo header que en disco), para pasar las condiciones iniciales sin archivos."""
+    header = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "redshift": redshift, "n_galaxies": len(masses)}
+    header.update(header_extra)
+    return SimulationInput({"masses": masses, "positions": positions, "velocities": velocities}, header)
+
+def save_simulation_input(path, masses, positions, velocities, redshift, **header_extra):
+    with SimulationInputWriter(path, len(masses), redshift, **header_extra) as writer:
+        writer.write(0, masses, positions, velocities)
+
+def _legacy_path(path):
+    if path.endswith(".npy") and os.path.isfile(path):
+        return path
+    if os.path.isfile(path + ".npy"):
+        return path + ".npy"
+    return None
+
+def open_simulation_input(path=DEFAULT_PATH, mmap_mode="r"):
+    """
+    Abre las condiciones iniciales sin deserializar nada: cada columna es un
+    np.memmap. Si solo existe el formato viejo (.npy con pickle) lo carga con
+    un aviso para que se convierta.
+    """
+    header_path = os.path.join(path, HEADER_FILE)
+    if os.path.isfile(header_path):
+        with open(header_path) as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} no es un directorio '{FORMAT_NAME}'")
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in COLUMNS}
+        return SimulationInput(columns, header)
+
+    legacy = _legacy_path(path)
+    if legacy is None:
+        raise FileNotFoundError(f"No encuentro {path}")
+
+    print(f"⚠️ {legacy} usa el formato viejo (pickle). Conviértelo con: "
+          f"python3 src/chimera/storage/simulation_input.py --convert {legacy}")
+    data = np.load(legacy, allow_pickle=True).item()
+    header = {"format": "legacy-npy", "redshift": data.get("redshift"), "n_galaxies": len(data["masses"])}
+    return SimulationInput({name: data[name] for name in COLUMNS}, header)
+
+def convert_legacy_input(npy_path, out_path=None):
+    """Convierte un simulation_input.npy (dict con pickle) al formato por columnas."""
+    if out_path is None:
+        out_path = os.path.splitext(npy_path)[0]
+    data = np.load(npy_path, allow_pickle=True).item()
+    extra = {k: (v.item() if hasattr(v, "item") else v) for k, v in data.items()
+             if k not in COLUMNS and k != "redshift" and np.isscalar(v)}
+    save_simulation_input(out_path, data["masses"], data["positions"], data["velocities"],
+                          data.get("redshift"), converted_from=os.path.basename(npy_path), **extra)
+    return out_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convertidor de condiciones iniciales - Proyecto Chimera")
+    parser.add_argument("--convert", type=str, required=True, help="Archivo .npy viejo (dict con pickle)")
+    parser.add_argument("--out", type=str, default=None, help="Directorio de salida (por defecto, mismo nombre sin .npy)")
+    args = parser.parse_args()
+
+    out = convert_legacy_input(args.convert, args.out)
+    print(f"✅ Convertido: {args.convert} -> {out}")
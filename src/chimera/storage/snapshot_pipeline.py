@@ -0,0 +1,128 @@
+"""
+Proyecto Orión - Pipeline Asíncrono de Snapshots
+Saca los snapshots del camino crítico: el bucle de simulación solo reserva un
+slot y encola el cuadro; un hilo escritor hace la copia dispositivo -> RAM,
+la conversión de tipo (opcional) y la escritura a disco mientras siguen los
+pasos siguientes.
+
+    bucle:   slot = pipe.acquire()        -> espera solo si los 'depth' slots están ocupados
+             (copiar el cuadro al slot, p. ej. un campo de staging en la GPU)
+             pipe.submit(slot, t)
+    hilo:    fetch(slot, buffer) -> astype -> writer.append -> slot libre otra vez
+
+La cola está acotada a 'depth' cuadros y los buffers de host se reservan una
+sola vez: la memoria no crece aunque el disco vaya más lento que la GPU
+(back-pressure). Si el hilo falla, el error se relanza en el bucle.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import contextlib
+import queue
+import sys
+import threading
+import time
+
+from chimera.profiling.tracer import span, count
+
+SNAPSHOT_DEPTH = 3  # Cuadros en vuelo como máximo (slots de staging + buffers de host)
+SWITCH_INTERVAL_S = 1e-3  # Cambio de hilo del GIL mientras corre el pipeline (Python usa 5 ms)
+
+class SnapshotPipeline:
+    """
+    fetch(slot, out): copia el cuadro del slot al arreglo de host 'out' (corre
+    en el hilo escritor). lock: si se da, fetch corre con él tomado, para
+    runtimes (como Taichi) que no aceptan llamadas desde dos hilos a la vez.
+    """
+
+    def __init__(self, writer, shape, fetch, depth=SNAPSHOT_DEPTH, fetch_dtype=np.float32, lock=None):
+        self.writer = writer
+        self.fetch = fetch
+        self.lock = lock if lock is not None else contextlib.nullcontext()
+        self.depth = depth
+
+        # Buffers de host reutilizados: uno por slot, más el de conversión si el writer usa otro dtype
+        self.buffers = [np.empty(shape, dtype=fetch_dtype) for _ in range(depth)]
+        self.cast = None
+        if np.dtype(writer.dtype) != np.dtype(fetch_dtype):
+            self.cast = np.empty(shape, dtype=writer.dtype)
+
+        self._free = queue.Queue()
+        for slot in range(depth):
+            self._free.put(slot)
+        self._pending = queue.Queue(maxsize=depth)
+        self._error = None
+
+        self.wait_seconds = 0.0   # Tiempo que el bucle esperó por un slot libre
+        self.write_seconds = 0.0  # Tiempo del hilo escritor (copia + conversión + disco)
+        self.frames = 0
+
+        # Con 5 ms por defecto, cada entrega bucle <-> hilo puede costar un cambio de GIL entero
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, SWITCH_INTERVAL_S))
+
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            slot, t = item
+            try:
+                if self._error is None:
+                    t0 = time.perf_counter()
+                    out = self.buffers[slot]
+                    with self.lock, span("snapshot.fetch"):
+                        self.fetch(slot, out)
+                    if self.cast is not None:
+                        np.copyto(self.cast, out, casting="same_kind")
+                        out = self.cast
+                    with span("snapshot.write", t=t):
+                        self.writer.append(out, t=t)
+                    self.write_seconds += time.perf_counter() - t0
+                    self.frames += 1
+                    count("snapshots")
+            except BaseException as exc:
+                self._error = exc
+            finally:
+                self._free.put(slot)
+                self._pending.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("Falló el hilo escritor de snapshots") from self._error
+
+    def acquire(self):
+        """Reserva un slot libre. Bloquea si todos están en vuelo (back-pressure)."""
+        self._check()
+        t0 = time.perf_counter()
+        with span("snapshot.wait"):
+            slot = self._free.get()
+        self.wait_seconds += time.perf_counter() - t0
+        return slot
+
+    def submit(self, slot, t):
+        """Encola el cuadro ya copiado al slot para que el hilo lo escriba."""
+        self._check()
+        self._pending.put((slot, t))
+
+    def drain(self):
+        """Espera a que todos los cuadros encolados estén en disco (p. ej. antes de un checkpoint)."""
+        self._pending.join()
+        self._check()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._pending.put(None)
+            self._thread.join()
+            sys.setswitchinterval(self._switch_interval)
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,177 @@
+"""
+Proyecto Orión - Codificación Comprimida de Trayectorias
+Los cuadros crudos (float32, N x 3) ocupan lo mismo aunque entre dos
+snapshots cada galaxia se mueva muy poco. La codificación "quantized" los
+guarda así, por bloques de cuadros:
+
+    1. Cuantización: q = round(x / quantum), con quantum = precision * caja
+       (precision=1e-6 en una caja de 5 Mpc -> 5 pc, por debajo del suavizado).
+    2. Predicción lineal dentro del bloque: el primer cuadro va entero, el
+       segundo como diferencia y los demás como q_t - 2 q_{t-1} + q_{t-2}
+       (lo que se aparta del movimiento en línea recta: casi siempre ~0).
+    3. Zigzag a enteros sin signo, bytes separados por planos y zlib.
+
+Cada bloque se decodifica solo (sin mirar los anteriores), así un cuadro
+cualquiera cuesta leer y descomprimir únicamente su bloque:
+
+    positions.qz   -> bloques comprimidos uno tras otro
+    chunks.idx     -> un registro INDEX_DTYPE por bloque (primer cuadro, cuadros, offset, bytes)
+
+El error por coordenada es como mucho quantum / 2. En una corrida de 4000
+galaxias los archivos quedan ~10 veces más chicos que los crudos.
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import os
+import zlib
+from collections import OrderedDict
+
+ENCODING_NAME = "quantized"
+POSITIONS_FILE = "positions.qz"
+INDEX_FILE = "chunks.idx"
+PRECISION = 1e-6             # Paso de cuantización relativo a la caja
+CHUNK_FRAMES = 32            # Cuadros por bloque (cada bloque paga un cuadro completo)
+CHUNK_BYTES = 64 * 1024**2   # Tope de RAM de un bloque sin comprimir (acota los bloques con N grande)
+COMPRESSION_LEVEL = 6        # zlib (1 = rápido, 9 = más chico)
+CACHE_CHUNKS = 2             # Bloques decodificados que se guardan al leer (interpolar entre dos cuadros)
+INDEX_DTYPE = np.dtype([("frame", np.int64), ("n_frames", np.int64), ("offset", np.int64), ("nbytes", np.int64)])
+INT32_MAX = 2**31 - 1
+
+def chunk_frames_for(n_bodies, dtype=np.float32, chunk_frames=CHUNK_FRAMES, chunk_bytes=CHUNK_BYTES):
+    """Cuadros por bloque: chunk_frames, o menos si un bloque de N cuerpos pasaría de chunk_bytes."""
+    frame_bytes = max(1, int(n_bodies) * 3 * np.dtype(dtype).itemsize)
+    return max(1, min(int(chunk_frames), chunk_bytes // frame_bytes))
+
+def encoding_header(precision=PRECISION, box_size=None, chunk_frames=CHUNK_FRAMES, level=COMPRESSION_LEVEL):
+    """Entrada "encoding" del header.json. Sin box_size, el quantum se fija con el primer bloque."""
+    return {
+        "name": ENCODING_NAME,
+        "codec": "zlib",
+        "level": int(level),
+        "precision": float(precision),
+        "box_size": float(box_size) if box_size else None,
+        "quantum": float(precision * box_size) if box_size else None,
+        "chunk_frames": int(chunk_frames),
+    }
+
+def infer_box_size(frames):
+    """Tamaño de la caja a partir de la extensión del primer cuadro (si el motor no lo sabe)."""
+    frame = np.asarray(frames[0], dtype=np.float64)
+    extent = float(np.max(frame.max(axis=0) - frame.min(axis=0))) if len(frame) else 0.0
+    return extent if extent > 0 else 1.0
+
+def encode_chunk(frames, quantum, level=COMPRESSION_LEVEL):
+    """Bloque (F, N, 3) -> bytes comprimidos."""
+    q = np.rint(np.asarray(frames, dtype=np.float64) / quantum)
+    if q.size and np.abs(q).max() > INT32_MAX:
+        raise ValueError(f"Posiciones fuera del rango cuantizable con quantum={quantum:g}: "
+                         f"usar una precisión más gruesa")
+    q = q.astype(np.int32).reshape(len(q), -1)
+    # Los residuos se calculan en int32 con desborde circular: al decodificar con la
+    # misma aritmética (módulo 2^32) se recupera q exacto
+    residual = q.copy()
+    residual[1:] -= q[:-1]
+    residual[2:] -= q[1:-1] - q[:-2]
+    # Zigzag: residuos chicos (de cualquier signo) -> enteros sin signo chicos
+    zigzag = ((residual << 1) ^ (residual >> 31)).view(np.uint32).ravel()
+    # Planos de bytes: los bytes altos (casi todos cero) quedan juntos y zlib los aplasta
+    planes = np.empty((4, zigzag.size), dtype=np.uint8)
+    for k in range(4):
+        planes[k] = zigzag >> (8 * k)
+    return zlib.compress(planes.tobytes(), level)
+
+def decode_chunk(blob, n_frames, n_bodies):
+    """bytes -> enteros cuantizados (F, N, 3) int32."""
+    planes = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(4, -1)
+    zigzag = planes[3].astype(np.uint32)
+    for k in (2, 1, 0):
+        zigzag <<= 8
+        zigzag |= planes[k]
+    q = ((zigzag >> 1) ^ (np.uint32(0) - (zigzag & 1))).view(np.int32).reshape(n_frames, -1)
+    # Deshacer la predicción: dos sumas acumuladas cuadro a cuadro (la segunda desde
+    # el primer cuadro completo). Por filas es ~10x más rápido que cumsum(axis=0)
+    for t in range(2, n_frames):
+        q[t] += q[t - 1]
+    for t in range(1, n_frames):
+        q[t] += q[t - 1]
+    return q.reshape(n_frames, n_bodies, 3)
+
+def read_index(path):
+    """Registros de los bloques completos de una trayectoria (un bloque a medias se ignora)."""
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+    index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=count)
+    data_size = os.path.getsize(os.path.join(path, POSITIONS_FILE))
+    return index[index["offset"] + index["nbytes"] <= data_size]
+
+class QuantizedFrames:
+    """
+    Cuadros de una trayectoria cuantizada. Se indexa como el arreglo
+    (Frames, N, 3) (enteros, slices, listas) pero solo lee y descomprime los
+    bloques que contienen los cuadros pedidos, con una caché de CACHE_CHUNKS bloques.
+    """
+
+    def __init__(self, path, n_bodies, dtype, encoding, max_frames=None, cache_chunks=CACHE_CHUNKS):
+        self.path = os.path.join(path, POSITIONS_FILE)
+        self.encoding = encoding
+        self.dtype = np.dtype(dtype)
+        self.index = read_index(path)
+        n_frames = int(self.index["n_frames"].sum())
+        if max_frames is not None:
+            n_frames = min(n_frames, int(max_frames))
+        self.shape = (n_frames, int(n_bodies), 3)
+        self.ndim = 3
+        self.cache_chunks = max(1, int(cache_chunks))
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunk(self, k):
+        """Bloque k decodificado (F, N, 3) en el dtype de la trayectoria (solo lectura)."""
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            return self._cache[k]
+        record = self.index[k]
+        with open(self.path, "rb") as f:
+            f.seek(int(record["offset"]))
+            blob = f.read(int(record["nbytes"]))
+        q = decode_chunk(blob, int(record["n_frames"]), self.shape[1])
+        frames = np.multiply(q, self.dtype.type(self.encoding["quantum"]), dtype=self.dtype)
+        frames.flags.writeable = False  # Como el memmap de solo lectura de los cuadros crudos
+        self._cache[k] = frames
+        if len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+        return frames
+
+    def frame(self, i):
+        n_frames = self.shape[0]
+        if i < 0:
+            i += n_frames
+        if not 0 <= i < n_frames:
+            raise IndexError(f"Cuadro {i} fuera de rango (la trayectoria tiene {n_frames})")
+        k = int(np.searchsorted(self.index["frame"], i, side="right")) - 1
+        return self.chunk(k)[i - int(self.index["frame"][k])]
+
+    def __getitem__(self, index):
+        rest = ()
+        if isinstance(index, tuple):
+            index, rest = index[0], index[1:]
+        if isinstance(index, (int, np.integer)):
+            out = self.frame(int(index))
+            return out[rest] if rest else out
+        # Varios cuadros: se decodifica cada bloque una sola vez y se copian sus cuadros de una
+        frames = np.arange(self.shape[0])[index]
+        chunks = np.searchsorted(self.index["frame"], frames, side="right") - 1
+        out = np.empty((len(frames),) + self.shape[1:], dtype=self.dtype)
+        for k in np.unique(chunks):
+            rows = chunks == k
+            out[rows] = self.chunk(int(k))[frames[rows] - self.index["frame"][k]]
+        return out[(slice(None),) + rest] if rest else out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
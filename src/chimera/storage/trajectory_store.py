@@ -0,0 +1,439 @@
+"""
+Proyecto Orión - Almacén de Trayectorias (Streaming)
+Formato en disco de solo-agregar para snapshots (N, 3): los motores escriben
+cada foto en cuanto la producen y los analizadores la leen con memory-mapping.
+
+Estructura de una trayectoria (un directorio "*.traj"):
+    header.json    -> N, dtype, motor, metadatos y número de cuadros
+    positions.bin  -> cuadros crudos (C-order) uno tras otro
+    times.bin      -> tiempo de cada cuadro (float64)
+
+Si el proceso muere a mitad de la corrida, los cuadros ya escritos siguen ahí:
+el número real de cuadros se deduce del tamaño de los archivos.
+
+Con encoding="quantized" (trajectory_codec.py) positions.bin se reemplaza por
+positions.qz + chunks.idx: posiciones cuantizadas, predicción entre cuadros
+y zlib por bloques, ~10 veces más chico. open_trajectory() lo decodifica
+solo y la vista Trajectory se usa igual (traj[i] descomprime solo su bloque).
+
+Sin ruta (create_trajectory_writer(None, ...)) los cuadros quedan en RAM y
+writer.trajectory() los devuelve como la misma vista Trajectory: para las
+corridas chicas del pipeline en un solo proceso (chimera/pipeline.py).
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.profiling.tracer import span
+from chimera.storage import trajectory_codec as codec
+
+FORMAT_NAME = "orion-traj"
+FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+POSITIONS_FILE = "positions.bin"
+TIMES_FILE = "times.bin"
+CHUNK_FRAMES = 8  # Cuadros que se juntan en RAM antes de cada escritura a disco
+ENCODINGS = ["raw", codec.ENCODING_NAME]
+ENCODING = "raw"  # Por defecto sin pérdida; "quantized" para archivos ~10x más chicos
+
+def _write_header(path, header):
+    # Escritura atómica: nunca dejamos un header.json a medias
+    tmp = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, os.path.join(path, HEADER_FILE))
+
+class TrajectoryWriter:
+    """Escribe snapshots a disco por bloques de `chunk_frames` cuadros."""
+
+    def __init__(self, path, n_bodies, dtype=np.float32, engine="", metadata=None, chunk_frames=CHUNK_FRAMES,
+                 resume_frames=None):
+        """
+        resume_frames: si no es None, reabre una trayectoria existente y la
+        recorta a ese número de cuadros (para continuar desde un checkpoint).
+        """
+        self.path = path
+        self.n_bodies = int(n_bodies)
+        self.dtype = np.dtype(dtype)
+        self.chunk_frames = max(1, int(chunk_frames))
+
+        os.makedirs(path, exist_ok=True)
+        self.header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "n_bodies": self.n_bodies,
+            "dtype": self.dtype.str,
+            "engine": engine,
+            "metadata": metadata or {},
+            "n_frames": 0,
+        }
+        carry = self._open(resume_frames)
+        self.header["n_frames"] = self.n_frames
+
+        # Buffer de bloque reutilizable (no crece con la corrida)
+        self._buffer = np.empty((self.chunk_frames, self.n_bodies, 3), dtype=self.dtype)
+        self._times = np.empty(self.chunk_frames, dtype=np.float64)
+        self._pending = 0
+        if carry is not None:
+            # Cuadros de un bloque a medio recortar: vuelven al buffer y se reescriben con el próximo
+            frames, times = carry
+            self._buffer[:len(frames)] = frames
+            self._times[:len(frames)] = times
+            self._pending = len(frames)
+
+        _write_header(path, self.header)
+
+    def _open(self, resume_frames):
+        """Abre los archivos (recortando a resume_frames). Devuelve cuadros a re-agregar, o None."""
+        pos_path = os.path.join(self.path, POSITIONS_FILE)
+        time_path = os.path.join(self.path, TIMES_FILE)
+        if resume_frames is None:
+            self._pos_file = open(pos_path, "wb")
+            self._time_file = open(time_path, "wb")
+            self.n_frames = 0
+            return None
+
+        # Descartar cuadros escritos después del checkpoint (se van a recalcular)
+        frame_bytes = self.n_bodies * 3 * self.dtype.itemsize
+        if os.path.getsize(pos_path) < resume_frames * frame_bytes:
+            raise ValueError(f"{self.path} tiene menos de {resume_frames} cuadros, no se puede continuar")
+        self._pos_file = open(pos_path, "r+b")
+        self._time_file = open(time_path, "r+b")
+        self._pos_file.truncate(resume_frames * frame_bytes)
+        self._time_file.truncate(resume_frames * 8)
+        self._pos_file.seek(0, os.SEEK_END)
+        self._time_file.seek(0, os.SEEK_END)
+        self.n_frames = int(resume_frames)
+        return None
+
+    def append(self, positions, t):
+        """Agrega un cuadro (N, 3). Se escribe a disco al completar el bloque."""
+        positions = np.asarray(positions)
+        if positions.shape != (self.n_bodies, 3):
+            raise ValueError(f"Se esperaba un cuadro ({self.n_bodies}, 3) y llegó {positions.shape}")
+
+        self._buffer[self._pending] = positions
+        self._times[self._pending] = t
+        self._pending += 1
+        if self._pending == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        with span("trajectory.flush", frames=self._pending):
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._write_chunk(self._buffer[:self._pending], self._times[:self._pending])
+            self.n_frames += self._pending
+            self._pending = 0
+
+        for f in self._files():
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.header["n_frames"] = self.n_frames
+        _write_header(self.path, self.header)
+
+    def _write_chunk(self, frames, times):
+        self._pos_file.write(frames.tobytes())
+        self._time_file.write(times.tobytes())
+
+    def _files(self):
+        return [self._pos_file, self._time_file]
+
+    def close(self):
+        if self._pos_file.closed:
+            return
+        self.flush()
+        for f in self._files():
+            f.close()
+
+    def trajectory(self):
+        """Lo escrito hasta ahora, como Trajectory (memory-mapped)."""
+        return open_trajectory(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Aunque la corrida explote, lo que ya se calculó queda en disco
+        self.close()
+
+class QuantizedTrajectoryWriter(TrajectoryWriter):
+    """
+    TrajectoryWriter con la codificación comprimida de trajectory_codec.py.
+    Cada flush escribe un bloque independiente: el bloque (chunk_frames
+    cuadros por defecto) es también lo que se pierde si el proceso muere.
+    """
+
+    def __init__(self, path, n_bodies, dtype=np.float32, engine="", metadata=None, chunk_frames=None,
+                 resume_frames=None, precision=codec.PRECISION, box_size=None, level=codec.COMPRESSION_LEVEL):
+        """
+        precision: paso de cuantización relativo a box_size (si es None, se usa
+        metadata["box_size_pc"] o la extensión del primer cuadro).
+        """
+        box_size = box_size or (metadata or {}).get("box_size_pc")
+        if chunk_frames is None:
+            chunk_frames = codec.chunk_frames_for(n_bodies, dtype)
+        self.encoding = codec.encoding_header(precision, box_size, chunk_frames, level)
+        super().__init__(path, n_bodies, dtype, engine=engine, metadata=metadata, chunk_frames=chunk_frames,
+                         resume_frames=resume_frames)
+
+    def _open(self, resume_frames):
+        pos_path = os.path.join(self.path, codec.POSITIONS_FILE)
+        index_path = os.path.join(self.path, codec.INDEX_FILE)
+        time_path = os.path.join(self.path, TIMES_FILE)
+        self.header["encoding"] = self.encoding
+        if resume_frames is None:
+            self._pos_file = open(pos_path, "wb")
+            self._index_file = open(index_path, "wb")
+            self._time_file = open(time_path, "wb")
+            self.n_frames = 0
+            return None
+
+        # Mismo quantum y bloques que la corrida original
+        old = open_trajectory(self.path)
+        if old.header.get("encoding", {}).get("name") != codec.ENCODING_NAME:
+            raise ValueError(f"{self.path} no es una trayectoria '{codec.ENCODING_NAME}', no se puede continuar")
+        if old.n_frames < resume_frames:
+            raise ValueError(f"{self.path} tiene menos de {resume_frames} cuadros, no se puede continuar")
+        self.encoding = self.header["encoding"] = old.header["encoding"]
+        index = old.positions.index
+        keep = index[index["frame"] + index["n_frames"] <= resume_frames]
+        self.n_frames = int(keep["n_frames"].sum())
+        carry = None
+        if self.n_frames < resume_frames:
+            # El checkpoint cae a mitad de un bloque: sus primeros cuadros se vuelven a escribir
+            carry = (np.array(old[self.n_frames:resume_frames]), old.times[self.n_frames:resume_frames].copy())
+
+        self._pos_file = open(pos_path, "r+b")
+        self._index_file = open(index_path, "r+b")
+        self._time_file = open(time_path, "r+b")
+        self._pos_file.truncate(int(keep["offset"][-1] + keep["nbytes"][-1]) if len(keep) else 0)
+        self._index_file.truncate(len(keep) * codec.INDEX_DTYPE.itemsize)
+        self._time_file.truncate(self.n_frames * 8)
+        for f in self._files():
+            f.seek(0, os.SEEK_END)
+        return carry
+
+    def _write_chunk(self, frames, times):
+        if self.encoding["quantum"] is None:
+            box_size = codec.infer_box_size(frames)
+            self.encoding.update(codec.encoding_header(self.encoding["precision"], box_size,
+                                                       self.chunk_frames, self.encoding["level"]))
+        blob = codec.encode_chunk(frames, self.encoding["quantum"], self.encoding["level"])
+        record = np.array((self.n_frames, len(frames), self._pos_file.tell(), len(blob)), dtype=codec.INDEX_DTYPE)
+        self._pos_file.write(blob)
+        self._index_file.write(record.tobytes())
+        self._time_file.write(times.tobytes())
+
+    def _files(self):
+        return [self._pos_file, self._index_file, self._time_file]
+
+class MemoryTrajectoryWriter:
+    """Misma interfaz que TrajectoryWriter, pero los cuadros se guardan en RAM (nada toca el disco)."""
+
+    def __init__(self, n_bodies, dtype=np.float32, engine="", metadata=None):
+        self.path = None
+        self.n_bodies = int(n_bodies)
+        self.dtype = np.dtype(dtype)
+        self.n_frames = 0
+        self.header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "n_bodies": self.n_bodies,
+            "dtype": self.dtype.str,
+            "engine": engine,
+            "metadata": metadata or {},
+            "n_frames": 0,
+        }
+        self._frames = []
+        self._times = []
+
+    def append(self, positions, t):
+        positions = np.asarray(positions)
+        if positions.shape != (self.n_bodies, 3):
+            raise ValueError(f"Se esperaba un cuadro ({self.n_bodies}, 3) y llegó {positions.shape}")
+        # Copia: los motores reutilizan sus buffers de snapshot
+        self._frames.append(positions.astype(self.dtype, copy=True))
+        self._times.append(t)
+        self.n_frames += 1
+        self.header["n_frames"] = self.n_frames
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def trajectory(self):
+        if self._frames:
+            positions = np.stack(self._frames)
+        else:
+            positions = np.empty((0, self.n_bodies, 3), dtype=self.dtype)
+        return Trajectory(positions, np.array(self._times, dtype=np.float64), dict(self.header))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def create_trajectory_writer(path, n_bodies, dtype=np.float32, engine="", metadata=None, resume_frames=None,
+                             encoding=None, precision=codec.PRECISION, box_size=None):
+    """
+    TrajectoryWriter en 'path' (encoding: "raw" o "quantized", por defecto
+    ENCODING), o uno en memoria si path es None.
+    """
+    if path is None:
+        if resume_frames is not None:
+            raise ValueError("Una trayectoria en memoria no se puede continuar desde un checkpoint")
+        return MemoryTrajectoryWriter(n_bodies, dtype, engine=engine, metadata=metadata)
+    encoding = encoding or ENCODING
+    if encoding == codec.ENCODING_NAME:
+        return QuantizedTrajectoryWriter(path, n_bodies, dtype, engine=engine, metadata=metadata,
+                                         resume_frames=resume_frames, precision=precision, box_size=box_size)
+    if encoding != "raw":
+        raise ValueError(f"Codificación desconocida: {encoding} (opciones: {', '.join(ENCODINGS)})")
+    return TrajectoryWriter(path, n_bodies, dtype, engine=engine, metadata=metadata, resume_frames=resume_frames)
+
+class Trajectory:
+    """
+    Vista de solo-lectura de una trayectoria. Se indexa como un arreglo
+    (Frames, N, 3) pero los datos viven en disco (np.memmap, o bloques
+    comprimidos que se decodifican al pedirlos).
+    """
+
+    def __init__(self, positions, times, header):
+        self.positions = positions
+        self.times = times
+        self.header = header
+
+    @property
+    def n_frames(self):
+        return self.positions.shape[0]
+
+    @property
+    def n_bodies(self):
+        return self.positions.shape[1]
+
+    @property
+    def shape(self):
+        return self.positions.shape
+
+    @property
+    def dtype(self):
+        return self.positions.dtype
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, index):
+        return self.positions[index]
+
+def _resolve_path(path):
+    # Compatibilidad: si piden "x.traj" y solo existe "x.npy" (formato viejo), o al revés
+    if os.path.exists(path):
+        return path
+    root, ext = os.path.splitext(path)
+    alt = root + (".npy" if ext == ".traj" else ".traj")
+    if os.path.exists(alt):
+        return alt
+    raise FileNotFoundError(f"No encuentro la trayectoria {path}")
+
+def open_trajectory(path, mmap_mode="r"):
+    """Abre una trayectoria (.traj o .npy viejo) sin cargarla completa en RAM."""
+    path = _resolve_path(path)
+
+    if not os.path.isdir(path):
+        # Formato viejo: un solo .npy (Frames, N, 3)
+        positions = np.load(path, mmap_mode=mmap_mode)
+        header = {"format": "npy", "n_bodies": positions.shape[1], "dtype": positions.dtype.str,
+                  "engine": "", "metadata": {}, "n_frames": positions.shape[0]}
+        return Trajectory(positions, np.arange(positions.shape[0], dtype=np.float64), header)
+
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} no es una trayectoria '{FORMAT_NAME}'")
+
+    dtype = np.dtype(header["dtype"])
+    n_bodies = header["n_bodies"]
+    frame_bytes = n_bodies * 3 * dtype.itemsize
+    time_file = os.path.join(path, TIMES_FILE)
+
+    encoding = header.get("encoding")
+    if encoding is not None:
+        if encoding.get("name") != codec.ENCODING_NAME:
+            raise ValueError(f"{path} usa una codificación desconocida: {encoding.get('name')}")
+        positions = codec.QuantizedFrames(path, n_bodies, dtype, encoding, max_frames=os.path.getsize(time_file) // 8)
+        return Trajectory(positions, np.fromfile(time_file, dtype=np.float64, count=len(positions)), header)
+
+    # Los archivos mandan: si la corrida murió, el header puede ir atrasado
+    pos_file = os.path.join(path, POSITIONS_FILE)
+    n_frames = min(os.path.getsize(pos_file) // frame_bytes, os.path.getsize(time_file) // 8)
+
+    if n_frames == 0:
+        positions = np.empty((0, n_bodies, 3), dtype=dtype)
+    else:
+        positions = np.memmap(pos_file, dtype=dtype, mode=mmap_mode, shape=(n_frames, n_bodies, 3))
+    times = np.fromfile(time_file, dtype=np.float64, count=n_frames)
+    return Trajectory(positions, times, header)
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def convert_trajectory(src, dst, encoding=codec.ENCODING_NAME, precision=codec.PRECISION, box_size=None):
+    """
+    Reescribe una trayectoria con otra codificación (p. ej. para archivar o
+    mover por la red). Los registros que viven en el directorio
+    (conservation.bin, mergers.bin) se copian tal cual.
+    """
+    traj = open_trajectory(src)
+    metadata = traj.header.get("metadata", {})
+    with create_trajectory_writer(dst, traj.n_bodies, traj.dtype, engine=traj.header.get("engine", ""),
+                                  metadata=metadata, encoding=encoding, precision=precision,
+                                  box_size=box_size) as writer:
+        for i in range(traj.n_frames):
+            writer.append(traj[i], t=traj.times[i])
+    if os.path.isdir(src):
+        own = {HEADER_FILE, POSITIONS_FILE, TIMES_FILE, codec.POSITIONS_FILE, codec.INDEX_FILE}
+        for name in os.listdir(src):
+            if name not in own and os.path.isfile(os.path.join(src, name)):
+                shutil.copy2(os.path.join(src, name), os.path.join(dst, name))
+    return open_trajectory(dst)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversión de trayectorias (cruda <-> comprimida) - Proyecto Chimera")
+    parser.add_argument("src", type=str, help="Trayectoria de entrada (.traj o .npy viejo)")
+    parser.add_argument("dst", type=str, help="Trayectoria de salida (.traj)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=codec.ENCODING_NAME, help="Codificación de la salida")
+    parser.add_argument("--precision", type=float, default=codec.PRECISION,
+                        help="Paso de cuantización relativo a la caja (quantized)")
+    parser.add_argument("--box", type=float, default=None,
+                        help="Tamaño de la caja en pc (por defecto, el de los metadatos o el del primer cuadro)")
+    args = parser.parse_args()
+
+    src = _resolve_path(args.src)
+    print(f"--- CONVIRTIENDO {src} -> {args.dst} ({args.encoding}) ---")
+    t0 = time.perf_counter()
+    out = convert_trajectory(src, args.dst, args.encoding, args.precision, args.box)
+    print(f"✅ {out.n_frames} cuadros convertidos en {time.perf_counter() - t0:.2f} segundos.")
+
+    # Tamaño, error y tiempo de lectura completa de cada una
+    before = _directory_bytes(src) if os.path.isdir(src) else os.path.getsize(src)
+    after = _directory_bytes(args.dst)
+    original = open_trajectory(src)
+    error = max((float(np.abs(np.asarray(out[i], dtype=np.float64) - original[i]).max()) for i in range(out.n_frames)),
+                default=0.0)
+    print(f"📊 {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB ({before / max(after, 1):.1f}x) | "
+          f"error máximo {error:.3g} (quantum {out.header.get('encoding', {}).get('quantum')})")
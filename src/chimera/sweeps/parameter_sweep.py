@@ -0,0 +1,285 @@
+"""
+Proyecto Orión - Barridos de Parámetros con Caché
+Expande una grilla (N, caja, semilla, DT, SOFTENING, radio de fusión, pasos,
+motor) y corre las tres etapas de cada punto:
+
+    condiciones iniciales (n, box, seed)
+        -> motor (+ engine, dt, softening, steps, arch)
+            -> análisis de fusiones (+ radius, periodic)
+
+Cada etapa se guarda en data/cache/ con una clave que es el hash de sus
+parámetros, de las claves de las etapas anteriores y del código fuente que la
+produce, con todo lo de chimera.* que importa (result_cache.py). Puntos de la
+grilla que comparten una etapa la corren una sola vez, y lo que ya está en la
+caché no se recalcula: si solo cambia MERGER_RADIUS_PC, solo se rehace el
+análisis.
+
+Las etapas se corren por capas (todas las condiciones iniciales, luego todos
+los motores, luego todos los análisis) en un pool de procesos local. Cada
+tarea corre en un proceso nuevo: los motores se configuran cambiando las
+constantes de su módulo (como en engine_benchmark.py) y Taichi se inicializa
+en su primera corrida, así que nada se arrastra de una tarea a otra. Para una
+sola corrida sin caché ni archivos intermedios está chimera/pipeline.py.
+
+Uso:
+    python3 src/chimera/sweeps/parameter_sweep.py --n 100 500 --seed 1 2 3 --radius 10000 15000
+Autor: Chris (Rubin1)
+"""
+
+import numpy as np
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from chimera.storage.result_cache import ResultCache, code_version, stage_key, CACHE_DIR
+
+# --- CONFIGURACIÓN (valores por defecto de la grilla = los de cada módulo) ---
+OUTPUT_FILE = "data/processed/sweeps/sweep.json"
+N_GRID = [100]
+BOX_GRID = [5.0]         # Mpc
+SEED_GRID = [42]
+DT_GRID = [0.5]          # Millones de años
+SOFTENING_GRID = [10.0]  # Parsecs
+RADIUS_GRID = [15000.0]  # Parsecs (MERGER_RADIUS_PC)
+STEPS_GRID = [2000]
+ENGINE_GRID = ["taichi"]
+N_WORKERS = os.cpu_count() or 1
+FORMAT_NAME = "orion-sweep"
+FORMAT_VERSION = 1
+
+# Motor -> módulo. Rebound queda fuera: su tiempo se mide en años y su paso lo elige IAS15
+ENGINES = {
+    "taichi": "chimera.engines.gpu_taichi",
+    "barnes_hut": "chimera.engines.cpu_barnes_hut",
+    "particle_mesh": "chimera.engines.cpu_particle_mesh",
+}
+
+# Módulos que importa cada tarea. El hash del código (que entra en la clave) cubre
+# estos y todo lo de chimera.* que importan (code_version sigue los imports)
+IC_CODE = ["chimera.initial_conditions"]
+ENGINE_CODE = ["chimera.storage.simulation_input"]
+ANALYSIS_CODE = ["chimera.analysis.merger_counter", "chimera.storage.trajectory_store",
+                 "chimera.storage.simulation_input"]
+
+INPUT_DIR = "simulation_input"    # Dentro de la entrada de condiciones iniciales
+TRAJ_FILE = "trajectory.traj"     # Dentro de la entrada del motor
+CATALOG_FILE = "mergers.npz"      # Dentro de la entrada del análisis
+
+# ---------------------------------------------------------------------------
+# Tareas (corren en los procesos del pool)
+# ---------------------------------------------------------------------------
+
+def _ic_task(cache_root, key, params, code):
+    from chimera.initial_conditions import stream_chimera_scenario
+    cache = ResultCache(cache_root)
+    with cache.build("ic", key, params, code=code) as entry:
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            stream_chimera_scenario(params["n"], params["box"], params["seed"],
+                                    out_dir=os.path.join(entry["dir"], INPUT_DIR))
+        entry["result"] = {"n_bodies": params["n"]}
+    return key
+
+def _engine_task(cache_root, key, params, ic_key, code):
+    if params["arch"] == "cpu":
+        os.environ.setdefault("TI_ARCH", "x64")     # Taichi en CPU
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    cache = ResultCache(cache_root)
+    engine, steps = params["engine"], params["steps"]
+
+    with cache.build("engine", key, params, depends=[ic_key], code=code) as entry:
+        with open(os.path.join(entry["dir"], "engine.log"), "w") as log, contextlib.redirect_stdout(log):
+            module = importlib.import_module(ENGINES[engine])
+            module.INPUT_FILE = os.path.join(cache.path("ic", ic_key), INPUT_DIR)
+            module.OUTPUT_FILE = os.path.join(entry["dir"], TRAJ_FILE)
+            module.DT = params["dt"]
+            module.SOFTENING = params["softening"]
+            if hasattr(module, "DT_MAX"):
+                module.DT_MAX = 4 * params["dt"]
+            if hasattr(module, "CHECKPOINT_DIR"):
+                module.CHECKPOINT_DIR = os.path.join(entry["dir"], "checkpoints")
+
+            t0 = time.perf_counter()
+            if engine == "taichi":
+                module.STEPS = steps
+                module.run_taichi_simulation(checkpoint_every=0)
+            elif engine == "barnes_hut":
+                module.run_barnes_hut_simulation(steps=steps, check_sample=0)
+            elif engine == "particle_mesh":
+                module.run_pm_simulation(steps=steps)
+            seconds = time.perf_counter() - t0
+
+        if not os.path.exists(os.path.join(entry["dir"], TRAJ_FILE)):
+            raise RuntimeError(f"{engine} no escribió la trayectoria (ver engine.log)")
+        entry["result"] = {"seconds": seconds, "steps_per_s": steps / seconds}
+    return key
+
+def _analysis_task(cache_root, key, params, ic_key, engine_key, code):
+    from chimera.storage.trajectory_store import open_trajectory
+    from chimera.storage.simulation_input import open_simulation_input
+    from chimera.analysis.merger_counter import merger_summary
+    cache = ResultCache(cache_root)
+
+    with cache.build("analysis", key, params, depends=[engine_key], code=code) as entry:
+        traj = open_trajectory(os.path.join(cache.path("engine", engine_key), TRAJ_FILE))
+        meta = open_simulation_input(os.path.join(cache.path("ic", ic_key), INPUT_DIR))
+        box_size = meta.header.get("box_size_pc") if params["periodic"] else None
+        catalog, mergers, monster = merger_summary(np.asarray(traj[-1]), meta["masses"], box_size, params["radius"])
+        np.savez_compressed(os.path.join(entry["dir"], CATALOG_FILE), catalog=catalog)
+        entry["result"] = {
+            "n_objects": int(len(catalog)),
+            "n_mergers": int(len(mergers)),
+            "monster_members": int(monster["n_members"]) if monster is not None else 0,
+            "monster_mass": float(monster["mass"]) if monster is not None else 0.0,
+        }
+    return key
+
+# ---------------------------------------------------------------------------
+# Proceso padre: grilla, claves y capas
+# ---------------------------------------------------------------------------
+
+def expand_grid(n=N_GRID, box=BOX_GRID, seed=SEED_GRID, dt=DT_GRID, softening=SOFTENING_GRID,
+                radius=RADIUS_GRID, steps=STEPS_GRID, engine=ENGINE_GRID):
+    """Producto cartesiano de los valores: una lista de dicts, uno por punto."""
+    names = ["n", "box", "seed", "dt", "softening", "radius", "steps", "engine"]
+    values = [n, box, seed, dt, softening, radius, steps, engine]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+def plan_stages(points, gpu=False, periodic=False):
+    """
+    Claves de las tres etapas de cada punto. Devuelve (filas, etapas), donde
+    etapas[nombre] = {clave: argumentos de la tarea} sin repetidos.
+    """
+    ic_code = code_version(*IC_CODE)
+    analysis_code = code_version(*ANALYSIS_CODE)
+    engine_code = {name: code_version(module, *ENGINE_CODE) for name, module in ENGINES.items()}
+    arch = "gpu" if gpu else "cpu"
+
+    rows = []
+    stages = {"ic": {}, "engine": {}, "analysis": {}}
+    for p in points:
+        ic_params = {"n": p["n"], "box": p["box"], "seed": p["seed"]}
+        ic_key = stage_key("ic", ic_params, code=ic_code)
+
+        engine_params = {"engine": p["engine"], "dt": p["dt"], "softening": p["softening"],
+                         "steps": p["steps"], "arch": arch}
+        engine_key = stage_key("engine", engine_params, [ic_key], engine_code[p["engine"]])
+
+        analysis_params = {"radius": p["radius"], "periodic": periodic}
+        analysis_key = stage_key("analysis", analysis_params, [engine_key], analysis_code)
+
+        stages["ic"][ic_key] = (ic_key, ic_params, ic_code)
+        stages["engine"][engine_key] = (engine_key, engine_params, ic_key, engine_code[p["engine"]])
+        stages["analysis"][analysis_key] = (analysis_key, analysis_params, ic_key, engine_key, analysis_code)
+        rows.append({"params": p, "keys": {"ic": ic_key, "engine": engine_key, "analysis": analysis_key}})
+    return rows, stages
+
+def _run_layer(pool, cache, name, task, jobs, failed):
+    """Corre las entradas que faltan de una etapa. Devuelve (nuevas, en caché, errores)."""
+    todo, cached = [], 0
+    for key, args in jobs.items():
+        if cache.has(name, key):
+            cached += 1
+        elif any(dep in failed for dep in args[1:] if isinstance(dep, str)):
+            failed[key] = "depende de una etapa que falló"
+        else:
+            todo.append(args)
+
+    futures = {pool.submit(task, cache.root, *args): args[0] for args in todo}
+    errors = 0
+    for future in concurrent.futures.as_completed(futures):
+        key = futures[future]
+        try:
+            future.result()
+        except Exception as exc:
+            failed[key] = f"{type(exc).__name__}: {exc}"
+            errors += 1
+            print(f"   ⚠️ {name} {key[:12]}: {failed[key]}")
+    print(f"   {name:>9}: {len(todo) - errors} nuevas | {cached} en caché | {errors} con error")
+    return len(todo) - errors, cached, errors
+
+def run_sweep(points, cache_root=CACHE_DIR, n_workers=N_WORKERS, gpu=False, periodic=False):
+    print(f"--- 🧪 BARRIDO DE PARÁMETROS: {len(points)} puntos | caché {cache_root} | {n_workers} procesos ---")
+    cache = ResultCache(cache_root)
+    rows, stages = plan_stages(points, gpu, periodic)
+    failed = {}
+    summary = {}
+
+    start = time.time()
+    # Un proceso nuevo por tarea: constantes de módulo y ti.init limpios en cada motor
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context, max_tasks_per_child=1) as pool:
+        for name, task in (("ic", _ic_task), ("engine", _engine_task), ("analysis", _analysis_task)):
+            new, cached, errors = _run_layer(pool, cache, name, task, stages[name], failed)
+            summary[name] = {"new": new, "cached": cached, "errors": errors}
+
+    for row in rows:
+        bad = [k for k in row["keys"].values() if k in failed]
+        if bad:
+            row["status"] = "error"
+            row["error"] = failed[bad[0]]
+            continue
+        row["status"] = "ok"
+        row["engine"] = cache.load("engine", row["keys"]["engine"])["result"]
+        row["result"] = cache.load("analysis", row["keys"]["analysis"])["result"]
+        row["trajectory"] = os.path.join(cache.path("engine", row["keys"]["engine"]), TRAJ_FILE)
+
+    print(f"✅ Barrido terminado en {time.time() - start:.2f} segundos.")
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"cache": cache_root, "gpu": gpu, "periodic": periodic},
+        "stages": summary,
+        "results": rows,
+    }
+
+def print_table(report):
+    print(f"\n{'engine':>13} {'n':>7} {'box':>5} {'seed':>6} {'dt':>6} {'soft':>6} {'radius':>8} {'steps':>6} "
+          f"| {'objetos':>7} {'fusiones':>8} {'monstruo':>8} {'masa':>10}")
+    for row in report["results"]:
+        p = row["params"]
+        head = (f"{p['engine']:>13} {p['n']:>7} {p['box']:>5g} {p['seed']:>6} {p['dt']:>6g} {p['softening']:>6g} "
+                f"{p['radius']:>8g} {p['steps']:>6}")
+        if row["status"] != "ok":
+            print(f"{head} | ⚠️ {row['error']}")
+            continue
+        r = row["result"]
+        print(f"{head} | {r['n_objects']:>7} {r['n_mergers']:>8} {r['monster_members']:>8} {r['monster_mass']:>10.3e}")
+
+def save_report(report, path=OUTPUT_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barridos de parámetros con caché - Proyecto Chimera")
+    parser.add_argument("--n", type=int, nargs="+", default=N_GRID, help="Números de galaxias")
+    parser.add_argument("--box", type=float, nargs="+", default=BOX_GRID, help="Tamaños de caja (Mpc)")
+    parser.add_argument("--seed", type=int, nargs="+", default=SEED_GRID, help="Semillas")
+    parser.add_argument("--dt", type=float, nargs="+", default=DT_GRID, help="Pasos de tiempo (Myr)")
+    parser.add_argument("--softening", type=float, nargs="+", default=SOFTENING_GRID, help="Suavizados (pc)")
+    parser.add_argument("--radius", type=float, nargs="+", default=RADIUS_GRID, help="Radios de fusión (pc)")
+    parser.add_argument("--steps", type=int, nargs="+", default=STEPS_GRID, help="Números de pasos")
+    parser.add_argument("--engine", nargs="+", choices=list(ENGINES), default=ENGINE_GRID, help="Motores")
+    parser.add_argument("--workers", type=int, default=N_WORKERS, help="Procesos del pool")
+    parser.add_argument("--gpu", action="store_true", help="Dejar que Taichi use la GPU (por defecto solo CPU)")
+    parser.add_argument("--periodic", action="store_true", help="FoF con caja periódica")
+    parser.add_argument("--cache", type=str, default=CACHE_DIR, help="Directorio de la caché")
+    parser.add_argument("--out", type=str, default=OUTPUT_FILE, help="Archivo JSON con la tabla de resultados")
+    args = parser.parse_args()
+
+    points = expand_grid(args.n, args.box, args.seed, args.dt, args.softening, args.radius, args.steps, args.engine)
+    report = run_sweep(points, args.cache, args.workers, args.gpu, args.periodic)
+    print_table(report)
+    save_report(report, args.out)
+    print(f"--> Resultados guardados en {args.out}")
@@ -1,50 +1,76 @@
 """
 Proyecto Orión - Animador Universal (Fixed v2)
 Soporta visualización de CPU (Rebound) y GPU (Taichi).
+Lee los cuadros bajo demanda (memmap + caché LRU); las trayectorias
+comprimidas (--traj-encoding quantized) se decodifican por bloque al pedir
+cada cuadro, sin pasar por un archivo crudo. Con muchos cuerpos dibuja
+un submuestreo pesado por masa o la densidad en celdas (--lod), y permite
+saltear cuadros (--stride), interpolar entre ellos (--interp) y moverse con
+el deslizador o el teclado (espacio = pausa, flechas = cuadro a cuadro).
+Con --export video.mp4 renderiza lo mismo a un video, en paralelo y sin ventana.
 Autor: Chris (Rubin1)
 """
 
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from matplotlib.widgets import Slider
 from mpl_toolkits.mplot3d import Axes3D
 import os
+import sys
 import argparse
 
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chimera.storage.trajectory_store import open_trajectory
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.render.frames import (FrameSource, build_timeline, resolve_lod, point_style, density_points,
+                                   LOD_THRESHOLD, LOD_POINTS, LOD_BINS, CACHE_FRAMES, LIMIT_MPC)
+from chimera.render.video_renderer import render_video, trajectory_scene, trajectory_frames, N_WORKERS
+
 # Rutas por defecto
-FILE_CPU = "data/processed/trajectory_rebound.npy"
-FILE_GPU = "data/processed/trajectory_taichi.npy"
-META_FILE = "data/processed/simulation_input.npy"
+FILE_CPU = "data/processed/trajectory_rebound.traj"
+FILE_GPU = "data/processed/trajectory_taichi.traj"
+META_FILE = "data/processed/simulation_input"
 
-def animate_chimera(mode='gpu'):
+def animate_chimera(mode='gpu', lod='auto', stride=1, interp=0, max_points=LOD_POINTS, bins=LOD_BINS,
+                    cache_frames=CACHE_FRAMES, traj_file=None):
     # Seleccionar archivo
     if mode == 'cpu':
-        traj_file = FILE_CPU
+        traj_file = traj_file or FILE_CPU
         title_suffix = "(CPU - Rebound)"
         point_color = 'cyan'
         alpha_val = 0.8
     else:
-        traj_file = FILE_GPU
+        traj_file = traj_file or FILE_GPU
         title_suffix = "(GPU - Taichi)"
         point_color = 'orange'
         alpha_val = 0.3 
 
-    if not os.path.exists(traj_file):
+    # Cargar datos (memory-mapped: cada cuadro se lee de disco cuando se dibuja)
+    print(f"--> Cargando datos de {mode.upper()} ({traj_file})...")
+    try:
+        traj = open_trajectory(traj_file) # (Snapshots, N, 3)
+    except FileNotFoundError:
         print(f"❌ No encuentro {traj_file}. Corre el motor {mode} primero.")
         return
-
-    # Cargar datos
-    print(f"--> Cargando datos de {mode.upper()}...")
-    traj = np.load(traj_file) # (Snapshots, N, 3)
-    meta = np.load(META_FILE, allow_pickle=True).item()
+    if "encoding" in traj.header:
+        print(f"--> Trayectoria comprimida ({traj.header['encoding']['name']}, "
+              f"{traj.header['encoding']['chunk_frames']} cuadros por bloque)")
+    meta = open_simulation_input(META_FILE)
     masses = meta['masses']
-    
-    # Ajuste de seguridad
-    if len(masses) != traj.shape[1]:
-        print(f"⚠️ Aviso: El input tiene {len(masses)} masas pero la trayectoria tiene {traj.shape[1]} cuerpos.")
-        sizes = np.ones(traj.shape[1]) * 2
-    else:
-        sizes = np.log10(masses) * 0.5 
+    n_bodies = traj.n_bodies
+
+    # Nivel de detalle: todos los puntos, submuestreo pesado por masa o densidad en celdas
+    lod = resolve_lod(lod, n_bodies)
+    rows, masses, sizes = point_style(masses, n_bodies, lod, max_points)
+    if lod == 'subsample':
+        print(f"--> Nivel de detalle: {len(rows)} de {n_bodies} cuerpos (muestreo pesado por masa)")
+    elif lod == 'density':
+        print(f"--> Nivel de detalle: densidad en {bins}^3 celdas")
+    source = FrameSource(traj, rows, cache_frames)
+
+    # Línea de tiempo: cada 'stride' snapshots, con 'interp' cuadros intermedios entre cada par
+    timeline = build_timeline(len(traj), stride, interp)
 
     # Configurar Figura
     fig = plt.figure(figsize=(10, 8), dpi=100)
@@ -58,40 +84,113 @@ def animate_chimera(mode='gpu'):
     ax.zaxis.set_pane_color((0.1, 0.1, 0.1, 1.0))
     ax.grid(False) 
     
-    limit = 20.0
+    limit = LIMIT_MPC
     ax.set_xlim(0, limit)
     ax.set_ylim(0, limit)
     ax.set_zlim(0, limit)
-    ax.set_title(f"Chimera: {traj.shape[1]} Galaxias {title_suffix}", color='white')
+    ax.set_title(f"Chimera: {n_bodies} Galaxias {title_suffix}", color='white')
+
+    def points(entry):
+        """(posiciones, tamaños, colores) a dibujar para un cuadro (i0, i1, w) de la línea de tiempo."""
+        pos = source.between(*entry)
+        if lod != 'density':
+            return pos, sizes, None
+        return density_points(pos, masses, bins, limit)
 
     # --- INICIALIZACIÓN CORREGIDA ---
     # Usamos el frame 0 en lugar de listas vacías
-    pos0 = traj[0]
-    x0 = pos0[:,0] / 1e6
-    y0 = pos0[:,1] / 1e6
-    z0 = pos0[:,2] / 1e6
-    
-    graph = ax.scatter(x0, y0, z0, s=sizes, c=point_color, alpha=alpha_val, edgecolors='none')
+    pos0, s0, c0 = points(timeline[0])
+    if c0 is None:
+        graph = ax.scatter(pos0[:,0], pos0[:,1], pos0[:,2], s=s0, c=point_color, alpha=alpha_val, edgecolors='none')
+    else:
+        graph = ax.scatter(pos0[:,0], pos0[:,1], pos0[:,2], s=s0, c=c0, cmap='inferno', alpha=0.6, edgecolors='none')
     txt_time = ax.text2D(0.05, 0.95, "", transform=ax.transAxes, color='white')
 
-    def update(frame):
-        pos = traj[frame]
-        x = pos[:,0] / 1e6
-        y = pos[:,1] / 1e6
-        z = pos[:,2] / 1e6
-        
-        graph._offsets3d = (x, y, z)
-        txt_time.set_text(f"Frame: {frame}")
+    # Deslizador para moverse por la línea de tiempo
+    slider_ax = fig.add_axes([0.15, 0.03, 0.7, 0.02], facecolor='0.2')
+    slider = Slider(slider_ax, 'Cuadro', 0, len(timeline) - 1, valinit=0, valstep=1, color='orange')
+    slider.label.set_color('white')
+    slider.valtext.set_color('white')
+    state = {"frame": 0, "paused": False}
+
+    def draw(frame):
+        i0, i1, w = timeline[frame]
+        pos, s, c = points(timeline[frame])
+        graph._offsets3d = (pos[:,0], pos[:,1], pos[:,2])
+        graph.set_sizes(s)
+        if c is not None:
+            graph.set_array(c)
+        txt_time.set_text(f"Frame: {i0 + w * (i1 - i0):.2f}" if interp else f"Frame: {i0}")
+
+    def update(_):
+        if not state["paused"]:
+            state["frame"] = (state["frame"] + 1) % len(timeline)
+            slider.eventson = False
+            slider.set_val(state["frame"])
+            slider.eventson = True
+        draw(state["frame"])
         return graph,
 
-    print(f"🎬 Renderizando {len(traj)} cuadros con {traj.shape[1]} partículas...")
-    ani = animation.FuncAnimation(fig, update, frames=len(traj), interval=20, blit=False)
+    def on_slider(value):
+        state["frame"] = int(value)
+        draw(state["frame"])
+        fig.canvas.draw_idle()
+
+    def on_key(event):
+        if event.key == ' ':
+            state["paused"] = not state["paused"]
+        elif event.key in ('right', 'left'):
+            state["paused"] = True
+            state["frame"] = (state["frame"] + (1 if event.key == 'right' else -1)) % len(timeline)
+            slider.set_val(state["frame"])
+
+    slider.on_changed(on_slider)
+    fig.canvas.mpl_connect('key_press_event', on_key)
+
+    print(f"🎬 Renderizando {len(timeline)} cuadros (de {len(traj)} snapshots) con {len(pos0)} puntos...")
+    ani = animation.FuncAnimation(fig, update, frames=len(timeline), interval=20, blit=False, cache_frame_data=False)
     
     plt.show()
 
+def export_chimera(output, mode='gpu', lod='auto', stride=1, interp=0, max_points=LOD_POINTS, bins=LOD_BINS,
+                   n_workers=N_WORKERS, rotate=0.0, traj_file=None):
+    """Misma vista que animate_chimera, pero renderizada a un video (sin ventana)."""
+    traj_file = traj_file or (FILE_CPU if mode == 'cpu' else FILE_GPU)
+    if mode == 'cpu':
+        style = {"title_suffix": "(CPU - Rebound)", "color": 'cyan', "alpha": 0.8}
+    else:
+        style = {"title_suffix": "(GPU - Taichi)", "color": 'orange', "alpha": 0.3}
+    try:
+        n_bodies = open_trajectory(traj_file).n_bodies
+    except FileNotFoundError:
+        print(f"❌ No encuentro {traj_file}. Corre el motor {mode} primero.")
+        return
+    scene_args = {"traj_path": traj_file, "meta_path": META_FILE, "lod": lod, "stride": stride, "interp": interp,
+                  "max_points": max_points, "bins": bins, "title": f"Chimera: {n_bodies} Galaxias {style['title_suffix']}",
+                  "color": style["color"], "alpha": style["alpha"], "rotate": rotate}
+    render_video(trajectory_scene, scene_args, trajectory_frames(traj_file, stride, interp), output, n_workers=n_workers)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--mode', type=str, default='gpu', choices=['cpu', 'gpu'], help="Elige motor a visualizar")
+    parser.add_argument('--lod', type=str, default='auto', choices=['auto', 'none', 'subsample', 'density'],
+                        help=f"Nivel de detalle (auto: submuestreo si N > {LOD_THRESHOLD})")
+    parser.add_argument('--points', type=int, default=LOD_POINTS, help="Puntos del submuestreo")
+    parser.add_argument('--bins', type=int, default=LOD_BINS, help="Celdas por lado en el modo densidad")
+    parser.add_argument('--stride', type=int, default=1, help="Usar un snapshot de cada tantos")
+    parser.add_argument('--interp', type=int, default=0, help="Cuadros interpolados entre snapshots")
+    parser.add_argument('--cache', type=int, default=CACHE_FRAMES, help="Cuadros en la caché LRU")
+    parser.add_argument('--export', type=str, default=None, help="Renderizar a este video (mp4) en vez de abrir la ventana")
+    parser.add_argument('--workers', type=int, default=N_WORKERS, help="Procesos de render para --export")
+    parser.add_argument('--rotate', type=float, default=0.0, help="Grados de giro de la cámara por cuadro (--export)")
+    parser.add_argument('--traj', type=str, default=None,
+                        help="Trayectoria a mostrar, cruda o comprimida (por defecto, la del motor elegido)")
     args = parser.parse_args()
     
-    animate_chimera(mode=args.mode)
\ No newline at end of file
+    if args.export:
+        export_chimera(args.export, mode=args.mode, lod=args.lod, stride=args.stride, interp=args.interp,
+                       max_points=args.points, bins=args.bins, n_workers=args.workers, rotate=args.rotate,
+                       traj_file=args.traj)
+    else:
+        animate_chimera(mode=args.mode, lod=args.lod, stride=args.stride, interp=args.interp, max_points=args.points,
+                        bins=args.bins, cache_frames=args.cache, traj_file=args.traj)
\ No newline at end of file
@@ -1,25 +1,35 @@
 """
 Proyecto Orión - Visualizador de Diagnóstico
 Permite inspeccionar las condiciones iniciales generadas para Chimera.
+Por defecto muestra la densidad proyectada (XY, XZ, YZ) pesada por masa y
+coloreada por velocidad; con --scatter, la nube 3D de siempre (N chico).
 Autor: Chris (Rubin1)
 """
 
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
+import argparse
 import os
+import sys
 
-# Ruta al archivo generado
-DATA_PATH = "data/processed/simulation_input.npy"
+# Permitir importar el paquete 'chimera' al correr este archivo como script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chimera.storage.simulation_input import open_simulation_input
+from chimera.render.density_image import render_density, axes_shape, save_image
+
+# Ruta al directorio generado
+DATA_PATH = "data/processed/simulation_input"
 
 def load_data():
-    if not os.path.exists(DATA_PATH):
-        print(f"❌ Error: No encuentro el archivo {DATA_PATH}")
+    try:
+        # Columnas memory-mapped: se comporta como el dict de siempre
+        data = open_simulation_input(DATA_PATH)
+    except FileNotFoundError:
+        print(f"❌ Error: No encuentro {DATA_PATH}")
         print("   Ejecuta primero: python3 src/chimera/initial_conditions.py")
         exit()
     
-    # Cargamos el diccionario (allow_pickle=True es necesario para dicts)
-    data = np.load(DATA_PATH, allow_pickle=True).item()
     return data
 
 def plot_chimera_3d(data):
@@ -60,6 +70,53 @@ def plot_chimera_3d(data):
     print("   Tip: Usa el mouse para rotar el cubo y buscar los 'clusters'.")
     plt.show()
 
+def plot_chimera_projected(data, tone="asinh", save=None):
+    pos_mpc = np.asarray(data['positions']) / 1e6
+    vel_mag = np.linalg.norm(data['velocities'], axis=1)
+    masses = np.asarray(data['masses'], dtype=np.float64)
+    z = data['redshift']
+
+    # Misma caja para los tres planos
+    lo, hi = pos_mpc.min(), pos_mpc.max()
+    extent = (lo, hi, lo, hi)
+    color_range = np.percentile(vel_mag, (1, 99))
+
+    fig, axes = plt.subplots(1, 3, figsize=(18, 6.5), facecolor='black')
+    fig.suptitle(f"Universo Temprano (z={z}) - {len(masses)} Galaxias\n"
+                 f"Densidad proyectada (masa) coloreada por velocidad", color='white')
+    for ax, (i, j), label in zip(axes, [(0, 1), (0, 2), (1, 2)], ["XY", "XZ", "YZ"]):
+        # Píxeles de imagen = píxeles de pantalla: el costo no depende de N
+        image = render_density(pos_mpc, extent, axes_shape(ax), axes=(i, j), weights=masses, color_by=vel_mag,
+                               color_range=color_range, tone=tone, cmap='plasma')
+        ax.imshow(image, extent=extent, interpolation='nearest')
+        ax.set_title(label, color='white')
+        ax.set_xlabel(f"{'XYZ'[i]} [Mpc]", color='white')
+        ax.set_ylabel(f"{'XYZ'[j]} [Mpc]", color='white')
+        ax.tick_params(colors='white')
+
+    sm = plt.cm.ScalarMappable(cmap='plasma', norm=plt.Normalize(*color_range))
+    cbar = fig.colorbar(sm, ax=axes, shrink=0.8)
+    cbar.set_label('Velocidad Total (km/s)', color='white')
+    cbar.ax.tick_params(colors='white')
+
+    if save:
+        # Imagen XY a 2048^2 escrita directo, sin figura
+        save_image(save, render_density(pos_mpc, extent, (2048, 2048), weights=masses, color_by=vel_mag,
+                                        color_range=color_range, tone=tone, cmap='plasma'))
+        print(f"📸 Imagen generada: {save}")
+
+    print("📊 Generando visualización de densidad proyectada...")
+    plt.show()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Visualizador de condiciones iniciales - Proyecto Chimera")
+    parser.add_argument("--scatter", action="store_true", help="Nube de puntos 3D interactiva (lenta con N grande)")
+    parser.add_argument("--tone", type=str, default="asinh", choices=["asinh", "log", "linear"], help="Mapeo de tonos")
+    parser.add_argument("--save", type=str, default=None, help="Escribir también la proyección XY a este PNG")
+    args = parser.parse_args()
+
     sim_data = load_data()
-    plot_chimera_3d(sim_data)
\ No newline at end of file
+    if args.scatter:
+        plot_chimera_3d(sim_data)
+    else:
+        plot_chimera_projected(sim_data, tone=args.tone, save=args.save)
\ No newline at end of file